@@ -1,32 +1,294 @@
-import display_module
+import os
 import time
-from random import random
+import random
 import threading
+from collections import deque
 import numpy
+from assignment import solve_assignment, brute_force_size
+from journal import SessionJournal, load_journal
+from instrumentation import instruments
+from fairness import FairnessMetrics
+from round_cache import round_cache, fingerprint
 
-num_sim_matches = 3
 num_total_matches = 16
+# number of rounds the schedule planner works out ahead of the current round
+lookahead_rounds = num_total_matches
+# how make_match pairs up the teams: 'matching' builds the round in one pass by solving for the best pairing,
+# 'greedy' is the original method, which pairs the teams one at a time and reshuffles when it gets stuck
+match_building = 'matching'
+# number of rounds which the scheduler telemetry keeps the details of (the totals cover every round)
+telemetry_rounds = 1000
+# how the planned matches are fixed when a team is added or removed part way through a session: 'incremental' only changes
+# the matches involving that team (see repair_sides), 'replan' makes them all again from scratch
+schedule_repair = 'incremental'
+# where the session journal is kept, so that a session can be picked up again after the program closes
+journal_directory = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'session')
+# file the timings of the session are written to when it finishes
+instrumentation_path = os.path.join(journal_directory, 'instrumentation.json')
+# files the fairness statistics of the session are exported to when it finishes
+fairness_json_path = os.path.join(journal_directory, 'fairness.json')
+fairness_csv_path = os.path.join(journal_directory, 'fairness.csv')
+# number of rounds between each snapshot of the session in the journal
+snapshot_rounds = 10
+# number of seconds between each time the clock is written to the journal while it's running
+clock_journal_interval = 5
+# port the scoreboard server for phones and other screens listens on (None to not run it), and the address it listens on.
+# By default only this computer can connect; set it to '' to listen on every network interface, so that phones and other
+# screens on the same network can reach it
+scoreboard_port = 8765
+scoreboard_host = '127.0.0.1'
+# name of the shared memory block the session's state is published into for scoreboard_display.py (None to not publish it)
+state_channel_name = 'alts_state'
+# how even_sides gives out the pads: 'optimal' solves for the best allocation, 'greedy' is the original one-match-at-a-time method
+side_allocation = 'optimal'
+# the stats a team's priority for getting a match is worked out from (see TeamStore.priority), with the direction each one counts in:
+# 1 means having more of it lowers the team's priority, and -1 means having more of it raises the team's priority
+priority_terms = {'consecutive_off': -1, 'consecutive_games': 1, 'matches_played': 1, 'max_off': -1}
+# the original ordering (most consecutive games off, then fewest consecutive games, then fewest games played), with each
+# weight big enough that the terms below it only ever break ties
+default_priority_weights = {'consecutive_off': 2**40, 'consecutive_games': 2**20, 'matches_played': 1}
+# the weight given to each priority term by new sessions (tune_priority.py searches for good weights)
+priority_weights = default_priority_weights
+# whether make_match and even_sides keep their solutions in the round cache, so that a state seen before isn't solved again.
+# It's off by default, as make_match's states include the order the random tiebreak put the tied teams in, so they seldom repeat
+memoize_rounds = False
+
+'''
+Holds the stats of every team in a session in numpy arrays, indexed by each team's slot in the store.
+Keeping the stats side by side means that a whole round can be applied to all of the teams at once,
+rather than going through the teams one at a time.
+sides holds the number of times each team has played on each rink section, with a row for each slot
+pair_counts holds the number of times each pair of teams has played each other
+played_epoch holds which teams have played each other since the last time the teams were allowed to play everyone again.
+Team a has played team b if played_epoch[a, b] is equal to epoch, so moving on to the next epoch resets every pair at once.
+'''
+class TeamStore():
+    fields = ['team_numbers', 'matches_played', 'consecutive_games', 'consecutive_off', 'max_consec', 'max_off',
+              'prev_consec', 'prev_off', 'prev_max_consec', 'prev_max_off', 'last_team_played', 'prev_last_team_played']
+
+    def __init__(self, num_sides, capacity=16, rng=random, priority_weights=None):
+        self.size = 0
+        # the random number generator used for the tiebreaks (the random module itself unless the session has its own)
+        self.rng = rng
+        # the weight of each term in the teams' priority for getting a match (the module's priority_weights if None)
+        if priority_weights is None:
+            priority_weights = globals()['priority_weights']
+        for term in priority_weights:
+            if term not in priority_terms:
+                raise ValueError('Unknown priority term: ' + str(term))
+        self.priority_weights = dict(priority_weights)
+        self.capacity = max(capacity, 1)
+        self.num_sides = num_sides
+        for field in self.fields:
+            setattr(self, field, numpy.zeros(self.capacity, dtype=numpy.int64))
+        self.sides = numpy.zeros((self.capacity, num_sides), dtype=numpy.int64)
+        self.pair_counts = numpy.zeros((self.capacity, self.capacity), dtype=numpy.int64)
+        self.epoch = 1
+        self.played_epoch = numpy.zeros((self.capacity, self.capacity), dtype=numpy.int32)
+        self.prev_played_epoch = numpy.zeros((self.capacity, self.capacity), dtype=numpy.int32)
+        self.slot_of = {}
+        # the FairnessMetrics kept up to date with the stats, if there is one
+        self.metrics = None
+        # the SchedulerTelemetry the rounds made from these stats are recorded in (the shared telemetry if None)
+        self.telemetry = None
+
+    # gives a new team a slot in the store, making the arrays bigger if they are full
+    def add_slot(self, number):
+        if self.size == self.capacity:
+            self.grow(2 * self.capacity)
+        slot = self.size
+        self.size += 1
+        self.team_numbers[slot] = number
+        self.slot_of[number] = slot
+        if self.metrics is not None:
+            self.metrics.new_slot(self, slot)
+        return slot
+
+    # copies the arrays into bigger ones, so that more teams can be added
+    def grow(self, capacity):
+        for field in self.fields:
+            new_array = numpy.zeros(capacity, dtype=numpy.int64)
+            new_array[:self.capacity] = getattr(self, field)
+            setattr(self, field, new_array)
+        new_sides = numpy.zeros((capacity, self.num_sides), dtype=numpy.int64)
+        new_sides[:self.capacity] = self.sides
+        self.sides = new_sides
+        for matrix in ['pair_counts', 'played_epoch', 'prev_played_epoch']:
+            old_matrix = getattr(self, matrix)
+            new_matrix = numpy.zeros((capacity, capacity), dtype=old_matrix.dtype)
+            new_matrix[:self.capacity, :self.capacity] = old_matrix
+            setattr(self, matrix, new_matrix)
+        self.capacity = capacity
+
+    # when the number of sides is changed, the sides each team has played on become irrelevant, so they start again from scratch
+    def reset_sides(self, num_sides):
+        self.num_sides = num_sides
+        self.sides = numpy.zeros((self.capacity, num_sides), dtype=numpy.int64)
+        if self.metrics is not None:
+            self.metrics.rebuild_sides(self)
+
+    # splits a round up into the slots of the teams playing, the slots of their opponents, the locations of their
+    # matches and the slots of the teams off the ice. Only the teams in the given slots are included.
+    def split_round(self, slots, first_slots, second_slots, locs):
+        in_round = numpy.zeros(self.capacity, dtype=bool)
+        in_round[slots] = True
+        playing = numpy.concatenate((first_slots, second_slots))
+        opponents = numpy.concatenate((second_slots, first_slots))
+        play_locs = numpy.concatenate((locs, locs))
+        included = in_round[playing]
+        playing, opponents, play_locs = playing[included], opponents[included], play_locs[included]
+        in_round[playing] = False
+        return playing, opponents, play_locs, slots[in_round[slots]]
+
+    # adds a round to the stats of all the teams in the given slots. The teams in first_slots[i] and second_slots[i]
+    # play each other at location locs[i] and every other team has a period off the ice.
+    def apply_round(self, slots, first_slots, second_slots, locs):
+        playing, opponents, play_locs, off = self.split_round(slots, first_slots, second_slots, locs)
+        if self.metrics is not None:
+            self.metrics.remove(self, slots, playing, opponents)
+        self.prev_consec[slots] = self.consecutive_games[slots]
+        self.prev_off[slots] = self.consecutive_off[slots]
+        self.prev_max_consec[slots] = self.max_consec[slots]
+        self.prev_max_off[slots] = self.max_off[slots]
+
+        # updates the teams playing
+        self.consecutive_games[playing] += 1
+        self.matches_played[playing] += 1
+        self.consecutive_off[playing] = 0
+        self.sides[playing, play_locs] += 1
+        self.prev_last_team_played[playing] = self.last_team_played[playing]
+        self.last_team_played[playing] = self.team_numbers[opponents]
+        self.max_consec[playing] = numpy.maximum(self.max_consec[playing], self.consecutive_games[playing])
+        self.pair_counts[playing, opponents] += 1
+        self.prev_played_epoch[playing, opponents] = self.played_epoch[playing, opponents]
+        self.played_epoch[playing, opponents] = self.epoch
+
+        # updates the teams off the ice
+        self.consecutive_off[off] += 1
+        self.consecutive_games[off] = 0
+        self.max_off[off] = numpy.maximum(self.max_off[off], self.consecutive_off[off])
+        if self.metrics is not None:
+            self.metrics.add(self, slots, playing, opponents)
+
+    # undoes the changes made by apply_round, given the same round
+    def undo_round(self, slots, first_slots, second_slots, locs):
+        playing, opponents, play_locs, off = self.split_round(slots, first_slots, second_slots, locs)
+        if self.metrics is not None:
+            self.metrics.remove(self, slots, playing, opponents)
+        self.consecutive_games[slots] = self.prev_consec[slots]
+        self.consecutive_off[slots] = self.prev_off[slots]
+        self.max_consec[playing] = self.prev_max_consec[playing]
+        self.max_off[off] = self.prev_max_off[off]
+
+        # when the number of sides are changed, the sides lists are reset to 0,
+        # this checks that that hasn't happened before removing one from that side
+        valid = play_locs < self.num_sides
+        played_at_loc = self.sides[playing[valid], play_locs[valid]]
+        self.sides[playing[valid], play_locs[valid]] = numpy.maximum(played_at_loc - 1, 0)
+
+        self.matches_played[playing] -= 1
+        self.last_team_played[playing] = self.prev_last_team_played[playing]
+        self.pair_counts[playing, opponents] -= 1
+        self.played_epoch[playing, opponents] = self.prev_played_epoch[playing, opponents]
+        if self.metrics is not None:
+            self.metrics.add(self, slots, playing, opponents)
+
+    # returns True if the teams in the two slots have played each other since the last reset
+    def has_played(self, slot1, slot2):
+        return self.played_epoch[slot1, slot2] == self.epoch
+
+    # counts the pairs of teams in the given slots (in both directions) which haven't played each other since the last reset
+    def count_not_played(self, slots):
+        return len(slots) * (len(slots) - 1) - int(numpy.count_nonzero(self.played_epoch[numpy.ix_(slots, slots)] == self.epoch))
+
+    # makes an independent copy of the store, so that rounds can be planned ahead without changing the real stats
+    def copy(self):
+        new_store = TeamStore.__new__(TeamStore)
+        for name, value in self.__dict__.items():
+            setattr(new_store, name, value.copy() if hasattr(value, 'copy') else value)
+        # the copy is only used for planning, so it doesn't keep the session's metrics up to date
+        new_store.metrics = None
+        return new_store
+
+    # lets every team play every other team again
+    def reset_played(self):
+        self.epoch += 1
+
+    # returns the priority of the teams in the given slots for getting a match as a single number each, where lower is a
+    # higher priority. It's the weighted sum of the priority terms, which with the default weights orders the teams by most
+    # consecutive games off, then fewest consecutive games, then fewest games played. Whole number weights keep it exact.
+    def priority(self, slots):
+        priority = numpy.zeros(len(slots), dtype=numpy.int64)
+        for term, weight in self.priority_weights.items():
+            if weight:
+                priority = priority + (priority_terms[term] * weight) * getattr(self, term)[slots]
+        return priority
+
+    # returns the order of the teams in the given slots by priority for getting a match, then the tiebreak
+    def priority_order(self, slots, tiebreak):
+        return numpy.lexsort((tiebreak, self.priority(slots)))
+
+
+'''
+Reads and writes one of the arrays in a TeamStore as though it were an attribute of a Team
+'''
+class StoreField():
+    def __init__(self, array_name):
+        self.array_name = array_name
+
+    def __get__(self, team, owner):
+        if team is None:
+            return self
+        return int(getattr(team.store, self.array_name)[team.slot])
+
+    def __set__(self, team, value):
+        getattr(team.store, self.array_name)[team.slot] = value
+
 
 '''
 Main class for the teams.
 These contain all the stats about each individual team.
+The stats themselves live in the session's TeamStore, and each Team is a view of its own slot in the store.
 '''
 class Team():
-    def __init__(self, number):
-        self.not_played = []
-        self.matches_played = 0
-        self.sides = [0 for i in range(num_sim_matches)]
-        self.team_number = number
-        self.consecutive_games = 0
-        self.consecutive_off = 0
-        self.max_consec = 0
-        self.max_off = 0
-        self.prev_consec = 0
-        self.prev_off = 0
-        self.prev_max_consec = 0
-        self.prev_max_off = 0
-        self.prev_last_team_played = 0
-        self.last_team_played = 0
+    team_number = StoreField('team_numbers')
+    matches_played = StoreField('matches_played')
+    consecutive_games = StoreField('consecutive_games')
+    consecutive_off = StoreField('consecutive_off')
+    max_consec = StoreField('max_consec')
+    max_off = StoreField('max_off')
+    prev_consec = StoreField('prev_consec')
+    prev_off = StoreField('prev_off')
+    prev_max_consec = StoreField('prev_max_consec')
+    prev_max_off = StoreField('prev_max_off')
+    last_team_played = StoreField('last_team_played')
+    prev_last_team_played = StoreField('prev_last_team_played')
+
+    # if a slot is given, the team is a view of a team which is already in the store (e.g. in a copy of the store)
+    def __init__(self, number, store, slot=None):
+        self.store = store
+        if slot is None:
+            slot = store.add_slot(number)
+        self.slot = slot
+
+    # number of times the team has played on each rink section. This is a view of the store, so it can be changed in place.
+    @property
+    def sides(self):
+        return self.store.sides[self.slot]
+
+    @sides.setter
+    def sides(self, value):
+        self.store.sides[self.slot] = value
+
+    # list of the team numbers which this team hasn't played since the last reset
+    @property
+    def not_played(self):
+        store = self.store
+        return [int(store.team_numbers[slot]) for slot in range(store.size) if slot != self.slot and not store.has_played(self.slot, slot)]
+
+    # returns True if this team has played the other team since the last reset
+    def has_played(self, other):
+        return self.store.has_played(self.slot, other.slot)
 
     # adds a game to the team's stats, given the opponent and location of the match
     def add_game(self, opponent, loc):
@@ -34,8 +296,9 @@ class Team():
         self.prev_off = self.consecutive_off
         self.prev_max_consec = self.max_consec
         self.prev_max_off = self.max_off
-        if opponent in self.not_played:
-            self.not_played.pop(self.not_played.index(opponent))
+        opponent_slot = self.store.slot_of[opponent]
+        self.store.prev_played_epoch[self.slot, opponent_slot] = self.store.played_epoch[self.slot, opponent_slot]
+        self.store.played_epoch[self.slot, opponent_slot] = self.store.epoch
         self.consecutive_games += 1
         self.matches_played += 1
         self.consecutive_off = 0
@@ -61,7 +324,8 @@ class Team():
         self.consecutive_games = self.prev_consec
         self.consecutive_off = self.prev_off
         self.max_consec = self.prev_max_consec
-        self.not_played.append(opponent)
+        opponent_slot = self.store.slot_of[opponent]
+        self.store.played_epoch[self.slot, opponent_slot] = self.store.prev_played_epoch[self.slot, opponent_slot]
 
         # when the number of sides are changed, the sides lists are reset to 0, 
         # this checks that that hasn't happened before removing one from that side
@@ -79,15 +343,16 @@ class Team():
 
     # function to print out the team details
     def __str__(self):
-        if num_sim_matches == 1:
+        num_sides = self.store.num_sides
+        if num_sides == 1:
             side_descriptor = ''
-        elif num_sim_matches == 2:
+        elif num_sides == 2:
             side_descriptor = 'Stairs: ' + str(self.sides[0]) + ' Clock: ' + str(self.sides[1])
-        elif num_sim_matches == 3:
+        elif num_sides == 3:
             side_descriptor = 'Stairs: ' + str(self.sides[0]) + ' Middle: ' + str(self.sides[1]) + ' Clock: ' + str(self.sides[2])
         else:
             side_descriptor = ''
-            for i in range(num_sim_matches):
+            for i in range(num_sides):
                 side_descriptor += 'Side ' + str(i + 1) + ': ' + str(self.sides[i]) + ' '
 
         return 'Team ' + str(self.team_number) + ': Matches played: ' + str(self.matches_played) + ' ' + side_descriptor + ' max on: ' + str(self.max_consec) + ' max off: ' + str(self.max_off)
@@ -100,29 +365,28 @@ class Match():
     def __init__(self, team1, team2):
         self.teams = [team1, team2]
 
+    # reinitializes the match with 2 new teams
+    def update(self, team1, team2):
+        self.teams = [team1, team2]
+
+    # works out the order the match would like to be given the sides in, which only even_sides_greedy needs.
+    # It isn't worked out when the match is made, as doing it for every match is slow in a big round.
+    def find_preferences(self):
+        team1, team2 = self.teams
         # makes arrays holding higher/lower values for the number of games played at each spot
         # e.g team1 has played 1, 0, 3 times at locations 0, 1 and 2 and team2 has done this 2, 2, 0 times
         # this will then return [1, 0, 0] for the min list and [2, 2, 3] for the max list
-        max_played_in_loc = [max(team1.sides[i], team2.sides[i]) for i in range(num_sim_matches)]
-        min_played_in_loc = [min(team1.sides[i], team2.sides[i]) for i in range(num_sim_matches)]
+        max_played_in_loc = numpy.maximum(team1.sides, team2.sides).tolist()
+        min_played_in_loc = numpy.minimum(team1.sides, team2.sides).tolist()
 
         # uses the min and max lists to make a preference order for which sides to play on.
-        self.preference_order = sorted(range(num_sim_matches), key=lambda i: (max_played_in_loc[i], min_played_in_loc[i]))
+        self.preference_order = sorted(range(len(max_played_in_loc)), key=lambda i: (max_played_in_loc[i], min_played_in_loc[i]))
         # min, max matches lists, but ordered so that it aligns itself with the preference order.
         # for the example above, preference order would be [1, 0, 2], indicating the preferred location for the match is 1, then 0, then 2
         # this gives a min list of [0, 1, 0] and a max list of [2, 2, 3]
         self.min_matches_at_loc = [min_played_in_loc[self.preference_order[i]] for i in range(len(self.preference_order))]
         self.max_matches_at_loc = [max_played_in_loc[self.preference_order[i]] for i in range(len(self.preference_order))]
 
-    # reinitializes the match with 2 new teams
-    def update(self, team1, team2):
-        self.teams = [team1, team2]
-        max_played_in_loc = [max(team1.sides[i], team2.sides[i]) for i in range(num_sim_matches)]
-        min_played_in_loc = [min(team1.sides[i], team2.sides[i]) for i in range(num_sim_matches)]
-        self.preference_order = sorted(range(num_sim_matches), key=lambda i: (max_played_in_loc[i], min_played_in_loc[i]))
-        self.min_matches_at_loc = [min_played_in_loc[self.preference_order[i]] for i in range(len(self.preference_order))]
-        self.max_matches_at_loc = [max_played_in_loc[self.preference_order[i]] for i in range(len(self.preference_order))]
-
     # when a location for a match is no longer available, it must be removed from its preferences
     def location_unavailable(self, location):
         location_index = self.preference_order.index(location)
@@ -131,16 +395,30 @@ class Match():
         self.max_matches_at_loc.pop(location_index)
 
 '''
-Initializes the team list with the teams in.
+Initializes the team list with the teams in, with num_sim_matches pads.
 '''
-def init_teams():
-    team_list = [Team(i + 1) for i in range(num_teams)]
-    for team in team_list:
-        for i in range(num_teams):
-            if i + 1 != team.team_number:
-                team.not_played.append(i + 1)
+def init_teams(num_teams, num_sim_matches):
+    store = TeamStore(num_sim_matches, capacity=num_teams)
+    return [Team(i + 1, store) for i in range(num_teams)]
 
-    return team_list
+'''
+Sorts the teams by their priority for getting a match (see make_match).
+The tiebreak is the team number for the first set of matches and random thereafter.
+'''
+def sort_teams(team_list, first_matches):
+    store = team_list[0].store
+    slots = numpy.array([team.slot for team in team_list])
+    if first_matches:
+        tiebreak = store.team_numbers[slots]
+    else:
+        tiebreak = numpy.array([store.rng.random() for team in team_list])
+    return [team_list[i] for i in store.priority_order(slots, tiebreak)]
+
+'''
+Returns what sort_teams sorts a team by (without the tiebreak), where a lower key means a higher priority
+'''
+def priority_key(team):
+    return team.store.priority([team.slot])[0]
 
 '''
 Makes a match with the following priorities:
@@ -149,60 +427,457 @@ Makes a match with the following priorities:
 3. Total number of games a team has played
 4. Number of the team for first set of matches (so that the first matches are always teams 1v2, 3v4, 5v6, then 7v8, 9v10, 11v12, ...)
 and random thereafter
+The first 3 are the default priority_weights. Other weights rank the teams by a weighted sum of the terms instead (see TeamStore.priority).
+The method used to pair up the teams is given by mode (match_building by default).
+Each round is recorded in the telemetry of the teams' store if it has its own, or the shared telemetry if not
+(see round_telemetry and SchedulerTelemetry).
+report: a dictionary which is filled in with how the round was made and its telemetry: 'attempts' is the number of times
+        the teams were reshuffled before enough matches were found (always 0 for 'matching'), and 'relaxations' lists the rules
+        which were relaxed, either letting every team play every other team again or allowing a rematch of a team's last game.
+        If one is given, the round isn't recorded straight away, so that a round made ahead of time (e.g. by the SchedulePlanner)
+        is only recorded if it's played, by passing the report to record_round then.
+'''
+def make_match(team_list, first_matches=False, mode=None, report=None):
+    if mode is None:
+        mode = match_building
+    if mode == 'matching':
+        build = make_match_matching
+    elif mode == 'greedy':
+        build = make_match_greedy
+    else:
+        raise ValueError('Unknown match building mode: ' + str(mode))
+
+    # the last team each team played is kept, as the greedy method clears it when it allows rematches
+    store = team_list[0].store
+    last_team_played = store.last_team_played[:store.size].copy()
+    record = report is None
+    if record:
+        report = {}
+    report['attempts'] = 0
+    report['relaxations'] = []
+    start_time = time.perf_counter()
+    matches = build(team_list, first_matches, report)
+    wall_time = time.perf_counter() - start_time
+
+    instruments.record('make_match', wall_time)
+    report['telemetry'] = round_telemetry(team_list, matches, last_team_played, mode, first_matches, report, wall_time)
+    if record:
+        record_round(store, report)
+    return matches
+
+
+# records a round made by make_match in the telemetry of the store it's played on (or the shared telemetry if it has none)
+def record_round(store, report):
+    recorder = store.telemetry if store.telemetry is not None else telemetry
+    recorder.record(report['telemetry'])
+
+
+'''
+Works out the telemetry of a round made by make_match.
+As well as how the round was made (the number of reshuffles, which rules were relaxed and how long it took),
+it holds how fair the round is:
+repeat_pairings: number of matches between teams which have played each other before in the session
+rematches: number of matches which are a rematch of either team's last game
+priority_skips: number of teams left out of the round which had a higher priority than one of the teams picked
+games_spread_before and games_spread_after: difference between the most and fewest games played by the teams,
+                                            before and after the round is played
+'''
+def round_telemetry(team_list, matches, last_team_played, mode, first_matches, report, wall_time):
+    store = team_list[0].store
+    slots = numpy.array([team.slot for team in team_list])
+    host_slots = numpy.array([match.teams[0].slot for match in matches])
+    guest_slots = numpy.array([match.teams[1].slot for match in matches])
+    picked = numpy.zeros(store.size, dtype=bool)
+    picked[host_slots] = True
+    picked[guest_slots] = True
+    picked = picked[slots]
+
+    rematches = (last_team_played[host_slots] == store.team_numbers[guest_slots]) | (last_team_played[guest_slots] == store.team_numbers[host_slots])
+    # the priority of each team as a single number (lower is higher priority), the same as priority_key
+    priority = store.priority(slots)
+    matches_played = store.matches_played[slots]
+    return {
+        'mode': mode,
+        'first_matches': bool(first_matches),
+        'teams': len(team_list),
+        'attempts': report['attempts'],
+        'relaxations': list(report['relaxations']),
+        'wall_time_s': wall_time,
+        'repeat_pairings': int(numpy.count_nonzero(store.pair_counts[host_slots, guest_slots])),
+        'rematches': int(numpy.count_nonzero(rematches)),
+        'priority_skips': int(numpy.count_nonzero(priority[~picked] < priority[picked].max())) if picked.any() else 0,
+        'games_spread_before': int(numpy.ptp(matches_played)),
+        'games_spread_after': int(numpy.ptp(matches_played + picked)),
+    }
+
+
+'''
+Keeps the telemetry of the rounds made by make_match (see round_telemetry), so that it can be seen how often the scheduler
+has to fall back on relaxing its rules and how long it takes. The details of the last max_rounds rounds are kept in rounds,
+and the totals over every round since the telemetry was last cleared are added up as each round is recorded.
+The rounds planned ahead by the SchedulePlanner are only recorded as they're played, so that the rounds which are planned
+and then thrown away (when the teams or matches are changed) aren't counted.
 '''
-def make_match(team_list, first_matches=False):
+class SchedulerTelemetry():
+    def __init__(self, max_rounds=telemetry_rounds):
+        self.lock = threading.Lock()
+        self.rounds = deque(maxlen=max_rounds)
+        self.clear()
+
+    def clear(self):
+        with self.lock:
+            self.rounds.clear()
+            self.totals = {
+                'rounds': 0,
+                'relaxed_rounds': 0,
+                'attempts': 0,
+                'max_attempts': 0,
+                'relaxations': {},
+                'wall_time_s': 0.0,
+                'max_wall_time_s': 0.0,
+                'repeat_pairings': 0,
+                'rematches': 0,
+                'priority_skips': 0,
+                'max_games_spread': 0,
+            }
+
+    def record(self, entry):
+        with self.lock:
+            self.rounds.append(entry)
+            totals = self.totals
+            totals['rounds'] += 1
+            totals['relaxed_rounds'] += bool(entry['relaxations'])
+            totals['attempts'] += entry['attempts']
+            totals['max_attempts'] = max(totals['max_attempts'], entry['attempts'])
+            for relaxation in entry['relaxations']:
+                totals['relaxations'][relaxation] = totals['relaxations'].get(relaxation, 0) + 1
+            totals['wall_time_s'] += entry['wall_time_s']
+            totals['max_wall_time_s'] = max(totals['max_wall_time_s'], entry['wall_time_s'])
+            for key in ['repeat_pairings', 'rematches', 'priority_skips']:
+                totals[key] += entry[key]
+            totals['max_games_spread'] = max(totals['max_games_spread'], entry['games_spread_after'])
+
+    # returns the telemetry of the last round made, or None if there hasn't been one
+    def last(self):
+        with self.lock:
+            return self.rounds[-1] if self.rounds else None
+
+    # returns the telemetry of the rounds kept, oldest first
+    def history(self):
+        with self.lock:
+            return list(self.rounds)
+
+    # returns the totals over every round recorded, along with the mean time per round
+    def summary(self):
+        with self.lock:
+            summary = dict(self.totals)
+            summary['relaxations'] = dict(self.totals['relaxations'])
+        summary['mean_wall_time_s'] = summary['wall_time_s'] / summary['rounds'] if summary['rounds'] else 0.0
+        return summary
+
+    def print_summary(self):
+        summary = self.summary()
+        print('Rounds made:', summary['rounds'], 'Relaxed:', summary['relaxed_rounds'], summary['relaxations'],
+              'Reshuffles:', summary['attempts'], 'Mean time (ms):', round(summary['mean_wall_time_s'] * 1000, 3))
+
+telemetry = SchedulerTelemetry()
+
+
+'''
+Works out the cost of each possible match between the candidate teams, which make_match_matching minimises over the round.
+The candidates are in priority order (see sort_teams), and any two of them can be paired.
+In order of importance, the costs are for:
+1. Rematches of either team's last game
+2. Teams which have already played each other since the last reset
+3. Teams from further down the priority order than the 2 * num_matches teams who would normally play, counted in
+   priority levels (teams with the same priority, e.g. the same games off, games on and games played, are on the same level), so that a team only
+   misses out on a game when every team from its level would be a repeat
+4. The total number of times the teams have played each other
+5. How far apart the teams are in the priority order, plus how far each team is below the 2 * num_matches teams who would
+   normally play (so that the teams are paired with the teams next to them when nothing else matters, which keeps the first
+   matches as 1v2, 3v4, 5v6)
+Each cost is scaled so that the sum of all the costs below it in a round can never outweigh it, and a team can't play itself.
+The costs are worked out from the state given by pairing_state.
+'''
+def pairing_cost(num_matches, level_deficit, max_level, rematch, played, times_played):
+    num_candidates = len(level_deficit)
+    positions = numpy.arange(num_candidates)
+    excess = numpy.maximum(positions - (2 * num_matches - 1), 0)
+    rank_cost = numpy.abs(positions[:, None] - positions[None, :]) + 2 * (excess[:, None] + excess[None, :])
+
+    rank_scale = 1
+    times_played_scale = rank_scale * (5 * num_candidates * num_matches + 1)
+    level_scale = times_played_scale * (num_matches * int(times_played.max()) + 1)
+    played_scale = level_scale * (2 * num_matches * max_level + 1)
+    rematch_scale = played_scale * (num_matches + 1)
+    cost = rematch * rematch_scale + played * played_scale + (level_deficit[:, None] + level_deficit[None, :]) * level_scale + \
+        times_played * times_played_scale + rank_cost * rank_scale
+    numpy.fill_diagonal(cost, rematch_scale * (num_matches + 1))
+    return cost
+
+
+'''
+Returns everything about the candidate teams that pairing_cost needs, in the priority order (see sort_teams) rather than by team:
+level_deficit: how many priority levels each candidate is below the 2 * num_matches teams who would normally play
+max_level: the number of priority levels after the first
+rematch, played and times_played: whether each pair of candidates played each other in their last games, whether they've
+played each other since the last reset and how many times they've played each other
+This is the form of the scheduling state the round is made from which the round cache's fingerprints are taken of: it doesn't
+depend on the team numbers or where the teams are kept in the store, but it does depend on the order the random tiebreak
+put the teams tied on priority in (see memoize_rounds).
+'''
+def pairing_state(store, slots, num_matches):
+    # a new priority level starts wherever the priority changes
+    priority = store.priority(slots)
+    new_level = numpy.zeros(len(slots), dtype=numpy.int64)
+    new_level[1:] = priority[1:] != priority[:-1]
+    level = numpy.cumsum(new_level)
+    level_deficit = numpy.maximum(level - level[2 * num_matches - 1], 0)
+
+    last_opponent = store.last_team_played[slots][:, None] == store.team_numbers[slots][None, :]
+    rematch = last_opponent | last_opponent.T
+    played = store.played_epoch[slots[:, None], slots] == store.epoch
+    times_played = store.pair_counts[slots[:, None], slots]
+    return level_deficit, int(level.max()), rematch, played, times_played
+
+
+# returns True if none of the hosts has ever played the guest it would be paired with, either since the last reset or
+# before it (so none of the matches would be a rematch either)
+def new_neighbours(store, host_slots, guest_slots):
+    return not (store.pair_counts[host_slots, guest_slots].any() or (store.played_epoch[host_slots, guest_slots] == store.epoch).any() or
+                (store.last_team_played[host_slots] == store.team_numbers[guest_slots]).any() or
+                (store.last_team_played[guest_slots] == store.team_numbers[host_slots]).any())
+
+
+'''
+Improves a round by local search: firsts and seconds are the positions of the two teams in each match and bench is the
+positions of the candidates left out. Each step makes whichever of these changes lowers the total cost the most:
+re-pairing the teams of two matches with each other (a v b and c v d become a v c and b v d, or a v d and b v c), or swapping
+a team in a match for one on the bench. It stops when no change lowers the cost, returning the new firsts and seconds.
+'''
+def improve_matching(cost, firsts, seconds, bench):
+    firsts = numpy.array(firsts)
+    seconds = numpy.array(seconds)
+    bench = numpy.array(bench, dtype=numpy.int64)
+    num_matches = len(firsts)
+    upper = numpy.triu(numpy.ones((num_matches, num_matches), dtype=bool), 1)
+    while True:
+        current = cost[firsts, seconds]
+        pair_total = current[:, None] + current[None, :]
+        together = cost[firsts[:, None], firsts[None, :]] + cost[seconds[:, None], seconds[None, :]]
+        crossed = cost[firsts[:, None], seconds[None, :]] + cost[seconds[:, None], firsts[None, :]]
+        repair_gain = numpy.where(upper, pair_total - numpy.minimum(together, crossed), 0)
+        best_repair = int(repair_gain.argmax())
+
+        best_swap_gain = 0
+        if len(bench):
+            playing = numpy.concatenate((firsts, seconds))
+            partners = numpy.concatenate((seconds, firsts))
+            swap_gain = cost[partners, playing][:, None] - cost[partners[:, None], bench[None, :]]
+            best_swap = int(swap_gain.argmax())
+            best_swap_gain = swap_gain.flat[best_swap]
+
+        if max(repair_gain.flat[best_repair], best_swap_gain) <= 0:
+            return firsts, seconds
+        if repair_gain.flat[best_repair] >= best_swap_gain:
+            i, j = divmod(best_repair, num_matches)
+            if together[i, j] <= crossed[i, j]:
+                firsts[j], seconds[i] = seconds[i], firsts[j]
+            else:
+                seconds[i], seconds[j] = seconds[j], seconds[i]
+        else:
+            team, bench_index = divmod(best_swap, len(bench))
+            match = team % num_matches
+            if team < num_matches:
+                firsts[match], bench[bench_index] = bench[bench_index], firsts[match]
+            else:
+                seconds[match], bench[bench_index] = bench[bench_index], seconds[match]
+
+
+# number of times as many teams as will play in a round which make_match_matching picks the round from, from the top of the priority order
+candidate_factor = 2
+
+'''
+Makes the matches in one pass, with no retries.
+The round is picked from the candidates at the top of the priority order (candidate_factor times as many teams as will play),
+as the set of matches with the smallest total pairing_cost, where any two candidates can play each other. Teams further down
+the order are only picked when that avoids a repeat, so a team only misses its turn when it has run out of new opponents.
+The round is found by first splitting the 2 * num_sim_matches teams with the highest priority alternately into hosts and guests
+and giving each host the guest (from anywhere in the candidates) which makes the total cost the smallest with the assignment
+solver (the same one as even_sides), then improving it with improve_matching, which can also pair hosts with each other.
+If the best round still needs teams who have already played each other, the teams are all allowed to play each other again.
+When no host has ever played the guest next to it in the order (and none of them would be a rematch), pairing them up like that
+(1v2, 3v4, 5v6, ...) is the only round with the smallest pairing_cost, so it's used straight away without solving anything.
+'''
+def make_match_matching(team_list, first_matches=False, report=None):
+    store = team_list[0].store
+    num_sim_matches = store.num_sides
+    sorted_teams = sort_teams(team_list, first_matches)
+    slots = numpy.array([team.slot for team in sorted_teams])
+    host_positions = numpy.arange(0, 2 * num_sim_matches, 2)
+
+    if new_neighbours(store, slots[host_positions], slots[host_positions + 1]):
+        pairs = list(zip(host_positions.tolist(), (host_positions + 1).tolist()))
+    else:
+        candidates = slots[:2 * num_sim_matches * candidate_factor]
+        # the same state always gives the same round, so a state seen before is looked up in the round cache rather than solved again
+        state = pairing_state(store, candidates, num_sim_matches)
+        key = fingerprint(*state) if memoize_rounds else None
+        pairs = round_cache.get('make_match', key) if memoize_rounds else None
+        if pairs is None:
+            cost = pairing_cost(num_sim_matches, *state)
+            guest_positions = numpy.concatenate((host_positions + 1, numpy.arange(2 * num_sim_matches, len(candidates))))
+            guest_indices = solve_assignment(cost[host_positions][:, guest_positions].astype(float))
+            guests = guest_positions[guest_indices]
+            bench = numpy.setdiff1d(guest_positions, guests)
+            firsts, seconds = improve_matching(cost, host_positions, guests, bench)
+            # each match has the team with the higher priority first, and the matches are in the order of their first teams
+            pairs = sorted(zip(numpy.minimum(firsts, seconds).tolist(), numpy.maximum(firsts, seconds).tolist()))
+            if memoize_rounds:
+                round_cache.put('make_match', key, pairs)
+
     matches = []
-    sorted_teams = sorted(team_list, key = lambda team: (-team.consecutive_off, team.consecutive_games, team.matches_played, team.team_number if first_matches else random()))
-    teams_picked = []
+    repeats = False
+    rematches = False
+    for first_position, second_position in pairs:
+        host = sorted_teams[first_position]
+        guest = sorted_teams[second_position]
+        matches.append(Match(host, guest))
+        repeats = repeats or store.has_played(host.slot, guest.slot)
+        rematches = rematches or host.last_team_played == guest.team_number or guest.last_team_played == host.team_number
+
+    if repeats:
+        store.reset_played()
+    if report is not None:
+        report['attempts'] = 0
+        report['relaxations'] = ['reset_played'] * int(repeats) + ['allow_rematch'] * int(rematches)
+    return matches
+
 
-    # Finds the best opponent for the team input
+'''
+The original method for making the matches: the highest priority team is paired with the next highest team it hasn't played,
+and so on down the order. If that doesn't give enough matches, the teams are reshuffled and it tries again,
+resetting who has played who after 10 attempts and allowing rematches of the last game after 20.
+'''
+def make_match_greedy(team_list, first_matches=False, report=None):
+    matches = []
+    relaxations = []
+    store = team_list[0].store
+    num_sim_matches = store.num_sides
+    sorted_teams = sort_teams(team_list, first_matches)
+    sorted_slots = numpy.array([team.slot for team in sorted_teams])
+    # which teams have been picked for a match, indexed by slot, so that checking a team is a lookup rather than a search
+    picked = numpy.zeros(store.capacity, dtype=bool)
+
+    # Finds the best opponent for the team input: the first team in the priority order which hasn't been picked,
+    # hasn't played it since the last reset and wasn't its last opponent (all of the teams are checked at once)
     def find_opponent(team):
-        for team2 in sorted_teams:
-            if team2.team_number in team.not_played and not team2 in teams_picked and team2.team_number != team.last_team_played:
-                # adds a new match class holding both of the teams
-                matches.append(Match(team, team2))
-                teams_picked.append(team)
-                teams_picked.append(team2)
-                return
+        available = (sorted_slots != team.slot) & ~picked[sorted_slots] & (store.played_epoch[team.slot, sorted_slots] != store.epoch) & \
+                    (store.team_numbers[sorted_slots] != team.last_team_played)
+        if available.any():
+            team2 = sorted_teams[int(numpy.argmax(available))]
+            # adds a new match class holding both of the teams
+            matches.append(Match(team, team2))
+            picked[team.slot] = True
+            picked[team2.slot] = True
     attempts = 0
     while len(matches) < num_sim_matches:
         for team in sorted_teams:
-            if not team in teams_picked:
-                find_opponent(team)        
+            if not picked[team.slot]:
+                find_opponent(team)
 
             if len(matches) == num_sim_matches:
+                if report is not None:
+                    report['attempts'] = attempts
+                    report['relaxations'] = relaxations
                 return matches
 
         # reshuffles the teams so that they're in a different order
         matches = []
-        teams_picked = []
-        sorted_teams = sorted(team_list, key = lambda team: (-team.consecutive_off, team.consecutive_games, team.matches_played, team.team_number if first_match else random()))
+        picked[:] = False
+        sorted_teams = sort_teams(team_list, first_matches)
+        sorted_slots = numpy.array([team.slot for team in sorted_teams])
         attempts += 1
         # after 20 attempts, the requirement that matches cannot be repeated is lifted, as it is assumed that the 
         if attempts == 20:
+            relaxations.append('allow_rematch')
             for team in team_list:
                 team.last_team_played = 0
 
         # if the algorithm was unable to make enough matches and there aren't enough potential matches in terms of 
         # teams which haven't played each other, it restarts the table by saying that no team has played any other 
-        # (i.e adding each team to the list of teams not played on every other team)
-        potential_matches = 0
-        for team in sorted_teams:
-            potential_matches += len(team.not_played)
-        # after 20 attempts, it assumes that the problem with finding matches is that there is no possible configuration which allows teams 
+        # (i.e moving the store on to a new epoch, so that every team is allowed to play every other team again)
+        potential_matches = store.count_not_played(numpy.array([team.slot for team in team_list]))
+        # after 10 attempts, it assumes that the problem with finding matches is that there is no possible configuration which allows teams 
         # to play teams it hasn't previously played
         if potential_matches <= 2 * num_sim_matches or attempts > 10:
-            for team in sorted_teams:
-                for i in range(len(sorted_teams)):
-                    if sorted_teams[i].team_number != team.team_number:
-                        team.not_played.append(sorted_teams[i].team_number)
+            relaxations.append('reset_played')
+            store.reset_played()
+
+
+'''
+Logic to even out how often each team plays on each part of the rink.
+Returns the matches ordered by the side they are playing on, using the method given by mode (side_allocation by default).
+'''
+def even_sides(matches, mode=None):
+    if mode is None:
+        mode = side_allocation
+    if mode == 'optimal':
+        with instruments.timed('even_sides'):
+            return even_sides_optimal(matches)
+    elif mode == 'greedy':
+        with instruments.timed('even_sides'):
+            return even_sides_greedy(matches)
+    raise ValueError('Unknown side allocation mode: ' + str(mode))
+
+
+'''
+Gives each match the side which makes the total number of games played at each side by the teams as even as possible.
+The cost of playing a match at a side is the number of games the two teams have already played there (which is how much
+the sum of the squares of the teams' side counts goes up by), with the larger of the two counts as a tiebreak.
+The allocation with the smallest total cost is then found with the assignment solver, so it is always the best one available.
+Up to brute_force_size pads the solver just tries every allocation, which is quicker than looking it up in the round cache.
+For more pads than that, the rows of the costs are sorted before they're solved, so that the matches being in a different
+order (or the teams being the other way round in a match) gives the same fingerprint in the round cache.
+'''
+def even_sides_optimal(matches):
+    num_sides = len(matches)
+    store = matches[0].teams[0].store
+    first_sides = store.sides[[match.teams[0].slot for match in matches], :num_sides]
+    second_sides = store.sides[[match.teams[1].slot for match in matches], :num_sides]
+
+    # the tiebreak is scaled down so that it can never outweigh a difference in the main cost
+    tiebreak_scale = num_sides * (int(numpy.maximum(first_sides, second_sides).max()) + 1) + 1
+    cost = (first_sides + second_sides) * tiebreak_scale + numpy.maximum(first_sides, second_sides)
+    if num_sides <= brute_force_size:
+        sides_given = [0 for i in range(num_sides)]
+        for match, side in zip(matches, solve_assignment(cost)):
+            sides_given[side] = match
+        return sides_given
+
+    order = numpy.lexsort(cost.T[::-1])
+    cost = cost[order]
+
+    key = fingerprint(cost) if memoize_rounds else None
+    sides = round_cache.get('even_sides', key) if memoize_rounds else None
+    if sides is None:
+        sides = solve_assignment(cost)
+        if memoize_rounds:
+            round_cache.put('even_sides', key, sides)
+
+    sides_given = [0 for i in range(num_sides)]
+    for match_index, side in zip(order, sides):
+        sides_given[side] = matches[match_index]
+    return sides_given
 
 
 '''
-Logic to even out how often each team plays on each part of the rink
+The original method for evening out the sides, which gives out one side at a time
 '''
-def even_sides(matches):
+def even_sides_greedy(matches):
     sides_given = [0 for i in range(len(matches))]
+    for match in matches:
+        match.find_preferences()
     while 0 in sides_given:
         # giving sides is prioritized based off the total number of times the teams have played on the side... The teams which have played on their 
         # first choice side collectively the least number of times are given their first choice, then the side and team is removed and the process is repeated.
@@ -229,10 +904,115 @@ def even_sides(matches):
 
 
 '''
-Changes the number of teams playing and/or the number of sections in the rink
+Removes the team with the given number from the team list and adds it to the list of removed teams
+Returns the team removed, or None if no team in the list has that number
+'''
+def remove_team_number(team_list, removed_teams, number):
+    for i in range(len(team_list)):
+        if team_list[i].team_number == number:
+            removed_teams.append(team_list[i])
+            set_active(team_list[i], False)
+            return team_list.pop(i)
+    return None
+
+
+'''
+Puts a previously removed team with the given number back into the team list
+Returns the team replaced, or None if no removed team has that number
+'''
+def replace_removed_team(team_list, removed_teams, number):
+    for i in range(len(removed_teams)):
+        if removed_teams[i].team_number == number:
+            team_list.append(removed_teams[i])
+            set_active(removed_teams[i], True)
+            return removed_teams.pop(i)
+    return None
+
+
+'''
+Adds a brand new team to the end of the team list and returns it.
+The new team number is one more than the current maximum (including teams which were previously removed)
+'''
+def add_new_team(team_list, removed_teams):
+    new_team_number = max(team.team_number for team in team_list + removed_teams) + 1
+
+    # creates the new team, which starts off not having played any other teams, before adding it to the team list
+    new_team = Team(new_team_number, team_list[0].store)
+    team_list.append(new_team)
+    set_active(new_team, True)
+    return new_team
+
+
+# tells the fairness metrics (if the team's store has them) that a team has been put into or taken out of the session
+def set_active(team, active):
+    if team.store.metrics is not None:
+        team.store.metrics.set_active(team.store, team.slot, active)
+
+
+'''
+Repairs a set of matches after a team has been removed or added part way through a session, rather than making them all again.
+Only the match involving the team is changed, so every other pairing stays on the same side:
+a removed team is replaced by the team not already playing which make_match would rank highest as its opponent's partner
+(avoiding rematches and teams its opponent has already played, then by priority), and an added team takes the place of
+one of the teams playing with a lower priority than it (avoiding rematches and teams it has already played in the same way,
+then taking the place of the lowest priority team).
+This takes time proportional to the number of teams, rather than making a new round.
+Returns the repaired list of matches, ordered by side.
+'''
+def repair_sides(team_list, sides, removed_team=None, added_team=None):
+    sides = list(sides)
+    playing = set(team for match in sides for team in match.teams)
+
+    if removed_team is not None and removed_team in playing:
+        for i in range(len(sides)):
+            teams = list(sides[i].teams)
+            if removed_team in teams:
+                position = teams.index(removed_team)
+                opponent = teams[1 - position]
+                candidates = [team for team in team_list if team not in playing]
+                if not candidates:
+                    continue
+                store = opponent.store
+                slots = numpy.array([team.slot for team in candidates])
+                rematch = (store.team_numbers[slots] == opponent.last_team_played) | (store.last_team_played[slots] == opponent.team_number)
+                played = store.played_epoch[slots, opponent.slot] == store.epoch
+                tiebreak = numpy.array([store.rng.random() for team in candidates])
+                best = numpy.lexsort((tiebreak, store.priority(slots), played, rematch))[0]
+                teams[position] = candidates[best]
+                playing.add(teams[position])
+                sides[i] = Match(teams[0], teams[1])
+
+    if added_team is not None and added_team not in playing and sides:
+        # the places the added team could take: those of the teams playing with a lower priority than it
+        store = added_team.store
+        places = [(i, position) for i in range(len(sides)) for position in range(2)
+                  if priority_key(sides[i].teams[position]) > priority_key(added_team)]
+        if places:
+            slots = numpy.array([sides[i].teams[position].slot for i, position in places])
+            opponents = numpy.array([sides[i].teams[1 - position].slot for i, position in places])
+            rematch = (store.team_numbers[opponents] == added_team.last_team_played) | (store.last_team_played[opponents] == added_team.team_number)
+            played = store.played_epoch[opponents, added_team.slot] == store.epoch
+            tiebreak = numpy.array([store.rng.random() for place in places])
+            # avoids rematches and teams already played in the same way as for a removed team, then takes the lowest priority team's place
+            best = numpy.lexsort((tiebreak, -store.priority(slots), played, rematch))[0]
+            i, position = places[best]
+            teams = list(sides[i].teams)
+            teams[position] = added_team
+            sides[i] = Match(teams[0], teams[1])
+    return sides
+
+
+'''
+Changes the number of teams playing and/or the number of sections in the rink of the given Session
 Also contains classes and functions for displaying the questions
 '''
-def change_team_num(team_list, sides, next_sides, removed_teams, time_remaining):
+def change_team_num(session, sides, next_sides, time_remaining):
+    import display_module
+    team_list = session.team_list
+    removed_teams = session.removed_teams
+    # the team which has been removed or added, so that only the matches involving it need to be changed
+    changed_teams = {'removed': None, 'added': None}
+
     # class to hold a multiple choice question, its possible answers and what should happen after each of the answers
     class QuestionNode:
         def __init__(self, question, answers):
@@ -255,24 +1035,17 @@ def change_team_num(team_list, sides, next_sides, removed_teams, time_remaining)
 
     # changes the number of matches played at the same time
     def change_sides(team_list, removed_teams):
-        global num_sim_matches
-        original_num_sim_matches = num_sim_matches
-        params = {'Number of sides': num_sim_matches}
-        param_min_max = {'Number of sides': [1, num_teams//2]}
+        params = {'Number of sides': session.num_sim_matches}
+        param_min_max = {'Number of sides': [1, len(team_list)//2]}
         exit, quit = display_module.draw_arrow_box(params, param_min_max)
-        num_sim_matches = params['Number of sides']
 
-        # once the number of sides has been changed, the sides that each team has played on becomes irrelevant, so we start again from scratch
-        if not exit and not quit and original_num_sim_matches != num_sim_matches:
-            for team in team_list:
-                team.sides = [0 for i in range(num_sim_matches)]
-            for team in removed_teams:
-                team.sides = [0 for i in range(num_sim_matches)]
+        # once the number of sides has been changed, the sides that each team has played on becomes irrelevant, so the session starts them again from scratch
+        if not exit and not quit:
+            session.change_sides(params['Number of sides'])
         return exit, quit
     
     # removes a team from the team list
     def remove_team(team_list, removed_teams):
-        global num_teams
         exit = False
         quit = False
         answers = []
@@ -292,17 +1065,11 @@ def change_team_num(team_list, sides, next_sides, removed_teams, time_remaining)
             exit = True
         # if an answer has been selected, removes that team from the team list and adds it to the list of removed teams
         elif answer in answers:
-            for i in range(len(team_list)):
-                if int(answer) == team_list[i].team_number:
-                    removed_teams.append(team_list[i])
-                    team_list.pop(i)
-                    num_teams -= 1
-                    break
+            changed_teams['removed'] = remove_team_number(team_list, removed_teams, int(answer))
         return exit, quit
 
     # replaces a team that was previously removed from the list
     def add_removed_team(team_list, removed_teams):
-        global num_teams
         exit = False
         quit = False
         answers = []
@@ -322,54 +1089,50 @@ def change_team_num(team_list, sides, next_sides, removed_teams, time_remaining)
             exit = True
         # if an answer has been selected, replaces that team from the removed teams and adds it to the team list
         elif answer in answers:
-            for i in range(len(removed_teams)):
-                if int(answer) == removed_teams[i].team_number:
-                    team_list.append(removed_teams[i])
-                    removed_teams.pop(i)
-                    num_teams += 1
-                    break
+            changed_teams['added'] = replace_removed_team(team_list, removed_teams, int(answer))
         return exit, quit
 
     # adds a new team to the end of the list.
     def add_team_to_end(team_list, removed_teams):
-        global num_teams
-        num_teams += 1
-
-        # the new team number is one more than the current maximum (including teams which were previously removed)
-        try:
-            new_team_number = max(max(team.team_number for team in team_list), max(team.team_number for team in removed_teams)) + 1
-        except ValueError:
-            new_team_number = max(team.team_number for team in team_list) + 1
-
-        # creates the new team and adds the fact that it hasn't played any other teams yet, before adding it to the team list
-        new_team = Team(new_team_number)
-        for team in team_list:
-            new_team.not_played.append(team.team_number)
-            team.not_played.append(new_team_number)
-        team_list.append(new_team)
+        changed_teams['added'] = add_new_team(team_list, removed_teams)
         return False, False
 
+    # returns True if the matches can be repaired rather than made again
+    def can_repair():
+        return schedule_repair == 'incremental' and (changed_teams['removed'] is not None or changed_teams['added'] is not None)
+
     # creates a new set of current and next games with the new parameters
     def update_current_games(team_list, sides, next_sides):
         # removes the previous updates to the team stats from the current game
         update_teams(team_list, sides, add=False)
 
+        # only changes the matches involving the team which was added or removed
+        if can_repair():
+            sides = repair_sides(team_list, sides, changed_teams['removed'], changed_teams['added'])
+            update_teams(team_list, sides, add=True)
+            next_sides = repair_sides(team_list, next_sides, changed_teams['removed'], changed_teams['added'])
+            return sides, next_sides
+
         # adds the new current matches
-        matches = make_match(team_list)
-        sides = even_sides(matches)
+        matches = make_match(team_list, mode=session.match_building)
+        sides = even_sides(matches, session.side_allocation)
         update_teams(team_list, sides, add=True)
 
         # adds the new upcoming matches
-        matches = make_match(team_list)
-        next_sides = even_sides(matches)
+        matches = make_match(team_list, mode=session.match_building)
+        next_sides = even_sides(matches, session.side_allocation)
 
         return sides, next_sides
 
     # creates a new set of next games with the new parameters
     def update_next_games(team_list, sides, next_sides):
+        if can_repair():
+            next_sides = repair_sides(team_list, next_sides, changed_teams['removed'], changed_teams['added'])
+            return sides, next_sides
+
         # adds the new upcoming games
-        matches = make_match(team_list)
-        next_sides = even_sides(matches)
+        matches = make_match(team_list, mode=session.match_building)
+        next_sides = even_sides(matches, session.side_allocation)
         return sides, next_sides
 
     quit = False
@@ -413,7 +1176,7 @@ def change_team_num(team_list, sides, next_sides, removed_teams, time_remaining)
             return sides, next_sides, False
         elif next_node == add_team and len(removed_teams) == 0:
             next_node = add_to_end
-        elif next_node == teams and len(team_list) <= 2 * num_sim_matches:
+        elif next_node == teams and len(team_list) <= 2 * session.num_sim_matches:
             next_node = QuestionNode(['Min number of teams reached.', 'Increase the nbr of teams', 'or decrease the nbr of sides?'], ['Increase nbr of teams', 'Decrease nbr of sides'])
             next_node.children.append(add_team)
             next_node.children.append(change_sides)
@@ -441,9 +1204,11 @@ def change_team_num(team_list, sides, next_sides, removed_teams, time_remaining)
 
 
 '''
-Allows the user to change who is playing in the next few matches.
+Allows the user to change who is playing in the next few matches of the given Session.
 '''
-def change_match(sides, next_sides, team_list, time_remaining):
+def change_match(session, sides, next_sides, time_remaining):
+    import display_module
+    team_list = session.team_list
     quit = False
     question = ['Are you changing this set of', 'matches or the next?']
     answers = ['This set', 'The next']
@@ -459,14 +1224,14 @@ def change_match(sides, next_sides, team_list, time_remaining):
         if answer == answers[0]:
             # gets the changes to the current matches that the user wants
             update_teams(team_list, sides, add=False)
-            sides, quit = display_module.get_match_change(sides, team_list, num_sim_matches)
+            sides, quit = display_module.get_match_change(sides, team_list, team_list[0].store.num_sides)
             update_teams(team_list, sides, add=True)
 
             # makes the next set of matches
-            matches = make_match(team_list)
-            next_sides = even_sides(matches)
+            matches = make_match(team_list, mode=session.match_building)
+            next_sides = even_sides(matches, session.side_allocation)
     if answer == answers[1]:
-        next_sides, quit = display_module.get_match_change(next_sides, team_list, num_sim_matches)
+        next_sides, quit = display_module.get_match_change(next_sides, team_list, team_list[0].store.num_sides)
     elif answer == 'quit':
         quit = True
 
@@ -477,7 +1242,7 @@ def change_match(sides, next_sides, team_list, time_remaining):
 prints the matches out, given the list of sides for each match
 '''
 def print_matches(sides_given):
-    for i in range(num_sim_matches):
+    for i in range(len(sides_given)):
         print(str(sides_given[i].teams[0].team_number) + 'v' + str(sides_given[i].teams[1].team_number), end=' ')
     print()
 
@@ -490,22 +1255,26 @@ def print_stats(teams, removed_teams):
     sorted_list = sorted(new_list, key=lambda team: team.team_number)
     for team in sorted_list:
         print(team)
-        pass
 
-    all_values = []
-    for i in range(len(sorted_list)):
-        for j in range(num_sim_matches):
-            all_values.append(sorted_list[i].sides[j])
-
-    print('Standard deviation of games played per side:', numpy.std(all_values))
+    # the session's fairness statistics come from its metrics, which are worked out from scratch if it doesn't have any
+    store = teams[0].store
+    metrics = store.metrics
+    if metrics is None:
+        metrics = FairnessMetrics(store, [team.slot for team in teams])
+    summary = metrics.summary()
+    print('Standard deviation of games played per side:', summary['side_std'])
+    print('Spread of games played:', summary['games_spread'], 'Max on:', summary['max_on'], 'Max off:', summary['max_off'],
+          'Repeat pairings:', summary['repeat_pairings'])
 
 '''
-Updates the display of the clock
+Updates the display of the clock, returning True if the time shown on it changed
 '''
 def update_clock(background_group, time_remaining):
+    changed = False
     for item in background_group:
         if item.name == 'clock':
-            item.update(time_remaining[0])
+            changed = item.update(time_remaining[0]) or changed
+    return changed
 
 
 '''
@@ -515,97 +1284,670 @@ sides: list of the matches, ordered by the side they are playing on
 add: True if we are updating the teams with the new games, False if we are undoing the action
 '''
 def update_teams(team_list, sides, add):
-    for team in team_list:
-        team_playing = False
-        # if the team is playing, finds the opponent
-        for i in range(len(sides)):
-            if team == sides[i].teams[0]:
-                team_playing = True
-                opponent = sides[i].teams[1].team_number
-                match_loc = i
-            elif team == sides[i].teams[1]:
-                team_playing = True
-                opponent = sides[i].teams[0].team_number
-                match_loc = i
-
-        # adds/removes the new game to the stats of the team
-        if add:
-            if team_playing:
-                team.add_game(opponent, match_loc)
-            else:
-                team.add_off()
-        # adds/removes the fact that the team doesn't play in that round from its stats
-        else:
-            if team_playing:
-                team.undo_add_game(opponent, match_loc)
-            else:
-                team.undo_add_off()
+    store = team_list[0].store
+    slots = numpy.array([team.slot for team in team_list])
+    first_slots = numpy.array([match.teams[0].slot for match in sides], dtype=numpy.int64)
+    second_slots = numpy.array([match.teams[1].slot for match in sides], dtype=numpy.int64)
+    locs = numpy.arange(len(sides))
+
+    # adds/removes the new games and periods off to the stats of all the teams at once
+    if add:
+        store.apply_round(slots, first_slots, second_slots, locs)
+    else:
+        store.undo_round(slots, first_slots, second_slots, locs)
+
+'''
+Holds what one round changed in the team stats, so that the round can be undone and played again.
+Only the values which the round overwrites are kept: the stats of the teams in the round,
+and the side counts, pair counts and played epochs of the pairs of teams who played each other.
+Making a round can also move the store on to a new epoch (when every team is allowed to play every other team again),
+which happens before the round is added to the history, so the epoch from before the round was made is given as epoch
+(None if it's the store's current epoch) and is put back when the round is undone.
+'''
+class RoundDelta():
+    def __init__(self, team_list, sides, epoch=None):
+        store = team_list[0].store
+        self.pairs = [(match.teams[0].team_number, match.teams[1].team_number) for match in sides]
+        self.slots = numpy.array([team.slot for team in team_list])
+        self.first_slots = numpy.array([match.teams[0].slot for match in sides], dtype=numpy.int64)
+        self.second_slots = numpy.array([match.teams[1].slot for match in sides], dtype=numpy.int64)
+        self.locs = numpy.arange(len(sides))
+        # the epoch the round is played at, and the epoch the stats were at before the round was made
+        self.epoch = store.epoch
+        self.prev_epoch = store.epoch if epoch is None else epoch
+        self.num_sides = store.num_sides
+        # whether the first matches are still being played in order after this round
+        self.first_matches = False
+
+        playing, opponents, play_locs = self.playing()
+        self.values = {field: getattr(store, field)[self.slots] for field in TeamStore.fields}
+        valid = play_locs < store.num_sides
+        self.side_counts = store.sides[playing[valid], play_locs[valid]]
+        self.pair_counts = store.pair_counts[playing, opponents]
+        self.played_epoch = store.played_epoch[playing, opponents]
+        self.prev_played_epoch = store.prev_played_epoch[playing, opponents]
+
+    # returns the slots of each team playing, the slot of its opponent and the location of its match
+    def playing(self):
+        playing = numpy.concatenate((self.first_slots, self.second_slots))
+        opponents = numpy.concatenate((self.second_slots, self.first_slots))
+        return playing, opponents, numpy.concatenate((self.locs, self.locs))
+
+    # puts back the values the round overwrote
+    def undo(self, store):
+        playing, opponents, play_locs = self.playing()
+        if store.metrics is not None:
+            store.metrics.remove(store, self.slots, playing, opponents)
+        for field, values in self.values.items():
+            getattr(store, field)[self.slots] = values
+        store.pair_counts[playing, opponents] = self.pair_counts
+        store.played_epoch[playing, opponents] = self.played_epoch
+        store.prev_played_epoch[playing, opponents] = self.prev_played_epoch
+        # if the number of sides has changed since, the side counts have been started again, so there is nothing to put back
+        if store.num_sides == self.num_sides:
+            valid = play_locs < store.num_sides
+            store.sides[playing[valid], play_locs[valid]] = self.side_counts
+        store.epoch = self.prev_epoch
+        if store.metrics is not None:
+            store.metrics.add(store, self.slots, playing, opponents)
+
+    # plays the round again, after it has been undone
+    def redo(self, store):
+        store.epoch = self.epoch
+        store.apply_round(self.slots, self.first_slots, self.second_slots, self.locs)
+
+    # turns the round back into a list of matches, given the teams (which can include removed teams)
+    def sides(self, teams):
+        teams_by_number = {team.team_number: team for team in teams}
+        return [Match(teams_by_number[number1], teams_by_number[number2]) for number1, number2 in self.pairs]
+
+
+'''
+History of the rounds played in a session, which lets any number of rounds be undone and played again.
+Each round is kept as a RoundDelta, so undoing or redoing a round only touches the teams in that round,
+and the team list never needs to be copied. position is the number of rounds currently played;
+the rounds after it have been undone and can be redone until something else is played.
+Rounds from before the teams or the number of sides were last changed can't be undone, as they were made for different teams.
+'''
+class RoundHistory():
+    def __init__(self):
+        self.entries = []
+        self.position = 0
+        # the position when the teams or the number of sides were last changed, which rounds can't be undone past
+        self.changed_at = 0
+
+    # adds a new round to the team stats and the history, throwing away any rounds which were undone.
+    # epoch is the epoch of the stats before the round was made (see RoundDelta).
+    # Returns whether the first matches are still being played in order afterwards.
+    def record(self, team_list, sides, first_matches, epoch=None):
+        del self.entries[self.position:]
+        delta = RoundDelta(team_list, sides, epoch)
+        update_teams(team_list, sides, add=True)
+        store = team_list[0].store
+        delta.first_matches = first_matches and bool(numpy.any(store.matches_played[delta.slots] == 0))
+        self.entries.append(delta)
+        self.position += 1
+        return delta.first_matches
+
+    # plays a round, redoing it if it's the round that was last undone and recording it otherwise
+    def play(self, team_list, sides, first_matches, epoch=None):
+        pairs = [(match.teams[0].team_number, match.teams[1].team_number) for match in sides]
+        if self.position < len(self.entries) and self.entries[self.position].pairs == pairs:
+            return self.redo(team_list[0].store)
+        return self.record(team_list, sides, first_matches, epoch)
+
+    # the first round can't be undone, as there would be no current round left, and neither can the round being played
+    # when the teams were last changed, as the round before it would come up next with the old teams
+    def can_undo(self):
+        return self.position > max(1, self.changed_at)
+
+    def can_redo(self):
+        return self.position < len(self.entries)
+
+    # undoes the current round, returning whether the first matches are being played in order in the round before it
+    def undo(self, store):
+        self.position -= 1
+        self.entries[self.position].undo(store)
+        return self.entries[self.position - 1].first_matches
+
+    # plays the last undone round again, returning whether the first matches are still being played in order afterwards
+    def redo(self, store):
+        delta = self.entries[self.position]
+        delta.redo(store)
+        self.position += 1
+        return delta.first_matches
+
+    # returns the epoch the last undone round is played at, or None if there isn't one
+    def redo_epoch(self):
+        if self.position < len(self.entries):
+            return self.entries[self.position].epoch
+        return None
+
+    # replaces the current round after it has been changed by hand (the new round must already have been added to the team stats).
+    # Returns whether the first matches are still being played in order, which is first_matches if there is no round to replace
+    # (e.g. in a session picked up from the journal).
+    def amend(self, team_list, sides, first_matches):
+        if not self.position:
+            return first_matches
+        store = team_list[0].store
+        # the epoch the new round is played at, which includes any reset made while making it
+        epoch = store.epoch
+        update_teams(team_list, sides, add=False)
+        self.position -= 1
+        replaced = self.entries[self.position]
+        replaced.undo(store)
+        if self.position:
+            first_matches = self.entries[self.position - 1].first_matches
+        store.epoch = epoch
+        return self.record(team_list, sides, first_matches, replaced.prev_epoch)
+
+    # throws away the rounds which were undone, once something else has changed
+    def clear_redo(self):
+        del self.entries[self.position:]
+
+    # throws away the rounds which were undone and stops the rounds from before now being undone, once the teams or the
+    # number of sides have been changed
+    def teams_changed(self):
+        self.clear_redo()
+        self.changed_at = self.position
+
+    # returns the matches of the current round (offset 0) or one of the rounds before it (offset 1, 2, ...)
+    def round_sides(self, teams, offset=0):
+        if self.position - offset < 1:
+            return [''] * teams[0].store.num_sides
+        return self.entries[self.position - 1 - offset].sides(teams)
 
 
 '''
-Main function where most of the action happens
+Plans the upcoming rounds of a session on a background thread, so that the next round is always ready when a game ends.
+The planner works on its own copy of the team stats, applying each round it plans to the copy before planning the next,
+up to lookahead_rounds ahead. The first planned round is always the next set of matches (next_sides in main).
+Whenever the teams or matches are changed by hand, the plan is thrown away with invalidate and started again with replan.
+match_building and side_allocation: the modes the rounds are made with (None follows the global settings), which main
+takes from the Session
 '''
-def main():
+class SchedulePlanner():
+    def __init__(self, depth=None, match_building=None, side_allocation=None):
+        self.depth = depth or lookahead_rounds
+        self.match_building = match_building
+        self.side_allocation = side_allocation
+        self.condition = threading.Condition()
+        # each planned round is a list of the team numbers in each match, ordered by the side they are playing on, along with the
+        # epoch of the stats when it is played (make_match moves the epoch on when it lets every team play every other team again)
+        # and the report from make_match, which is recorded in the telemetry when it's played (None for rounds made by hand)
+        self.rounds = []
+        self.generation = 0
+        self.snapshot = None
+        self.planning_teams = None
+        self.planning_first_matches = False
+        self.teams_by_number = {}
+        self.busy = False
+        self.stopped = False
+        # an error raised while planning, which is raised again in the main thread when it asks for the next round
+        self.error = None
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    # stops the background thread once it has finished the round it is working on
+    def stop(self):
+        with self.condition:
+            self.stopped = True
+            self.condition.notify_all()
+        if self.thread.is_alive():
+            self.thread.join()
+
+    # throws away the planned rounds, waiting for the background thread to finish with the team stats it was planning from,
+    # so that the teams and the global settings can be safely changed afterwards
+    def invalidate(self):
+        with self.condition:
+            self.generation += 1
+            self.rounds = []
+            self.snapshot = None
+            while self.busy:
+                self.condition.wait()
+            self.planning_teams = None
+
+    # starts planning again from the current stats of the teams. If next_sides is given, it is kept as the first planned round,
+    # played at the given epoch if it moves the stats on to a new one (e.g. a round which has been undone).
+    def replan(self, team_list, first_matches, next_sides=None, epoch=None):
+        start_time = time.perf_counter()
+        self.invalidate()
+        store = team_list[0].store.copy()
+        planning_teams = [Team(team.team_number, store, team.slot) for team in team_list]
+        first_rounds = []
+        if next_sides is not None:
+            if epoch is not None:
+                store.epoch = max(store.epoch, epoch)
+            first_rounds.append(([(match.teams[0].team_number, match.teams[1].team_number) for match in next_sides], store.epoch, None))
+            update_teams(planning_teams, self.planning_sides(planning_teams, first_rounds[0][0]), add=True)
+            first_matches = first_matches and bool(numpy.any(store.matches_played[[team.slot for team in team_list]] == 0))
+        with self.condition:
+            self.teams_by_number = {team.team_number: team for team in team_list}
+            self.rounds = first_rounds
+            self.snapshot = (planning_teams, first_matches)
+            self.error = None
+            self.condition.notify_all()
+        instruments.record('replan', time.perf_counter() - start_time)
+
+    # turns a planned round back into a list of matches between the given teams
+    def planning_sides(self, teams, planned_round):
+        teams_by_number = {team.team_number: team for team in teams}
+        return [Match(teams_by_number[number1], teams_by_number[number2]) for number1, number2 in planned_round]
+
+    # returns the next set of matches, waiting for it to be planned if the planner hasn't caught up yet
+    def next_sides(self):
+        with self.condition:
+            while not self.rounds and self.error is None:
+                self.condition.wait()
+            if self.error is not None:
+                raise self.error
+            return self.planning_sides(self.teams_by_number.values(), self.rounds[0][0])
+
+    # moves the plan on by a round when the next set of matches starts, returning the new next set of matches.
+    # This must be called before the round is added to the team stats in store, as any reset of who has played who
+    # made while planning the round is copied over to them. The round is recorded in the telemetry now that it's being played.
+    def advance(self, store):
+        with self.condition:
+            if self.rounds:
+                planned_round, epoch, report = self.rounds.pop(0)
+                store.epoch = max(store.epoch, epoch)
+                if report is not None:
+                    record_round(store, report)
+                self.condition.notify_all()
+        return self.next_sides()
+
+    # the background thread, which keeps planning rounds until it is depth rounds ahead
+    def run(self):
+        while True:
+            with self.condition:
+                while not self.stopped and self.snapshot is None and (self.planning_teams is None or self.error is not None or len(self.rounds) >= self.depth):
+                    self.condition.wait()
+                if self.stopped:
+                    return
+                if self.snapshot is not None:
+                    self.planning_teams, self.planning_first_matches = self.snapshot
+                    self.snapshot = None
+                generation = self.generation
+                self.busy = True
+
+            planned_round = None
+            try:
+                report = {}
+                matches = make_match(self.planning_teams, self.planning_first_matches, self.match_building, report)
+                sides = even_sides(matches, self.side_allocation)
+                update_teams(self.planning_teams, sides, add=True)
+                planned_round = ([(match.teams[0].team_number, match.teams[1].team_number) for match in sides], self.planning_teams[0].store.epoch, report)
+
+                # the first matches are played in order until every team has had a game, in the same way as main
+                store = self.planning_teams[0].store
+                slots = [team.slot for team in self.planning_teams]
+                self.planning_first_matches = self.planning_first_matches and bool(numpy.any(store.matches_played[slots] == 0))
+            except Exception as error:
+                with self.condition:
+                    if generation == self.generation:
+                        self.error = error
+            finally:
+                with self.condition:
+                    self.busy = False
+                    if planned_round is not None and generation == self.generation:
+                        self.rounds.append(planned_round)
+                    self.condition.notify_all()
+
+
+'''
+A whole scheduling session: its teams, its number of pads, its random number generator and how it makes its rounds.
+Everything the scheduler needs is held by the session (and its TeamStore) rather than in the global variables, so any number
+of sessions can be made and played in the same process, including at the same time on different threads
+(e.g. for simulations, or for running several rinks at once). Each session should only be used by one thread at a time.
+seed: seed for the session's random number generator, so that the same seed always gives the same session
+match_building and side_allocation: the modes used by make_match and even_sides (None follows the global settings)
+priority_weights: the weight of each priority term (None follows the global priority_weights, see TeamStore.priority)
+'''
+class Session():
+    def __init__(self, num_teams, num_sim_matches, seed=None, match_building=None, side_allocation=None, priority_weights=None):
+        if num_teams < 2 * num_sim_matches:
+            raise ValueError('There must be at least 2 teams for every pad')
+        self.rng = random.Random(seed)
+        self.match_building = match_building
+        self.side_allocation = side_allocation
+        store = TeamStore(num_sim_matches, capacity=num_teams, rng=self.rng, priority_weights=priority_weights)
+        self.use_teams([Team(i + 1, store) for i in range(num_teams)], [])
+
+    # makes the session carry on with the given teams and removed teams (which must share a TeamStore) rather than new ones,
+    # e.g. those of a session loaded from the journal, with its own telemetry and fairness metrics for them
+    def use_teams(self, team_list, removed_teams, first_matches=True):
+        self.store = team_list[0].store
+        self.store.rng = self.rng
+        self.telemetry = SchedulerTelemetry()
+        self.store.telemetry = self.telemetry
+        self.team_list = team_list
+        self.removed_teams = removed_teams
+        self.store.metrics = FairnessMetrics(self.store, [team.slot for team in self.team_list])
+        self.first_matches = first_matches
+        self.sides = []
+        self.rounds_played = 0
+        # the last round made by make_round and its report from make_match, which is recorded in the telemetry if the round is played
+        self.made_round = None
+
+    @property
+    def num_teams(self):
+        return len(self.team_list)
+
+    @property
+    def num_sim_matches(self):
+        return self.store.num_sides
+
+    # makes the next round without playing it, returning the matches ordered by the side they are playing on
+    def make_round(self):
+        report = {}
+        matches = make_match(self.team_list, self.first_matches, self.match_building, report)
+        sides = even_sides(matches, self.side_allocation)
+        self.made_round = (sides, report)
+        return sides
+
+    # plays a round (the next one made by the scheduler if none is given) and returns it.
+    # The round is recorded in the session's telemetry if it was made by make_round.
+    def play_round(self, sides=None):
+        if sides is None:
+            sides = self.make_round()
+        if self.made_round is not None and self.made_round[0] is sides:
+            record_round(self.store, self.made_round[1])
+        self.made_round = None
+        update_teams(self.team_list, sides, add=True)
+        self.sides = sides
+        self.rounds_played += 1
+        # the first matches are played in order until every team has had a game, in the same way as main
+        if self.first_matches:
+            slots = [team.slot for team in self.team_list]
+            self.first_matches = bool(numpy.any(self.store.matches_played[slots] == 0))
+        return sides
+
+    # plays the given number of rounds, returning the last one
+    def advance(self, rounds=1):
+        for i in range(rounds):
+            self.play_round()
+        return self.sides
+
+    # removes the team with the given number, returning it, or None if there isn't one or there would be too few teams left
+    def remove_team(self, number):
+        if len(self.team_list) - 1 < 2 * self.num_sim_matches:
+            return None
+        return remove_team_number(self.team_list, self.removed_teams, number)
+
+    # puts a removed team back into the session, returning it, or None if no removed team has that number
+    def replace_team(self, number):
+        return replace_removed_team(self.team_list, self.removed_teams, number)
+
+    # adds a brand new team to the session and returns it
+    def add_team(self):
+        return add_new_team(self.team_list, self.removed_teams)
+
+    # changes the number of pads, which starts the counts of games played at each side again.
+    # Returns False if there aren't enough teams for that many pads.
+    def change_sides(self, num_sim_matches):
+        if num_sim_matches < 1 or 2 * num_sim_matches > len(self.team_list):
+            return False
+        if num_sim_matches != self.num_sim_matches:
+            self.store.reset_sides(num_sim_matches)
+        return True
+
+    # returns the fairness statistics of the session so far
+    def fairness(self):
+        return self.store.metrics.summary()
+
+
+'''
+Returns the team numbers in each of a set of matches, which is how the matches are written to the journal
+'''
+def match_pairs(sides):
+    return [[match.teams[0].team_number, match.teams[1].team_number] for match in sides if match]
+
+
+# returns the team numbers of each match in a round like match_pairs, but keeping a None for each pad without a match
+def pad_pairs(sides):
+    return [[match.teams[0].team_number, match.teams[1].team_number] if match else None for match in sides]
+
+
+'''
+Writes a snapshot of the whole session to the journal: the settings, which teams are in and out,
+the previous, current and next matches, the clock, and the stats of every team.
+'''
+def snapshot_session(journal, team_list, removed_teams, prev_sides, sides, next_sides, first_matches, time_remaining):
+    store = team_list[0].store
+    meta = {
+        'num_teams': len(team_list),
+        'num_sim_matches': team_list[0].store.num_sides,
+        'team_numbers': [team.team_number for team in team_list],
+        'removed_team_numbers': [team.team_number for team in removed_teams],
+        'prev_sides': match_pairs(prev_sides),
+        'sides': match_pairs(sides),
+        'next_sides': match_pairs(next_sides),
+        'first_matches': first_matches,
+        'time_remaining': time_remaining[0],
+        'epoch': store.epoch,
+        'size': store.size,
+    }
+    # the arrays are copied, as they're written to the disk in the background while the session carries on
+    arrays = {field: getattr(store, field)[:store.size].copy() for field in TeamStore.fields + ['sides']}
+    for matrix in ['pair_counts', 'played_epoch', 'prev_played_epoch']:
+        arrays[matrix] = getattr(store, matrix)[:store.size, :store.size].copy()
+    journal.snapshot(meta, arrays)
+
+
+'''
+Rebuilds the session saved in the journal in the given directory, by loading its last snapshot and replaying
+the rounds played since.
+Returns the Session, the previous, current and next matches, the time remaining and the sequence number of the last record,
+or None if there is no session to pick up.
+'''
+def load_session(directory):
+    import display_module
+    loaded = load_journal(directory)
+    if loaded is None:
+        return None
+    meta, arrays, records = loaded
+
+    # puts the stats back into a new store
+    size = meta['size']
+    store = TeamStore(arrays['sides'].shape[1], capacity=size)
+    for field in TeamStore.fields + ['sides']:
+        getattr(store, field)[:size] = arrays[field]
+    for matrix in ['pair_counts', 'played_epoch', 'prev_played_epoch']:
+        getattr(store, matrix)[:size, :size] = arrays[matrix]
+    store.size = size
+    store.epoch = meta['epoch']
+    store.slot_of = {int(store.team_numbers[slot]): slot for slot in range(size)}
+    teams_by_number = {number: Team(number, store, slot) for number, slot in store.slot_of.items()}
+    team_list = [teams_by_number[number] for number in meta['team_numbers']]
+    removed_teams = [teams_by_number[number] for number in meta['removed_team_numbers']]
+
+    def sides_from_pairs(pairs):
+        if not pairs:
+            return [''] * store.num_sides
+        return [Match(teams_by_number[number1], teams_by_number[number2]) for number1, number2 in pairs]
+
+    prev_sides = sides_from_pairs(meta['prev_sides'])
+    sides = sides_from_pairs(meta['sides'])
+    next_sides = sides_from_pairs(meta['next_sides'])
+    first_matches = meta['first_matches']
+    time_remaining = meta['time_remaining']
+    sequence = meta['sequence']
+
+    # replays everything which happened after the snapshot
+    for record in records:
+        if record['type'] == 'round':
+            store.epoch = record['epoch']
+            prev_sides = sides
+            sides = sides_from_pairs(record['sides'])
+            next_sides = sides_from_pairs(record['next_sides'])
+            update_teams(team_list, sides, add=True)
+            first_matches = first_matches and bool(numpy.any(store.matches_played[[team.slot for team in team_list]] == 0))
+            time_remaining = display_module.game_time
+        elif record['type'] == 'clock':
+            time_remaining = record['time_remaining']
+        sequence = record['sequence']
+
+    session = Session(len(team_list), store.num_sides)
+    session.use_teams(team_list, removed_teams, first_matches)
+    return session, prev_sides, sides, next_sides, [time_remaining], sequence
+
+
+'''
+Main function where most of the action happens.
+session is the Session to play, which holds the teams and the number of pads (and keeps the fairness statistics and
+telemetry up to date as it goes on, so that they can be exported at any time).
+resumed is the rest of what load_session gives back (the previous, current and next matches, the time remaining and the
+sequence number of the journal) if the session was picked up from the journal, or None to start the session.
+'''
+def main(session, resumed=None):
+    import display_module
+    display_module.init_display()
+    # every round played is kept in the history so that it can be undone
+    history = RoundHistory()
+    # everything that happens is written to the journal, so that the session can be picked up again if the program closes
+    journal = SessionJournal(journal_directory)
+
     # sets up the initial variables
-    team_list = init_teams()
-    prev_sides = ['', '', '']
-    removed_teams = []
-    matches = make_match(team_list, first_matches=True)
-    sides = even_sides(matches)
-    update_teams(team_list, sides, add=True)
-    next_matches = make_match(team_list, first_matches=True)
-    next_sides = even_sides(next_matches)
+    team_list = session.team_list
+    removed_teams = session.removed_teams
+    store = session.store
+    first_matches = session.first_matches
+    if resumed is None:
+        prev_sides = [''] * store.num_sides
+        epoch = store.epoch
+        matches = make_match(team_list, first_matches, session.match_building)
+        sides = even_sides(matches, session.side_allocation)
+        first_matches = history.record(team_list, sides, first_matches, epoch)
+        next_sides = None
+        time_remaining = [display_module.game_time]
+        journal.start()
+        journal.clear()
+    else:
+        prev_sides, sides, next_sides, time_remaining, sequence = resumed
+        journal.start(sequence)
     quit = False
-    first_matches = True
-    timer_running = [False]
-    time_remaining = [display_module.game_time]
-    background_group, button_group = display_module.create_sprites(num_teams, num_sim_matches)
-    game_timer = threading.Thread(target=display_module.clock, args=(timer_running, time_remaining,))
+
+    # the upcoming rounds are planned in the background while the games are being played
+    planner = SchedulePlanner(match_building=session.match_building, side_allocation=session.side_allocation)
+    planner.start()
+    planner.replan(team_list, first_matches, next_sides)
+    next_sides = planner.next_sides()
+    # the clock for the matches, which carries on from the time remaining if the session was picked up from the journal
+    timer = display_module.MatchTimer(time_remaining[0])
+    last_clock_record = time.monotonic()
+
+    # writes a snapshot of the session to the journal
+    def save_snapshot():
+        snapshot_session(journal, team_list, removed_teams, prev_sides, sides, next_sides, first_matches, time_remaining)
+    save_snapshot()
+    rounds_since_snapshot = 0
+
+    # mirrors the matches and the clock to the scoreboard server, for phones and other screens around the rink
+    scoreboard_server = None
+    if scoreboard_port is not None:
+        from scoreboard import ScoreboardServer
+        scoreboard_server = ScoreboardServer(scoreboard_host, scoreboard_port)
+        if not scoreboard_server.start():
+            print('The scoreboard server could not be started:', scoreboard_server.error)
+            scoreboard_server = None
+
+    # also publishes the state into shared memory, where the projector scoreboard (a separate process) reads it
+    state_writer = None
+    if state_channel_name is not None:
+        from state_channel import StateWriter
+        try:
+            state_writer = StateWriter(state_channel_name)
+        except OSError as error:
+            print('The session state could not be shared:', error)
+
+    # sends the latest matches and clock to the scoreboards (only the values which have changed are passed on to the viewers)
+    def publish_scoreboard():
+        if state_writer is not None:
+            state_writer.publish(pad_pairs(sides), pad_pairs(next_sides), timer.remaining(), timer.running(), len(team_list))
+        if scoreboard_server is not None:
+            scoreboard_server.publish({
+                'sides': match_pairs(sides),
+                'next_sides': match_pairs(next_sides),
+                'time_remaining': round(time_remaining[0]),
+                'running': timer.running(),
+                'num_teams': len(team_list),
+                'num_sim_matches': store.num_sides,
+            })
+
+    background_group, button_group = display_module.create_sprites(len(team_list), store.num_sides)
 
     # loops while the user hasn't quit the program
     while not quit:
         # updates the display
         display_module.draw_screen(prev_sides, sides, next_sides, background_group, button_group)
+        publish_scoreboard()
 
-        # loops until the game has ended, either by the timer running out or the user skipping the next game
+        # loops until the game has ended, either by the timer running out or the user skipping the next game.
+        # Rather than going round as fast as it can, the loop waits for the user to do something (or for the timer to tick,
+        # while it's running), and the screen is only drawn again when something on it has changed.
+        needs_drawing = False
+        update_clock(background_group, time_remaining)
         while time_remaining[0] > 0:
-            # starts the clock if it isn't running but is meant to be
-            if timer_running[0] and not game_timer.is_alive():
-                game_timer = threading.Thread(target=display_module.clock, args=(timer_running, time_remaining,))
-                game_timer.start()
+            # updates the display, with the clock only being drawn again when the second shown on it changes
+            if timer.second_changed():
+                update_clock(background_group, time_remaining)
+                needs_drawing = True
+            if needs_drawing:
+                display_module.draw_screen(prev_sides, sides, next_sides, background_group, button_group)
+                publish_scoreboard()
+                needs_drawing = False
 
-            # updates the display
-            update_clock(background_group, time_remaining)
-            display_module.draw_screen(prev_sides, sides, next_sides, background_group, button_group)
+            # keeps the journal up to date with the clock, so that it can carry on from about the same time
+            if timer.running() and time.monotonic() - last_clock_record > clock_journal_interval:
+                journal.append('clock', time_remaining=time_remaining[0])
+                last_clock_record = time.monotonic()
 
-            # checks if a button has been clicked
-            button_clicked = display_module.get_button_click(button_group)
+            # waits for a button to be clicked or the timer to tick
+            button_clicked, needs_drawing = display_module.wait_for_button_click(button_group)
+            time_remaining[0] = timer.remaining()
             if button_clicked:
                 # the display of the buttons can change when they are clicked, so we need to draw the screen again before anything else is executed
                 display_module.draw_screen(prev_sides, sides, next_sides, background_group, button_group)
+                publish_scoreboard()
                 # play button sets the timer running or pauses it, depending on whether it's currently running
                 if button_clicked == 'play':
-                    if timer_running[0]:
-                        timer_running[0] = False
+                    if timer.running():
+                        timer.pause()
                         for button in button_group:
                             if button.name == 'play':
                                 button.change_image('play')
                     else:
-                        timer_running[0] = True
+                        timer.start()
                         for button in button_group:
                             if button.name == 'play':
                                 button.change_image('pause')
+                    time_remaining[0] = timer.remaining()
+                    journal.append('clock', time_remaining=time_remaining[0])
+                    last_clock_record = time.monotonic()
                 # skip button stops the timer from running and sets it to 0
                 elif button_clicked == 'skip':
-                    timer_running[0] = False
+                    timer.reset(0)
                     time_remaining[0] = 0
                 # change button allows the user to change the number of teams and sides
                 elif button_clicked == 'change':
-                    # allows the user to change the number of teams and sides
-                    sides, next_sides, quit = change_team_num(team_list, sides, next_sides, removed_teams, time_remaining)
+                    # allows the user to change the number of teams and sides, after which the upcoming rounds are planned again
+                    planner.invalidate()
+                    old_sides = sides
+                    old_teams = ([team.team_number for team in team_list], store.num_sides)
+                    sides, next_sides, quit = change_team_num(session, sides, next_sides, time_remaining)
+                    if sides is not old_sides:
+                        first_matches = history.amend(team_list, sides, first_matches)
+                    if ([team.team_number for team in team_list], store.num_sides) != old_teams:
+                        history.teams_changed()
+                    else:
+                        history.clear_redo()
+                    planner.replan(team_list, first_matches, next_sides)
+                    save_snapshot()
 
                     # the text displaying the number of matches and teams is given by pygame sprites, which now need to be repaced with the new text
-                    new_sprites = display_module.get_team_and_match_sprites(num_teams, num_sim_matches)
+                    new_sprites = display_module.get_team_and_match_sprites(len(team_list), store.num_sides)
                     for item in background_group:
                         if item.name == 'matches' or item.name == 'teams' or item.name == 'change':
                             background_group.remove(item)
@@ -616,37 +1958,85 @@ def main():
                     # checks the user intended to restart the program
                     answer = display_module.draw_question_box(['Are you sure', 'you want to restart?'], ['Yes', 'No'])
                     if answer == 'Yes':
+                        planner.stop()
+                        if scoreboard_server is not None:
+                            scoreboard_server.stop()
+                        if state_writer is not None:
+                            state_writer.close()
+                        # the session has been finished with, so it shouldn't be picked up again
+                        journal.clear()
+                        journal.close()
                         return False
                     elif answer == 'quit':
                         quit = True
                 # allows the user to change the teams currently playing
                 elif button_clicked == 'change match':
-                    sides, next_sides, quit = change_match(sides, next_sides, team_list, time_remaining)
+                    planner.invalidate()
+                    old_sides = sides
+                    sides, next_sides, quit = change_match(session, sides, next_sides, time_remaining)
+                    if sides is not old_sides:
+                        first_matches = history.amend(team_list, sides, first_matches)
+                    history.clear_redo()
+                    planner.replan(team_list, first_matches, next_sides)
+                    save_snapshot()
+                # undo button goes back to the previous set of matches, with the undone matches coming up next.
+                # Playing on through the undone rounds without changing them redoes them from the history.
+                elif button_clicked == 'undo' and history.can_undo():
+                    timer.reset()
+                    time_remaining[0] = timer.remaining()
+                    for button in button_group:
+                        if button.name == 'play':
+                            button.change_image('play')
+
+                    planner.invalidate()
+                    next_sides = sides
+                    first_matches = history.undo(store)
+                    all_teams = team_list + removed_teams
+                    sides = history.round_sides(all_teams)
+                    prev_sides = history.round_sides(all_teams, offset=1)
+                    planner.replan(team_list, first_matches, next_sides, history.redo_epoch())
+                    save_snapshot()
                 # if the user quits, quits the program
                 if button_clicked == 'quit' or quit:
                     answer = display_module.draw_question_box(['Are you sure', 'you want to quit?'], ['Yes', 'No'])
                     if answer == 'Yes' or answer == 'quit':
+                        planner.stop()
+                        if scoreboard_server is not None:
+                            scoreboard_server.stop()
+                        if state_writer is not None:
+                            state_writer.close()
+                        journal.append('clock', time_remaining=time_remaining[0])
+                        journal.close()
                         print_stats(team_list, removed_teams)
+                        store.metrics.export_json(store, fairness_json_path)
+                        store.metrics.export_csv(store, fairness_csv_path)
+                        session.telemetry.print_summary()
+                        if memoize_rounds:
+                            round_cache.print_stats()
+                        instruments.print_summary()
+                        instruments.dump(instrumentation_path)
                         return True
 
         # updates all the values after a match has taken place
         update_clock(background_group, time_remaining)
-        time_remaining[0] = display_module.game_time
-        timer_running[0] = False
+        timer.reset()
+        time_remaining[0] = timer.remaining()
         prev_sides = sides
         sides = next_sides
-        update_teams(team_list, sides, add=True)
-
-        # makes the teams play the first matches in order
-        if first_matches:
-            first_matches = False
-            for team in team_list:
-                if team.matches_played == 0:
-                    first_matches = True
-                    break
-
-        matches = make_match(team_list, first_matches)
-        next_sides = even_sides(matches)
+        # the next set of matches has already been planned, so it doesn't need to be made now
+        with instruments.timed('next_round'):
+            # the epoch before the round, which advance moves on if every team was allowed to play every other team again while planning it
+            epoch = store.epoch
+            next_sides = planner.advance(store)
+            # adds the round to the history, which also keeps making the teams play the first matches in order until they've all played
+            first_matches = history.play(team_list, sides, first_matches, epoch)
+
+        # writes the round to the journal, with a full snapshot every so often so that there's never much to replay
+        journal.append('round', sides=match_pairs(sides), next_sides=match_pairs(next_sides), epoch=store.epoch)
+        rounds_since_snapshot += 1
+        if rounds_since_snapshot >= snapshot_rounds:
+            save_snapshot()
+            rounds_since_snapshot = 0
 
         # resets the play/pause button to the play image
         for button in button_group:
@@ -663,10 +2053,26 @@ def main():
 
 # calls the main function
 if __name__ == '__main__':
+    import display_module
+    # starts decoding the images in the background before the window is made, so that they're ready for the menu
+    display_module.asset_cache.preload()
+    display_module.init_display()
     quit_code = False
     while not quit_code:
-        num_teams, num_sim_matches, quit_code = display_module.menu()
-        if not quit_code:
-            quit_code = main()
+        # offers to carry on with the last session if it was never finished
+        loaded = None
+        if load_journal(journal_directory) is not None:
+            answer = display_module.draw_question_box(['Do you want to carry on', 'with the last session?'], ['Yes', 'No'])
+            if answer == 'quit':
+                break
+            elif answer == 'Yes':
+                loaded = load_session(journal_directory)
+
+        if loaded is not None:
+            quit_code = main(loaded[0], loaded[1:])
+        else:
+            num_teams, num_sim_matches, quit_code = display_module.menu()
+            if not quit_code:
+                quit_code = main(Session(num_teams, num_sim_matches))
  
 
@@ -0,0 +1,116 @@
+import itertools
+import numpy
+
+# largest number of rows (and columns) which solve_assignment tries every assignment for, rather than using the Hungarian
+# algorithm. Up to 5 (120 assignments) that takes a few microseconds, but it grows with the factorial of the size.
+brute_force_size = 5
+# every ordering of the columns for each size solved by trying every assignment, made the first time each size is solved
+permutations = {}
+
+'''
+Solves the assignment problem: given a cost matrix with a row for each thing to be assigned (e.g. matches) and a column
+for each place it can go (e.g. pads), finds the column for each row so that the total cost is as small as possible,
+with no two rows given the same column. There must be at least as many columns as rows.
+
+This is the Hungarian algorithm in its shortest augmenting path form. Rows are added one at a time and each new row
+is given a column by finding the cheapest path of reassignments to a free column, using the potentials u and v
+to keep all of the reduced costs non-negative. The inner loop over the columns is done with numpy,
+so it takes O(rows^2 * columns) operations, but only O(rows^2) steps of python.
+
+Small square problems (up to brute_force_size rows) are solved by solve_small_assignment instead, which is much quicker
+for the few pads most rinks have.
+
+Returns a list holding the column given to each row.
+'''
+def solve_assignment(cost):
+    cost = numpy.asarray(cost, dtype=float)
+    num_rows, num_columns = cost.shape
+    if num_rows > num_columns:
+        raise ValueError('The cost matrix needs at least as many columns as rows')
+    if num_rows == num_columns and num_rows <= brute_force_size:
+        return solve_small_assignment(cost)
+
+    # column 0 is a dummy column used as the start of each path, so the real columns are numbered from 1
+    u = numpy.zeros(num_rows + 1)
+    v = numpy.zeros(num_columns + 1)
+    # row_in_column[j] is the row assigned to column j (rows are also numbered from 1, 0 means the column is free)
+    row_in_column = numpy.zeros(num_columns + 1, dtype=numpy.int64)
+    way = numpy.zeros(num_columns + 1, dtype=numpy.int64)
+
+    # warm start: setting each column's potential to its cheapest cost makes the reduced cost of those entries 0, so each row
+    # can be given straight away any free column where its cost is the cheapest, and only the rows left over need a path search.
+    # When there are more columns than rows, the columns which end up free must keep a potential of 0, so each row's potential
+    # is set to its cheapest cost instead, which does the same thing from the other side.
+    if num_rows == num_columns:
+        v[1:] = cost.min(axis=0)
+        tight = cost == v[1:]
+    else:
+        u[1:] = cost.min(axis=1)
+        tight = cost == u[1:, None]
+    # goes through the tight entries a row at a time (nonzero gives them in order), giving each row the first one that's free
+    row_assigned = [False] * (num_rows + 1)
+    column_taken = [False] * (num_columns + 1)
+    tight_rows, tight_columns = numpy.nonzero(tight)
+    for row, column in zip((tight_rows + 1).tolist(), (tight_columns + 1).tolist()):
+        if not row_assigned[row] and not column_taken[column]:
+            row_in_column[column] = row
+            row_assigned[row] = True
+            column_taken[column] = True
+    unassigned_rows = [row for row in range(1, num_rows + 1) if not row_assigned[row]]
+
+    for row in unassigned_rows:
+        row_in_column[0] = row
+        column = 0
+        min_reduced_cost = numpy.full(num_columns + 1, numpy.inf)
+        used = numpy.zeros(num_columns + 1, dtype=bool)
+
+        # grows the tree of reassignments from the new row until it reaches a free column
+        while True:
+            used[column] = True
+            current_row = row_in_column[column]
+            reduced_cost = cost[current_row - 1] - u[current_row] - v[1:]
+            improved = ~used[1:] & (reduced_cost < min_reduced_cost[1:])
+            min_reduced_cost[1:][improved] = reduced_cost[improved]
+            way[1:][improved] = column
+
+            # finds the cheapest column not yet in the tree
+            candidates = numpy.where(used[1:], numpy.inf, min_reduced_cost[1:])
+            next_column = int(numpy.argmin(candidates)) + 1
+            delta = candidates[next_column - 1]
+
+            # updates the potentials so that the reduced cost of the path to next_column becomes 0
+            u[row_in_column[used]] += delta
+            v[used] -= delta
+            min_reduced_cost[~used] -= delta
+
+            column = next_column
+            if row_in_column[column] == 0:
+                break
+
+        # moves the assignments along the path, which gives the new row a column
+        while column:
+            previous_column = way[column]
+            row_in_column[column] = row_in_column[previous_column]
+            column = previous_column
+
+    columns = [0] * num_rows
+    for column in range(1, num_columns + 1):
+        if row_in_column[column]:
+            columns[row_in_column[column] - 1] = column - 1
+    return columns
+
+
+'''
+Solves the assignment problem for a square cost matrix by adding up the cost of every possible assignment at once with numpy
+and picking the cheapest. When several assignments are equally cheap, the first of them in lexicographic order is returned.
+Returns a list holding the column given to each row, like solve_assignment.
+'''
+def solve_small_assignment(cost):
+    cost = numpy.asarray(cost, dtype=float)
+    size = len(cost)
+    orderings = permutations.get(size)
+    if orderings is None:
+        orderings = numpy.array(list(itertools.permutations(range(size))), dtype=numpy.int64).reshape(-1, size)
+        permutations[size] = orderings
+    totals = cost[numpy.arange(size), orderings].sum(axis=1)
+    return orderings[int(numpy.argmin(totals))].tolist()
@@ -0,0 +1,294 @@
+import argparse
+import json
+import platform
+import random
+import time
+import tracemalloc
+import numpy
+
+import Alts_code
+from round_cache import round_cache
+
+'''
+Benchmarks for the scheduling functions (init_teams, make_match, even_sides and update_teams).
+Each cell of the grid is a number of teams and a number of pads. For each cell a session is played for a set number
+of rounds, timing every call, and then a shorter session is played again with tracemalloc on to count the allocations
+(tracemalloc slows everything down, so the timings and the allocations are measured separately).
+
+The results can be saved as a JSON baseline and compared against later, so that slowdowns between revisions show up as numbers.
+'''
+
+team_counts = [6, 10, 15, 25, 50, 100, 250, 500]
+pad_counts = [1, 2, 3, 5, 10, 20]
+functions = ['init_teams', 'make_match', 'even_sides', 'update_teams']
+# league sizes the scaling benchmark runs through, each with a pad for every teams_per_pad teams (so 500 teams have 50 pads)
+scaling_team_counts = [20, 50, 100, 200, 300, 400, 500]
+teams_per_pad = 10
+# longest a round can take to make (make_match and even_sides) in a big league, in milliseconds
+round_budget_ms = 10
+
+
+'''
+Sets the scheduler up for a session with the given number of teams and pads and returns the team list,
+along with how long init_teams took
+'''
+def start_session(num_teams, num_sim_matches, seed):
+    random.seed(seed)
+    start_time = time.perf_counter()
+    team_list = Alts_code.init_teams(num_teams, num_sim_matches)
+    return team_list, time.perf_counter() - start_time
+
+
+'''
+Plays one round, returning the time taken by each of the functions and make_match's report of how the round was made
+'''
+def timed_round(team_list, first_matches):
+    times = {}
+    report = {}
+    start_time = time.perf_counter()
+    matches = Alts_code.make_match(team_list, first_matches, report=report)
+    times['make_match'] = time.perf_counter() - start_time
+
+    start_time = time.perf_counter()
+    sides = Alts_code.even_sides(matches)
+    times['even_sides'] = time.perf_counter() - start_time
+
+    start_time = time.perf_counter()
+    Alts_code.update_teams(team_list, sides, add=True)
+    times['update_teams'] = time.perf_counter() - start_time
+    return times, report
+
+
+'''
+Times a session of the given size, returning the percentiles of each function's time (in microseconds)
+and the number of retries make_match needed
+'''
+def time_cell(num_teams, num_sim_matches, rounds, seed):
+    # each cell starts with an empty round cache, so that it doesn't get the solutions of the cells before it
+    round_cache.clear()
+    times = {name: [] for name in functions}
+    retries = []
+    relaxations = []
+    for i in range(rounds):
+        # init_teams is only called once per session, so it gets timed on a fresh session each round
+        team_list, init_time = start_session(num_teams, num_sim_matches, seed + i)
+        times['init_teams'].append(init_time)
+
+    team_list, init_time = start_session(num_teams, num_sim_matches, seed)
+    for i in range(rounds):
+        round_times, report = timed_round(team_list, first_matches=(i == 0))
+        for name, round_time in round_times.items():
+            times[name].append(round_time)
+        retries.append(report['attempts'])
+        relaxations.append(len(report['relaxations']))
+
+    result = {
+        'latency_us': {},
+        'retries': {'mean': float(numpy.mean(retries)), 'max': int(max(retries))},
+        'relaxations': {'mean': float(numpy.mean(relaxations)), 'max': int(max(relaxations))},
+    }
+    for name in functions:
+        values = numpy.array(times[name]) * 1e6
+        result['latency_us'][name] = {
+            'p50': float(numpy.percentile(values, 50)),
+            'p90': float(numpy.percentile(values, 90)),
+            'p99': float(numpy.percentile(values, 99)),
+            'max': float(values.max()),
+        }
+    return result
+
+
+'''
+Counts the memory allocated by each function over a session of the given size.
+Returns the mean number of allocated blocks and the mean peak number of bytes per call.
+'''
+def measure_allocations(num_teams, num_sim_matches, rounds, seed):
+    blocks = {name: [] for name in functions}
+    peaks = {name: [] for name in functions}
+
+    def measure(name, function, *args):
+        tracemalloc.start()
+        tracemalloc.reset_peak()
+        before = tracemalloc.take_snapshot()
+        result = function(*args)
+        after = tracemalloc.take_snapshot()
+        peaks[name].append(tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+        blocks[name].append(sum(stat.count_diff for stat in after.compare_to(before, 'filename') if stat.count_diff > 0))
+        return result
+
+    random.seed(seed)
+    round_cache.clear()
+    team_list = measure('init_teams', Alts_code.init_teams, num_teams, num_sim_matches)
+    for i in range(rounds):
+        matches = measure('make_match', Alts_code.make_match, team_list, i == 0)
+        sides = measure('even_sides', Alts_code.even_sides, matches)
+        measure('update_teams', Alts_code.update_teams, team_list, sides, True)
+
+    return {name: {'blocks': float(numpy.mean(blocks[name])), 'peak_bytes': float(numpy.mean(peaks[name]))} for name in functions}
+
+
+'''
+Runs the whole grid, skipping the cells that don't have enough teams to fill every pad
+'''
+def run_grid(team_counts, pad_counts, rounds, allocation_rounds, seed):
+    results = {}
+    for num_teams in team_counts:
+        for num_sim_matches in pad_counts:
+            if 2 * num_sim_matches > num_teams:
+                continue
+            cell = time_cell(num_teams, num_sim_matches, rounds, seed)
+            if allocation_rounds:
+                cell['allocations'] = measure_allocations(num_teams, num_sim_matches, allocation_rounds, seed)
+            results[str(num_teams) + 'x' + str(num_sim_matches)] = cell
+            print_cell(str(num_teams) + ' teams, ' + str(num_sim_matches) + ' pads', cell)
+    return results
+
+
+def print_cell(label, cell):
+    line = label.ljust(22)
+    for name in functions:
+        latency = cell['latency_us'][name]
+        line += name + ' p50 ' + str(round(latency['p50'], 1)) + ' p99 ' + str(round(latency['p99'], 1)) + 'us  '
+    line += 'retries ' + str(round(cell['retries']['mean'], 2)) + ' (max ' + str(cell['retries']['max']) + ')  '
+    line += 'relaxations ' + str(round(cell['relaxations']['mean'], 2)) + ' (max ' + str(cell['relaxations']['max']) + ')'
+    print(line)
+
+
+'''
+Times how long it takes to make a round (make_match and even_sides together, which is what the user waits for when a game
+ends) as the league grows, with a pad for every teams_per_pad teams. Each size plays a session with teams being added
+and removed part way through, like a real event. Returns the percentiles of the round time at each size in milliseconds.
+memoize_rounds: whether the round cache is used. It's off by default, so that every round is solved from scratch, which is
+                the worst case round_budget_ms is for.
+'''
+def scaling_curve(team_counts, rounds, seed, memoize_rounds=False):
+    curve = {}
+    old_memoize_rounds = Alts_code.memoize_rounds
+    Alts_code.memoize_rounds = memoize_rounds
+    for num_teams in team_counts:
+        round_cache.clear()
+        num_sim_matches = max(num_teams // teams_per_pad, 1)
+        session = Alts_code.Session(num_teams, num_sim_matches, seed=seed)
+        rng = random.Random(seed)
+        round_times = []
+        for i in range(rounds):
+            if i % 10 == 5:
+                session.remove_team(rng.choice(session.team_list).team_number)
+                session.add_team()
+            start_time = time.perf_counter()
+            sides = session.make_round()
+            round_times.append(time.perf_counter() - start_time)
+            session.play_round(sides)
+        values = numpy.array(round_times) * 1000
+        curve[num_teams] = {
+            'pads': num_sim_matches,
+            'p50': float(numpy.percentile(values, 50)),
+            'p99': float(numpy.percentile(values, 99)),
+            'max': float(values.max()),
+        }
+        print((str(num_teams) + ' teams, ' + str(num_sim_matches) + ' pads').ljust(22) + ' '.join(key + ' ' + str(round(value, 3)) + 'ms' for key, value in curve[num_teams].items() if key != 'pads'))
+    Alts_code.memoize_rounds = old_memoize_rounds
+    return curve
+
+
+# returns how fast the median round time grows with the number of teams, as the power of the number of teams it goes up with
+# (the slope of a straight line through the curve on a log-log plot, so 1 means twice the teams takes twice as long)
+def scaling_exponent(curve):
+    sizes = sorted(curve)
+    return float(numpy.polyfit(numpy.log(sizes), numpy.log([curve[size]['p50'] for size in sizes]), 1)[0])
+
+
+'''
+Compares the results with a saved baseline, printing the ratio of the median times for each cell and function.
+Returns a list of the (cell, function, ratio) for any which got slower by more than the threshold.
+'''
+def compare(results, baseline, threshold):
+    regressions = []
+    for cell_name, cell in results.items():
+        if cell_name not in baseline['results']:
+            continue
+        line = cell_name.ljust(10)
+        for name in functions:
+            old = baseline['results'][cell_name]['latency_us'][name]['p50']
+            ratio = cell['latency_us'][name]['p50'] / old if old else 1.0
+            line += name + ' x' + str(round(ratio, 2)) + '  '
+            if ratio > 1 + threshold:
+                regressions.append((cell_name, name, ratio))
+        print(line)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmarks the scheduling functions over a grid of team and pad counts.')
+    parser.add_argument('--teams', type=int, nargs='+', default=team_counts, help='team counts to benchmark')
+    parser.add_argument('--pads', type=int, nargs='+', default=pad_counts, help='pad counts to benchmark')
+    parser.add_argument('--rounds', type=int, default=50, help='number of rounds timed per cell')
+    parser.add_argument('--allocation-rounds', type=int, default=5, help='number of rounds traced for allocations (0 to skip)')
+    parser.add_argument('--side-allocation', choices=['optimal', 'greedy'], default='optimal', help='how even_sides gives out the pads')
+    parser.add_argument('--match-building', choices=['matching', 'greedy'], default='matching', help='how make_match pairs up the teams')
+    parser.add_argument('--seed', type=int, default=0, help='seed for the random tiebreaks')
+    parser.add_argument('--round-cache', action='store_true', help='keep the solutions of the rounds in the round cache')
+    parser.add_argument('--save', help='file to save the results to as a JSON baseline')
+    parser.add_argument('--compare', help='JSON baseline to compare the results against')
+    parser.add_argument('--threshold', type=float, default=0.2, help='fractional slowdown in the median that counts as a regression')
+    parser.add_argument('--scaling', action='store_true', help='time the rounds of leagues from 20 teams on 2 pads up to 500 teams on 50 pads instead of the grid, '
+                                                                'with the round cache off (and then on as well with --round-cache), '
+                                                                'failing if the 99th percentile round time at any size is over ' + str(round_budget_ms) + 'ms')
+    args = parser.parse_args()
+    Alts_code.side_allocation = args.side_allocation
+    Alts_code.match_building = args.match_building
+    Alts_code.memoize_rounds = args.round_cache
+
+    if args.scaling:
+        # the budget is for rounds solved from scratch, so the rounds are timed with the round cache off first,
+        # and then with it on as well if it's asked for, to show how much it saves
+        print('Round cache off:')
+        curve = scaling_curve(scaling_team_counts, args.rounds, args.seed)
+        exponent = scaling_exponent(curve)
+        print('Round time grows with the number of teams to the power of ' + str(round(exponent, 2)))
+        curves = [curve]
+        cached_curve = None
+        if args.round_cache:
+            print('Round cache on:')
+            cached_curve = scaling_curve(scaling_team_counts, args.rounds, args.seed, memoize_rounds=True)
+            curves.append(cached_curve)
+        if args.save:
+            with open(args.save, 'w') as file:
+                json.dump({'python': platform.python_version(), 'machine': platform.machine(), 'rounds': args.rounds, 'seed': args.seed,
+                           'match_building': args.match_building, 'side_allocation': args.side_allocation,
+                           'curve': curve, 'exponent': exponent, 'cached_curve': cached_curve}, file, indent=2)
+        over_budget = sorted({num_teams for times_by_size in curves for num_teams, times in times_by_size.items() if times['p99'] > round_budget_ms})
+        if over_budget:
+            print('Over the ' + str(round_budget_ms) + 'ms budget at ' + ', '.join(str(num_teams) + ' teams' for num_teams in over_budget))
+            raise SystemExit(1)
+        return
+
+    results = run_grid(args.teams, args.pads, args.rounds, args.allocation_rounds, args.seed)
+
+    if args.save:
+        with open(args.save, 'w') as file:
+            json.dump({
+                'python': platform.python_version(),
+                'machine': platform.machine(),
+                'rounds': args.rounds,
+                'seed': args.seed,
+                'side_allocation': args.side_allocation,
+                'match_building': args.match_building,
+                'results': results,
+            }, file, indent=2)
+
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)
+        print()
+        print('Compared with ' + args.compare + ':')
+        regressions = compare(results, baseline, args.threshold)
+        for cell_name, name, ratio in regressions:
+            print('Regression: ' + name + ' at ' + cell_name + ' is ' + str(round(ratio, 2)) + 'x slower')
+        if regressions:
+            raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
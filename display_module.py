@@ -3,6 +3,9 @@ from pygame import freetype
 import os
 import time
 import copy
+import threading
+from lru import LRUCache
+from instrumentation import instruments
 
 screen_width = 1400
 screen_height = 700
@@ -20,15 +23,216 @@ highlight_colour = [150, 150, 205]
 
 game_time = 180
 
-# creates a pygame window in the center of the screen
-os.environ['SDL_VIDEO_CENTERED'] = '1'
-pygame.init()
-screen = pygame.display.set_mode([screen_width, screen_height])
-screen.fill(background_colour)
-pygame.display.set_caption("Alts")
+# the window's surface, which is only created when init_display is first called
+screen = None
+
+# event sent by pygame while the match timer is running, so that the main loop wakes up to update the clock
+TIMER_TICK = pygame.event.custom_type()
+# key which shows or hides the timings overlay
+overlay_key = pygame.K_F3
+# how much the arrows for the number of teams and pads change them by when shift is held down, for big leagues
+large_step = 10
+# most matches shown side by side in a round on the main screen, after which they wrap onto more lines
+max_matches_per_line = 10
 
 absolute_path = os.path.dirname(os.path.abspath(__file__))
 
+
+'''
+Starts pygame and creates a window in the center of the screen, returning its surface.
+The window is made the first time this is called rather than when the module is imported, so that the scheduler
+and the tools built on it can be used without opening a window. Calling it again just returns the same surface.
+headless: if True, SDL's dummy video driver is used, so everything is drawn to a surface in memory and nothing is shown
+(setting the SDL_VIDEODRIVER environment variable to 'dummy' before calling it does the same)
+'''
+def init_display(headless=False):
+    global screen
+    if screen is None:
+        if headless:
+            os.environ['SDL_VIDEODRIVER'] = 'dummy'
+        os.environ['SDL_VIDEO_CENTERED'] = '1'
+        pygame.init()
+        screen = pygame.display.set_mode([screen_width, screen_height])
+        screen.fill(background_colour)
+        pygame.display.set_caption("Alts")
+    return screen
+
+# most fonts kept loaded at once by the font cache
+font_cache_size = 32
+
+'''
+Cache of the fonts which have been loaded, shared by all of the text in the display.
+Looking a font up with SysFont is slow, and the same few fonts are used again and again (some of them every frame),
+so each font is only looked up the first time it's asked for. The fonts are kept in an LRUCache of at most max_size fonts.
+'''
+class FontCache():
+    def __init__(self, max_size=font_cache_size):
+        self.fonts = LRUCache(max_size)
+
+    def get(self, name, size, bold=False, italic=False):
+        key = (name, size, bool(bold), bool(italic))
+        font = self.fonts.get(key)
+        if font is None:
+            font = pygame.freetype.SysFont(name, size, bold=bold, italic=italic)
+            self.fonts.put(key, font)
+        return font
+
+    def stats(self):
+        return self.fonts.stats()
+
+font_cache = FontCache()
+
+
+# returns the font with the given name, size and style from the font cache
+def get_font(name, size, bold=False, italic=False):
+    return font_cache.get(name, size, bold, italic)
+
+
+# most pieces of rendered text kept at once by the text cache
+text_cache_size = 256
+
+'''
+Cache of text which has already been rendered, so that text which is drawn every frame (like the title and the matches)
+is only rendered the first time and just copied onto the screen after that.
+The surfaces are kept in an LRUCache of at most max_size surfaces.
+The surfaces are shared, so they must only ever be blitted and never drawn on.
+'''
+class TextCache():
+    def __init__(self, max_size=text_cache_size):
+        self.surfaces = LRUCache(max_size)
+
+    def get(self, text, font_name, size, colour, bold=False, italic=False):
+        key = (text, font_name, size, tuple(colour), bool(bold), bool(italic))
+        surface = self.surfaces.get(key)
+        if surface is None:
+            surface, rect = get_font(font_name, size, bold=bold, italic=italic).render(text, colour)
+            self.surfaces.put(key, surface)
+        return surface
+
+    def stats(self):
+        return self.surfaces.stats()
+
+text_cache = TextCache()
+
+
+# returns a surface with the given text rendered on it, from the text cache.
+# cache: if False, the text is rendered straight from the font and not kept, for text which is only drawn once in each colour
+# (like the menu as it fades in), so that it doesn't push the text which is drawn again and again out of the cache
+def render_text(text, font_name, size, colour, bold=False, italic=False, cache=True):
+    if not cache:
+        surface, rect = get_font(font_name, size, bold=bold, italic=italic).render(text, colour)
+        return surface
+    return text_cache.get(text, font_name, size, colour, bold, italic)
+
+
+'''
+The digits and colon for the clock, rendered once so that the time can be put together from them
+rather than rendering the text again each time it changes.
+Each character is kept with how far above the baseline its top is, how far it's shifted from the pen position,
+and how far the pen moves on after it, so that the text lines up in the same way as if it were rendered in one go.
+'''
+class DigitAtlas():
+    characters = '0123456789:'
+
+    def __init__(self, font_name, size, colour, bold=False):
+        font = get_font(font_name, size, bold=bold)
+        self.glyphs = {}
+        for character in self.characters:
+            surface, rect = font.render(character, colour)
+            advance = font.get_metrics(character)[0][4]
+            self.glyphs[character] = (surface, rect.x, rect.y, advance)
+        self.ascent = max(top for surface, left, top, advance in self.glyphs.values())
+        self.height = max(self.ascent - top + surface.get_height() for surface, left, top, advance in self.glyphs.values())
+
+    # width of the given text when it's drawn
+    def width(self, text):
+        return int(sum(self.glyphs[character][3] for character in text))
+
+    # draws the text onto the surface with its top left corner at x, y
+    def blit(self, surface, text, x, y):
+        pen_x = x
+        for character in text:
+            glyph, left, top, advance = self.glyphs[character]
+            surface.blit(glyph, (int(pen_x) + left, y + self.ascent - top))
+            pen_x += advance
+
+digit_atlases = {}
+
+
+# returns the digit atlas for the given font and colour, making it the first time it's asked for
+def get_digit_atlas(font_name, size, colour, bold=False):
+    key = (font_name, size, tuple(colour), bool(bold))
+    if key not in digit_atlases:
+        digit_atlases[key] = DigitAtlas(font_name, size, colour, bold)
+    return digit_atlases[key]
+
+
+'''
+Cache of the images in the package folder, so that each PNG is only read from the disk and decoded once,
+and each size it's scaled to is only scaled once (e.g. the play and pause images are swapped on every click of the play button).
+The images can be decoded on a background thread with preload while the window is being created, so that they're ready when needed.
+The surfaces are shared, so they must only ever be blitted and never drawn on.
+'''
+class AssetCache():
+    def __init__(self, directory):
+        self.directory = directory
+        self.lock = threading.Lock()
+        # the images as they were decoded from the files, and as they are once converted to the display's pixel format
+        self.decoded = {}
+        self.images = {}
+        self.scaled = {}
+        self.preload_thread = None
+
+    # returns the names of all of the images in the folder
+    def image_names(self):
+        return [file_name[:-4] for file_name in sorted(os.listdir(self.directory)) if file_name.endswith('.png')]
+
+    def decode(self, name):
+        with self.lock:
+            if name in self.decoded:
+                return self.decoded[name]
+        image = pygame.image.load(os.path.join(self.directory, name + '.png'))
+        with self.lock:
+            self.decoded.setdefault(name, image)
+            return self.decoded[name]
+
+    # decodes all of the images on a background thread
+    def preload(self):
+        if self.preload_thread is None:
+            self.preload_thread = threading.Thread(target=lambda: [self.decode(name) for name in self.image_names()], daemon=True)
+            self.preload_thread.start()
+
+    # waits until the images being decoded by preload are all ready, so that nothing else decodes the same image at the same time
+    def wait_for_preload(self):
+        if self.preload_thread is not None:
+            self.preload_thread.join()
+
+    # returns the image with the given name at its original size, converted to the display's pixel format so it can be blitted quickly
+    # (the conversion is done here, rather than when it's preloaded, as it has to be done on the same thread as the display).
+    # Until the display has been created the image can't be converted, so it's handed out as it was decoded and not kept,
+    # and it's converted and kept the first time it's asked for after that
+    def get_image(self, name):
+        image = self.images.get(name)
+        if image is None:
+            image = self.decode(name)
+            if pygame.display.get_surface() is None:
+                return image
+            image = image.convert_alpha()
+            self.images[name] = image
+        return image
+
+    # returns the image with the given name scaled to the given size (only kept once it's been converted for the display)
+    def get(self, name, width, height):
+        key = (name, width, height)
+        image = self.scaled.get(key)
+        if image is None:
+            image = pygame.transform.scale(self.get_image(name), [width, height])
+            if name in self.images:
+                self.scaled[key] = image
+        return image
+
+asset_cache = AssetCache(absolute_path)
+
 '''
 Parent class for many different objects which are rectangular and may have text in them
 
@@ -78,22 +282,19 @@ class RectangleSprite(pygame.sprite.Sprite):
             self.italic = italic
             self.text = text
             # creates a surface with the text on it
-            font = pygame.freetype.SysFont(font, font_size, bold=bold, italic=italic)
-            print_image, rect = font.render(text, font_colour)
+            print_image = render_text(text, font, font_size, font_colour, bold=bold, italic=italic)
 
             # sticks this surface to the image such that it is centralized
             text_width, text_height = print_image.get_size()
             self.image.blit(print_image, ((width - text_width)//2, (height - text_height)//2))
 
         if image:
-            button_image = pygame.image.load(absolute_path + '/' + image + '.png')
-            button_image = pygame.transform.scale(button_image, [width, height])
+            button_image = asset_cache.get(image, width, height)
             self.image.blit(button_image, (0, 0))
             self.image.set_colorkey(WHITE)
 
     def change_image(self, new_image):
-        button_image = pygame.image.load(absolute_path + '/' + new_image + '.png')
-        button_image = pygame.transform.scale(button_image, [self.width, self.height])
+        button_image = asset_cache.get(new_image, self.width, self.height)
         self.image.blit(button_image, (0, 0))
 
 
@@ -185,23 +386,32 @@ class Clock(RectangleSprite):
             seconds = str(round(time_remaining) % 60)
         return minutes + ':' + seconds
 
+    # draws the time remaining onto the clock, returning True if the text on the clock changed
     def update(self, time_remaining):
-        # creates a surface with the text on it
+        # the clock only needs drawing again if the text on it has changed
         text = self.get_text(time_remaining)
-        font = pygame.freetype.SysFont('Calibri', self.font_size, bold=True)
-        print_image, rect = font.render(text, BLACK)
+        if text == self.text:
+            return False
+        self.text = text
 
-        # sticks this surface to the image such that it is centralized
+        # puts the time together from the pre-rendered digits, in the middle of the clock
         self.image.fill(self.colour)
-        text_width, text_height = print_image.get_size()
-        self.image.blit(print_image, ((self.width - text_width)//2, (self.height - text_height)//2))
+        atlas = get_digit_atlas('Calibri', self.font_size, BLACK, bold=True)
+        if all(character in atlas.glyphs for character in text):
+            atlas.blit(self.image, text, (self.width - atlas.width(text))//2, (self.height - atlas.height)//2)
+        else:
+            print_image = render_text(text, 'Calibri', self.font_size, BLACK, bold=True)
+            text_width, text_height = print_image.get_size()
+            self.image.blit(print_image, ((self.width - text_width)//2, (self.height - text_height)//2))
+        return True
 
 
 # prints text to the screen
-def print_screen(text, x, y, size, colour, surface=screen, left_align=True, font_type="Calibri"):
+def print_screen(text, x, y, size, colour, surface=None, left_align=True, font_type="Calibri", cache=True):
+    if surface is None:
+        surface = screen
     # turns the text into a pygame surface
-    font = pygame.freetype.SysFont(font_type, size, True)
-    print_image, rect = font.render(text, colour)
+    print_image = render_text(text, font_type, size, colour, bold=True, cache=cache)
 
     # blits the new text surface onto the given surface and updates the screen
     if not left_align:
@@ -212,15 +422,50 @@ def print_screen(text, x, y, size, colour, surface=screen, left_align=True, font
     return print_image.get_size()
 
 
-def print_title(colour):
+# draws the timings in the bottom left corner of the surface if the overlay has been turned on (with overlay_key).
+# The timings change every frame, so they're rendered straight from the font rather than filling up the text cache.
+def draw_overlay(surface):
+    if not instruments.overlay:
+        return
+    font = get_font('Calibri', 13)
+    lines = instruments.summary_lines() or ['No timings yet']
+    line_height = 15
+    box_width = max(font.get_rect(line).width for line in lines) + 10
+    box_height = line_height * len(lines) + 10
+    y = surface.get_height() - box_height
+    pygame.draw.rect(surface, OXFORD_BLUE, [0, y, box_width, box_height])
+    for line in lines:
+        font.render_to(surface, (5, y + 5), line, WHITE)
+        y += line_height
+
+
+def print_title(colour, cache=True):
     title_size = 125
-    print_screen('ALTS', screen_width//2, screen_height*0.15, title_size, colour, left_align=False)
+    print_screen('ALTS', screen_width//2, screen_height*0.15, title_size, colour, left_align=False, cache=cache)
 
 
 def print_match_set(matches, y):
-    for i in range(len(matches)):
-        if matches[i]:
-            print_screen(str(matches[i].teams[0].team_number) + 'v' + str(matches[i].teams[1].team_number), (i + 1) * match_display_width//(len(matches) + 1) + (screen_width - match_display_width)//2, y, size=45, colour=text_colour, left_align=False)
+    if len(matches) <= max_matches_per_line:
+        for i in range(len(matches)):
+            if matches[i]:
+                print_screen(str(matches[i].teams[0].team_number) + 'v' + str(matches[i].teams[1].team_number), (i + 1) * match_display_width//(len(matches) + 1) + (screen_width - match_display_width)//2, y, size=45, colour=text_colour, left_align=False)
+        return
+
+    # big rounds are split over several smaller lines, which fit in the same space as one line of matches
+    num_lines = -(-len(matches) // max_matches_per_line)
+    line_height = screen_height * 0.14 / num_lines
+    size = int(min(45, line_height * 0.9))
+    for line in range(num_lines):
+        line_matches = matches[line * max_matches_per_line:(line + 1) * max_matches_per_line]
+        line_y = y + (line - (num_lines - 1) / 2) * line_height
+        for i in range(len(line_matches)):
+            if line_matches[i]:
+                print_screen(str(line_matches[i].teams[0].team_number) + 'v' + str(line_matches[i].teams[1].team_number), (i + 1) * match_display_width//(len(line_matches) + 1) + (screen_width - match_display_width)//2, line_y, size=size, colour=text_colour, left_align=False)
+
+
+# returns how much a click on one of the arrows changes its value by: 1, or large_step if shift is held down
+def arrow_step():
+    return large_step if pygame.key.get_mods() & pygame.KMOD_SHIFT else 1
 
 
 def get_team_and_match_sprites(num_teams, num_sides):
@@ -289,37 +534,65 @@ def create_sprites(num_teams, num_sides):
 
     return background_group, button_group
 
-# waits until a button is clicked and then returns the name of the button clicked.
-def get_button_click(button_group, down_click=False):
-    for event in pygame.event.get():
-        mouse_x, mouse_y = pygame.mouse.get_pos()
-        if (event.type == pygame.MOUSEBUTTONUP and not down_click) or (event.type == pygame.MOUSEBUTTONDOWN and down_click):
-            for button in button_group:
-                if button.is_clicked(mouse_x, mouse_y):
-                    button.unshow_highlights()
-                    return button.name
-
-        elif event.type == pygame.MOUSEBUTTONDOWN:
-            for button in button_group:
-                if button.is_clicked(mouse_x, mouse_y):
-                    button.show_highlights()
-
-        elif event.type == pygame.QUIT:
-            return 'quit'
-
-        # accounts for the fact that the user may move their mouse off the button while holding their mouse pressed down.
-        # in this case we need to remove the highlight from the first button to be clicked and add it to any the mouse proce
-        mouse_press = pygame.mouse.get_pressed()
-        button_down = False
-        for i in range(3):
-            if mouse_press[i]:
-                button_down = True
+# waits up to timeout milliseconds (or until there is an event if timeout is None) for the next event and deals with it.
+# Returns the name of the button clicked (None if no button was clicked) and whether the screen needs to be drawn again.
+# Only one event is taken at a time, so any clicks after it are left for the next call rather than being lost.
+def wait_for_button_click(button_group, timeout=None, down_click=False):
+    if timeout is None:
+        event = pygame.event.wait()
+    else:
+        event = pygame.event.wait(int(timeout))
+    if event.type == pygame.NOEVENT:
+        return None, False
+    received_time = time.perf_counter()
+    button_clicked, changed = handle_button_event(event, button_group, down_click)
+    instruments.record('handle_event', time.perf_counter() - received_time)
+    if changed:
+        instruments.input_received(received_time)
+    return button_clicked, changed
+
+
+# deals with a single event for the buttons, showing or hiding their highlights as the mouse is pressed and moved.
+# Returns the name of the button clicked (None if no button was clicked) and whether the screen needs to be drawn again.
+def handle_button_event(event, button_group, down_click=False):
+    mouse_x, mouse_y = pygame.mouse.get_pos()
+    if (event.type == pygame.MOUSEBUTTONUP and not down_click) or (event.type == pygame.MOUSEBUTTONDOWN and down_click):
         for button in button_group:
-            if button.highlights_on and not button.is_clicked(mouse_x, mouse_y):
+            if button.is_clicked(mouse_x, mouse_y):
                 button.unshow_highlights()
-            elif button_down and button.is_clicked(mouse_x, mouse_y):
+                return button.name, True
+
+    elif event.type == pygame.MOUSEBUTTONDOWN:
+        for button in button_group:
+            if button.is_clicked(mouse_x, mouse_y):
                 button.show_highlights()
 
+    elif event.type == pygame.QUIT:
+        return 'quit', True
+
+    elif event.type == pygame.KEYDOWN and event.key == overlay_key:
+        instruments.overlay = not instruments.overlay
+        return None, True
+
+    # accounts for the fact that the user may move their mouse off the button while holding their mouse pressed down.
+    # in this case we need to remove the highlight from the first button to be clicked and add it to any the mouse proce
+    mouse_press = pygame.mouse.get_pressed()
+    button_down = False
+    for i in range(3):
+        if mouse_press[i]:
+            button_down = True
+    # moving the mouse only changes the screen if it changes which button is highlighted (and ticks of the timer are
+    # checked separately by the main loop)
+    changed = event.type != pygame.MOUSEMOTION and event.type != TIMER_TICK
+    for button in button_group:
+        if button.highlights_on and not button.is_clicked(mouse_x, mouse_y):
+            button.unshow_highlights()
+            changed = True
+        elif button_down and button.is_clicked(mouse_x, mouse_y):
+            changed = changed or not button.highlights_on
+            button.show_highlights()
+    return None, changed
+
 
 # draws a display which shows a question with various possible answers, then returns the answer chosen
 def draw_question_box(question, answers):
@@ -383,13 +656,17 @@ def draw_question_box(question, answers):
     all_sprites.add(exit)
     buttons.add(exit)
 
-    # gets the answer clicked on
-    answer = False
+    # gets the answer clicked on, waiting for the user to do something and only drawing the box again when it has changed
+    answer = None
+    needs_drawing = True
     while not answer:
-        # draws everything to the screen
-        all_sprites.draw(screen)
-        pygame.display.update()
-        answer = get_button_click(buttons)
+        if needs_drawing:
+            with instruments.timed('question_box_frame'):
+                all_sprites.draw(screen)
+                draw_overlay(screen)
+                pygame.display.update()
+            instruments.frame_shown()
+        answer, needs_drawing = wait_for_button_click(buttons)
     return answer
 
 '''
@@ -463,13 +740,15 @@ def draw_arrow_box(params, param_min_max):
         return buttons
 
 
-    # allows the user to enter their values for each of the parameters
+    # allows the user to enter their values for each of the parameters, waiting for the user to do something rather than
+    # drawing the box again as fast as it can. The box is only drawn again from scratch when a value changes.
     quit = False
     exited = False
     finished = False
+    buttons = draw_screen()
     while not finished:
-        buttons = draw_screen()
-        button_clicked = get_button_click(buttons)
+        shown_params = dict(params)
+        button_clicked, needs_drawing = wait_for_button_click(buttons)
         if not button_clicked:
             pass
         elif button_clicked == 'quit':
@@ -484,11 +763,20 @@ def draw_arrow_box(params, param_min_max):
         elif button_clicked[-1] == 'u' and button_clicked[:-1] in params:
             param = button_clicked[:-1]
             if param_min_max[param][1] > params[param]:
-                params[param] += 1
+                params[param] = min(params[param] + arrow_step(), param_min_max[param][1])
         elif button_clicked[-1] == 'd' and button_clicked[:-1] in params:
             param = button_clicked[:-1]
             if param_min_max[param][0] < params[param]:
-                params[param] -= 1
+                params[param] = max(params[param] - arrow_step(), param_min_max[param][0])
+
+        if finished:
+            pass
+        elif params != shown_params:
+            buttons = draw_screen()
+        elif needs_drawing:
+            # only the highlights of the buttons have changed
+            buttons.draw(screen)
+            pygame.display.flip()
     return exited, quit
   
 
@@ -496,8 +784,11 @@ def draw_arrow_box(params, param_min_max):
 def get_match_change(sides, team_list, num_sim_matches):
     quit = False
     def draw_box():
-        all_sprites.draw(screen)
-        pygame.display.flip()
+        with instruments.timed('match_change_frame'):
+            all_sprites.draw(screen)
+            draw_overlay(screen)
+            pygame.display.flip()
+        instruments.frame_shown()
 
     # code for dragging a match button around
     def drag(button):
@@ -527,10 +818,12 @@ def get_match_change(sides, team_list, num_sim_matches):
                 button.rect.y = box_y + box_height//2 - button.height
             draw_box()
 
-            # checks if the mouse has been lifted
-            for event in pygame.event.get():
-                if event.type == pygame.MOUSEBUTTONUP:
-                    click_down = False
+            # waits for the mouse to move or be lifted, rather than drawing the box again as fast as it can
+            event = pygame.event.wait()
+            while event.type != pygame.MOUSEMOTION and event.type != pygame.MOUSEBUTTONUP:
+                event = pygame.event.wait()
+            if event.type == pygame.MOUSEBUTTONUP:
+                click_down = False
 
         return mouse_x, mouse_y
 
@@ -562,10 +855,8 @@ def get_match_change(sides, team_list, num_sim_matches):
         pygame.draw.rect(button2.image, button2.colour, [0, 0, width1, height1])
 
         # creates a surface with the text on it
-        font1 = pygame.freetype.SysFont(button1.font, font_size_2, bold=button1.bold, italic=button1.italic)
-        font2 = pygame.freetype.SysFont(button2.font, font_size_1, bold=button2.bold, italic=button2.italic)
-        print_image1, rect = font1.render(button1.text, button1.font_colour)
-        print_image2, rect = font2.render(button2.text, button2.font_colour)
+        print_image1 = render_text(button1.text, button1.font, font_size_2, button1.font_colour, bold=button1.bold, italic=button1.italic)
+        print_image2 = render_text(button2.text, button2.font, font_size_1, button2.font_colour, bold=button2.bold, italic=button2.italic)
 
         # sticks this surface to the image such that it is centralized
         text_width, text_height = print_image1.get_size()
@@ -714,10 +1005,13 @@ def get_match_change(sides, team_list, num_sim_matches):
     all_sprites.add(barrier_sprite_left, barrier_sprite_right, quote_sprite)
 
 
-    # allows the user to change the teams around until they save their work or exit
+    # allows the user to change the teams around until they save their work or exit.
+    # Waits for the user to do something, and only draws the box again when it has changed.
     answer = ''
+    needs_drawing = True
     while not (answer == 'exit' or answer == 'quit' or answer == 'SAVE'):
-        draw_box()
+        if needs_drawing:
+            draw_box()
         if answer:
             for button1 in buttons:
                 if button1.name == answer:
@@ -739,25 +1033,24 @@ def get_match_change(sides, team_list, num_sim_matches):
                         button1.rect.x = original_x
                         button1.rect.y = original_y
                     break
+            draw_box()
 
-        answer = get_button_click(buttons, down_click=True)#, exceptions=['exit', 'quit', 'SAVE'])
+        answer, needs_drawing = wait_for_button_click(buttons, down_click=True)
         
         # when the user saves their answers, checks for games which may have already been played and warns the user about them
         if answer == 'SAVE':
             # waits until user has stopped clicking on the save button from the previous prompt
-            button_down = True
-            while button_down:
-                for event in pygame.event.get():
-                    if event.type == pygame.MOUSEBUTTONUP:
-                        button_down = False
+            while pygame.event.wait().type != pygame.MOUSEBUTTONUP:
+                pass
 
             for i in range(len(team_slots)//2):
-                if not team_slots[2 * i].team_number in team_slots[2 * i + 1].not_played:
+                if team_slots[2 * i + 1].has_played(team_slots[2 * i]):
                     question_box_answers = ['Yes', 'No']
                     play_again = draw_question_box(['Team ' + str(team_slots[2 * i].team_number) + ' has already played', 'Team ' + str(team_slots[2 * i + 1].team_number), 
                                                     'Do you want them to play again?'], question_box_answers)
                     if play_again == question_box_answers[1]:
                         answer = ''
+                        needs_drawing = True
                         break
 
     if answer == 'quit':
@@ -770,18 +1063,63 @@ def get_match_change(sides, team_list, num_sim_matches):
     
 
 
-# runs the clock in parallel while the rest of the code is running
-def clock(timer_running, time_remaining):
-    initial_time = time_remaining[0]
-    start_time = time.time()
-    # steadily decreases the time remaining while the timer is running and the time left is greater than 0.
-    while time_remaining[0] > 0 and timer_running[0]:
-        current_time = time.time()
-        time_remaining[0] = initial_time - (current_time - start_time)
+'''
+Timer for the matches, which works out the time remaining from time.monotonic rather than counting it down,
+so pausing and resuming it never makes it drift however often it's checked.
+While it's running, pygame sends a TIMER_TICK event every tick_interval milliseconds, which wakes up the main loop
+to check it, and second_changed says when the time shown on the clock needs to change.
+'''
+class MatchTimer():
+    def __init__(self, duration=game_time, tick_interval=100):
+        self.tick_interval = tick_interval
+        self.started_at = None
+        self.reset(duration)
+
+    # stops the timer and sets it to the given number of seconds
+    def reset(self, duration=game_time):
+        self.pause()
+        self.remaining_when_paused = duration
+        self.shown_second = round(duration)
+
+    def running(self):
+        return self.started_at is not None
+
+    def start(self):
+        if not self.running() and self.remaining_when_paused > 0:
+            self.started_at = time.monotonic()
+            pygame.time.set_timer(TIMER_TICK, self.tick_interval)
+
+    def pause(self):
+        if self.running():
+            self.remaining_when_paused = self.remaining()
+            self.started_at = None
+            pygame.time.set_timer(TIMER_TICK, 0)
+
+    # returns the number of seconds left, which stops at 0
+    def remaining(self):
+        if not self.running():
+            return self.remaining_when_paused
+        remaining = self.remaining_when_paused - (time.monotonic() - self.started_at)
+        if remaining <= 0:
+            # stops sending ticks once the time is up
+            self.remaining_when_paused = 0
+            self.started_at = None
+            pygame.time.set_timer(TIMER_TICK, 0)
+            return 0
+        return remaining
+
+    # returns True if the second shown on the clock has changed since the last time this was called
+    def second_changed(self):
+        second = round(self.remaining())
+        if second == self.shown_second:
+            return False
+        self.shown_second = second
+        return True
 
 
 # draws the main screen with the mathces on it.
 def draw_screen(prev_matches, matches, next_matches, background_group, button_group):
+    start_time = time.perf_counter()
     # draws background
     screen.fill(background_colour)
     background_group.draw(screen)
@@ -796,12 +1134,19 @@ def draw_screen(prev_matches, matches, next_matches, background_group, button_gr
     print_match_set(prev_matches, screen_height//3)
     print_match_set(matches, screen_height//2)
     print_match_set(next_matches, 2 * screen_height//3)
+    draw_overlay(screen)
 
     # updates the screen
     pygame.display.flip()
+    instruments.record('draw_screen', time.perf_counter() - start_time)
+    instruments.frame_shown()
 
 
 def menu():
+    # starts decoding the images in the background while the window is made, and waits for them before the buttons use them
+    asset_cache.preload()
+    init_display()
+    asset_cache.wait_for_preload()
     num_teams = 15
     num_sides = 3
     text_size = 60
@@ -828,26 +1173,29 @@ def menu():
     button_group = pygame.sprite.Group()
     button_group.add(enter, left_hockey_man, right_hockey_man, up_arrow_1, up_arrow_2, down_arrow_1, down_arrow_2)
 
-    # draws the menu
-    def display_menu(num_teams, num_sides, button_group, colour):
+    # draws the menu (cache is False while it's fading in, as each colour of the text is only drawn once)
+    def display_menu(num_teams, num_sides, button_group, colour, cache=True):
         screen.fill(background_colour)
         button_group.draw(screen)
-        print_title(colour)
-        print_screen('Number of teams: ' + str(num_teams), screen_width//2, screen_height*0.4, text_size, colour, left_align=False)
+        print_title(colour, cache)
+        print_screen('Number of teams: ' + str(num_teams), screen_width//2, screen_height*0.4, text_size, colour, left_align=False, cache=cache)
         texts = {
             1: 'Full Ice',
             2: 'Half Ice',
             3: 'Third Ice',
         }
         text = 'Number of matches: ' + texts.get(num_sides, str(num_sides))
-        print_screen(text, screen_width//2, screen_height*0.6, text_size, colour, left_align=False)       
+        print_screen(text, screen_width//2, screen_height*0.6, text_size, colour, left_align=False, cache=cache)
+        print_screen('Hold shift to change by ' + str(large_step), screen_width//2, screen_height*0.92, 25, colour, left_align=False, cache=cache)
         pygame.display.flip()
 
-    # gets the input number of teams and sides
-    def do_input(num_teams=num_teams, num_sides=num_sides):
+    # gets the input number of teams and sides from the given events (or the events waiting, if none are given)
+    def do_input(num_teams=num_teams, num_sides=num_sides, events=None):
         menu_complete = False
         quit = False
-        for event in pygame.event.get():
+        if events is None:
+            events = pygame.event.get()
+        for event in events:
             # gets the user's clicks
             if event.type == pygame.MOUSEBUTTONUP:
                 # finds the position of the mouse when the user unclicks
@@ -855,14 +1203,15 @@ def menu():
                 # checks which button was clicked
                 if enter.is_clicked(mouse_x, mouse_y):
                     menu_complete = True
+                # holding shift down changes the numbers by large_step rather than 1, so that big leagues don't take hundreds of clicks
                 elif up_arrow_1.is_clicked(mouse_x, mouse_y):
-                    num_teams += 1
+                    num_teams += arrow_step()
                 elif down_arrow_1.is_clicked(mouse_x, mouse_y) and num_teams > num_sides * 2:
-                    num_teams -= 1
+                    num_teams = max(num_teams - arrow_step(), num_sides * 2)
                 elif up_arrow_2.is_clicked(mouse_x, mouse_y) and num_sides < num_teams // 2:
-                    num_sides += 1
+                    num_sides = min(num_sides + arrow_step(), num_teams // 2)
                 elif down_arrow_2.is_clicked(mouse_x, mouse_y) and num_sides > 1:
-                    num_sides -= 1
+                    num_sides = max(num_sides - arrow_step(), 1)
 
             # checks if the user has clicked on the cross to quit the program
             elif event.type == pygame.QUIT:
@@ -889,15 +1238,19 @@ def menu():
                 return menu_complete, num_teams, num_sides, quit
 
             # draws the result to the screen
-            display_menu(num_teams, num_sides, button_group, colour)
+            display_menu(num_teams, num_sides, button_group, colour, cache=False)
         return menu_complete, num_teams, num_sides, quit
 
     # fades the menu in
     menu_complete, num_teams, num_sides, quit = fade_in()
 
-    # keeps the menu until the user exits
-    while not menu_complete and not quit:
+    # keeps the menu until the user exits, waiting for the user to do something and only drawing it again when the numbers change
+    if not menu_complete and not quit:
         display_menu(num_teams, num_sides, button_group, colour=text_colour)
-        menu_complete, num_teams, num_sides, quit = do_input(num_teams, num_sides)
+    while not menu_complete and not quit:
+        shown = (num_teams, num_sides)
+        menu_complete, num_teams, num_sides, quit = do_input(num_teams, num_sides, [pygame.event.wait()])
+        if (num_teams, num_sides) != shown:
+            display_menu(num_teams, num_sides, button_group, colour=text_colour)
 
     return num_teams, num_sides, quit
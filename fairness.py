@@ -0,0 +1,162 @@
+import csv
+import json
+import os
+import numpy
+
+'''
+Fairness statistics of a session, kept up to date as each round is played rather than being worked out from scratch.
+It follows the stats in a TeamStore: the store tells it which teams are about to change (remove) and which teams have
+just changed (add), and only the contributions of those teams are taken away and put back, so keeping it up to date takes
+time proportional to the number of teams changed rather than the whole session.
+The statistics kept are:
+side variance: variance of the number of games each team has played at each side (over every team, including removed teams)
+games spread: difference between the most and fewest games played by the teams in the session (not the removed teams)
+max on/off: longest run of consecutive games on or off the ice by any team
+repeat pairings: number of matches between teams which had already played each other
+The values are kept as sums and histograms, so each of them can be read at any time without going through the teams.
+'''
+class FairnessMetrics():
+    def __init__(self, store, active_slots):
+        self.rebuild(store, active_slots)
+
+    # works everything out from scratch, e.g. when the metrics are first attached to a store or a session has been loaded
+    def rebuild(self, store, active_slots=None):
+        size = store.size
+        if active_slots is not None:
+            self.active = numpy.zeros(store.capacity, dtype=bool)
+            self.active[active_slots] = True
+        self.fit(store)
+        self.rebuild_sides(store)
+        self.games = numpy.bincount(store.matches_played[:size][self.active[:size]], minlength=1)
+        self.max_on = numpy.bincount(store.max_consec[:size], minlength=1)
+        self.max_off = numpy.bincount(store.max_off[:size], minlength=1)
+        self.team_repeats = numpy.zeros(store.capacity, dtype=numpy.int64)
+        self.team_repeats[:size] = numpy.maximum(store.pair_counts[:size, :size] - 1, 0).sum(axis=1)
+        self.repeat_pairings = int(self.team_repeats.sum()) // 2
+
+    # works out the side sums again, which is needed when the number of sides changes and the side counts start again
+    def rebuild_sides(self, store):
+        sides = store.sides[:store.size]
+        self.side_values = sides.size
+        self.side_sum = int(sides.sum())
+        self.side_sum_squares = int((sides * sides).sum())
+
+    # makes the arrays indexed by slot as big as the store's, after the store has grown
+    def fit(self, store):
+        if len(self.active) < store.capacity:
+            self.active = numpy.concatenate((self.active, numpy.zeros(store.capacity - len(self.active), dtype=bool)))
+        if hasattr(self, 'team_repeats') and len(self.team_repeats) < store.capacity:
+            self.team_repeats = numpy.concatenate((self.team_repeats, numpy.zeros(store.capacity - len(self.team_repeats), dtype=numpy.int64)))
+
+    # adds (sign=1) or takes away (sign=-1) the contributions of the teams in slots and of the pairs of teams playing[i] and opponents[i]
+    def count(self, store, slots, playing, opponents, sign):
+        side_rows = store.sides[playing]
+        self.side_sum += sign * int(side_rows.sum())
+        self.side_sum_squares += sign * int((side_rows * side_rows).sum())
+
+        self.games = self.add_to_histogram(self.games, store.matches_played[slots[self.active[slots]]], sign)
+        self.max_on = self.add_to_histogram(self.max_on, store.max_consec[slots], sign)
+        self.max_off = self.add_to_histogram(self.max_off, store.max_off[slots], sign)
+
+        repeats = numpy.maximum(store.pair_counts[playing, opponents] - 1, 0)
+        numpy.add.at(self.team_repeats, playing, sign * repeats)
+        # each pair is in playing twice (once each way round), so each repeat has been counted twice
+        self.repeat_pairings += sign * int(repeats.sum()) // 2
+
+    # takes away the contributions of the teams which are about to change
+    def remove(self, store, slots, playing, opponents):
+        self.count(store, slots, playing, opponents, -1)
+
+    # puts back the contributions of the teams which have just changed
+    def add(self, store, slots, playing, opponents):
+        self.fit(store)
+        self.count(store, slots, playing, opponents, 1)
+
+    def add_to_histogram(self, histogram, values, sign):
+        if len(values) and values.max() >= len(histogram):
+            histogram = numpy.concatenate((histogram, numpy.zeros(values.max() + 1 - len(histogram), dtype=histogram.dtype)))
+        numpy.add.at(histogram, values, sign)
+        return histogram
+
+    # adds a new team which hasn't played yet, which starts off out of the session until set_active is called
+    def new_slot(self, store, slot):
+        self.fit(store)
+        self.side_values += store.num_sides
+        self.max_on = self.add_to_histogram(self.max_on, store.max_consec[[slot]], 1)
+        self.max_off = self.add_to_histogram(self.max_off, store.max_off[[slot]], 1)
+
+    # puts a team into the session or takes it out (when it's removed), which changes the spread of games played
+    def set_active(self, store, slot, active):
+        if self.active[slot] != active:
+            self.active[slot] = active
+            self.games = self.add_to_histogram(self.games, store.matches_played[[slot]], 1 if active else -1)
+
+    # returns the lowest and highest values in a histogram
+    def histogram_range(self, histogram):
+        values = numpy.flatnonzero(histogram)
+        if len(values) == 0:
+            return 0, 0
+        return int(values[0]), int(values[-1])
+
+    # returns the fairness statistics of the whole session
+    def summary(self):
+        if self.side_values:
+            mean = self.side_sum / self.side_values
+            side_variance = max(self.side_sum_squares / self.side_values - mean * mean, 0.0)
+        else:
+            side_variance = 0.0
+        fewest_games, most_games = self.histogram_range(self.games)
+        return {
+            'teams': int(self.games.sum()),
+            'side_variance': side_variance,
+            'side_std': side_variance ** 0.5,
+            'fewest_games': fewest_games,
+            'most_games': most_games,
+            'games_spread': most_games - fewest_games,
+            'max_on': self.histogram_range(self.max_on)[1],
+            'max_off': self.histogram_range(self.max_off)[1],
+            'repeat_pairings': self.repeat_pairings,
+        }
+
+    # returns the statistics of each team in the store, in order of team number
+    def team_rows(self, store):
+        rows = []
+        for slot in numpy.argsort(store.team_numbers[:store.size], kind='stable'):
+            sides = store.sides[slot].tolist()
+            rows.append({
+                'team_number': int(store.team_numbers[slot]),
+                'active': bool(self.active[slot]),
+                'matches_played': int(store.matches_played[slot]),
+                'sides': sides,
+                'side_spread': max(sides) - min(sides) if sides else 0,
+                'consecutive_games': int(store.consecutive_games[slot]),
+                'consecutive_off': int(store.consecutive_off[slot]),
+                'max_on': int(store.max_consec[slot]),
+                'max_off': int(store.max_off[slot]),
+                'repeat_pairings': int(self.team_repeats[slot]),
+            })
+        return rows
+
+    # writes the session's statistics and those of each team to a JSON file
+    def export_json(self, store, path):
+        make_directory(path)
+        with open(path, 'w') as file:
+            json.dump({'session': self.summary(), 'teams': self.team_rows(store)}, file, indent=2)
+
+    # writes the statistics of each team to a CSV file, with a column for each side
+    def export_csv(self, store, path):
+        make_directory(path)
+        rows = self.team_rows(store)
+        with open(path, 'w', newline='') as file:
+            writer = csv.writer(file)
+            writer.writerow(['team_number', 'active', 'matches_played'] + ['side_' + str(i + 1) for i in range(store.num_sides)] +
+                            ['side_spread', 'consecutive_games', 'consecutive_off', 'max_on', 'max_off', 'repeat_pairings'])
+            for row in rows:
+                writer.writerow([row['team_number'], row['active'], row['matches_played']] + row['sides'] +
+                                [row['side_spread'], row['consecutive_games'], row['consecutive_off'], row['max_on'], row['max_off'], row['repeat_pairings']])
+
+
+def make_directory(path):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
@@ -0,0 +1,123 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+import numpy
+
+# number of measurements kept for each thing being timed
+ring_size = 1024
+
+'''
+Fixed size buffer holding the most recent measurements of one thing (e.g. how long each frame took to draw).
+Once it's full each new measurement overwrites the oldest, so it never grows however long the session goes on.
+count is the number of measurements ever added, including the ones which have since been overwritten.
+'''
+class RingBuffer():
+    def __init__(self, size=ring_size):
+        self.values = numpy.zeros(size)
+        self.count = 0
+
+    def add(self, value):
+        self.values[self.count % len(self.values)] = value
+        self.count += 1
+
+    # returns the measurements held, oldest first
+    def recent(self):
+        if self.count <= len(self.values):
+            return self.values[:self.count].copy()
+        start = self.count % len(self.values)
+        return numpy.concatenate([self.values[start:], self.values[:start]])
+
+
+'''
+Collects timings from around the program, each into its own ring buffer under a name, e.g.
+draw_screen: how long the main screen took to draw
+input_latency: time from an event which changes the screen (like a click highlighting a button) being taken off the
+               queue to the screen being updated to show it
+make_match: how long the scheduler took to make a round
+Timings can be recorded from any thread (the schedule planner records its own), and are always collected,
+as recording one only costs a few microseconds. The overlay flag says whether they're shown on the screen.
+'''
+class Instrumentation():
+    def __init__(self, size=ring_size):
+        self.size = size
+        self.buffers = {}
+        self.lock = threading.Lock()
+        self.overlay = False
+        self.input_time = None
+
+    # adds a timing (in seconds) under the given name
+    def record(self, name, seconds):
+        with self.lock:
+            buffer = self.buffers.get(name)
+            if buffer is None:
+                buffer = RingBuffer(self.size)
+                self.buffers[name] = buffer
+            buffer.add(seconds)
+
+    # times everything inside a with block, e.g. with instruments.timed('draw_screen'): ...
+    @contextmanager
+    def timed(self, name):
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start_time)
+
+    # notes when an event which changes the screen was taken off the queue, so that the time until it's shown can be recorded
+    def input_received(self, received_time):
+        if self.input_time is None:
+            self.input_time = received_time
+
+    # called once the screen has been updated, recording the latency of the input it shows (if there is one)
+    def frame_shown(self):
+        if self.input_time is not None:
+            self.record('input_latency', time.perf_counter() - self.input_time)
+            self.input_time = None
+
+    # returns the number of measurements of each thing along with the percentiles of the recent ones, in milliseconds
+    def summary(self):
+        with self.lock:
+            recent = {name: (buffer.count, buffer.recent()) for name, buffer in self.buffers.items()}
+        summary = {}
+        for name, (count, values) in sorted(recent.items()):
+            values = values * 1000
+            summary[name] = {
+                'count': count,
+                'p50': float(numpy.percentile(values, 50)),
+                'p90': float(numpy.percentile(values, 90)),
+                'p99': float(numpy.percentile(values, 99)),
+                'max': float(values.max()),
+            }
+        return summary
+
+    # returns a line of text for each thing being timed, which is what the overlay shows
+    def summary_lines(self):
+        lines = []
+        for name, values in self.summary().items():
+            lines.append(name + ' p50 ' + str(round(values['p50'], 1)) + ' p99 ' + str(round(values['p99'], 1)) +
+                         ' max ' + str(round(values['max'], 1)) + 'ms')
+        return lines
+
+    def print_summary(self):
+        print('Timings (ms):')
+        for name, values in self.summary().items():
+            print(name + ': ' + ' '.join(key + ' ' + str(round(value, 3)) for key, value in values.items()))
+
+    # writes the summary and the recent measurements (in milliseconds) to a JSON file
+    def dump(self, path):
+        with self.lock:
+            recent = {name: (buffer.recent() * 1000).tolist() for name, buffer in self.buffers.items()}
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(path, 'w') as file:
+            json.dump({'summary': self.summary(), 'recent_ms': recent}, file, indent=2)
+
+    def clear(self):
+        with self.lock:
+            self.buffers = {}
+            self.input_time = None
+
+instruments = Instrumentation()
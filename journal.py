@@ -0,0 +1,139 @@
+import json
+import os
+import queue
+import threading
+import numpy
+
+'''
+Crash-safe journal of a session, so that it can be picked up again after the program is closed or crashes.
+The journal is made up of 2 files in its directory:
+journal.jsonl: an append-only file with one JSON record per line (e.g. a round being played or the clock being paused)
+snapshot.npz: a compact copy of the whole session state, written every so often and whenever something changes
+              which would be awkward to replay (e.g. the teams being changed or a round being undone)
+Every record has a sequence number, and the snapshot holds the sequence number of the last record it includes,
+so the session is rebuilt by loading the snapshot and replaying only the records after it.
+
+All of the writing is done by a background thread, so appending a record never waits for the disk.
+The thread writes whatever has built up since it last woke, then flushes it to the disk in one go.
+'''
+class SessionJournal():
+    journal_name = 'journal.jsonl'
+    snapshot_name = 'snapshot.npz'
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.journal_path = os.path.join(directory, self.journal_name)
+        self.snapshot_path = os.path.join(directory, self.snapshot_name)
+        self.sequence = 0
+        self.queue = queue.Queue()
+        self.thread = None
+
+    # starts the background writer, carrying on from the given sequence number (e.g. after a session has been loaded)
+    def start(self, sequence=0):
+        os.makedirs(self.directory, exist_ok=True)
+        self.sequence = sequence
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    # adds a record to the end of the journal
+    def append(self, record_type, **values):
+        self.sequence += 1
+        values['type'] = record_type
+        values['sequence'] = self.sequence
+        self.queue.put(('record', values))
+
+    # writes a snapshot of the session. meta is a dictionary which can be turned into JSON and arrays is a dictionary of numpy arrays.
+    # The arrays must not be changed afterwards, as they are written by the background thread.
+    def snapshot(self, meta, arrays):
+        meta = dict(meta)
+        meta['sequence'] = self.sequence
+        self.queue.put(('snapshot', (meta, arrays)))
+
+    # deletes the journal, when the session has finished and shouldn't be picked up again
+    def clear(self):
+        self.queue.put(('clear', None))
+
+    # waits for everything to be written and stops the background writer
+    def close(self):
+        if self.thread is not None and self.thread.is_alive():
+            self.queue.put(('stop', None))
+            self.thread.join()
+
+    def run(self):
+        journal_file = open(self.journal_path, 'a')
+        try:
+            while True:
+                # waits for the first item, then takes everything else which has built up, so that it's all written at once
+                items = [self.queue.get()]
+                while True:
+                    try:
+                        items.append(self.queue.get_nowait())
+                    except queue.Empty:
+                        break
+
+                stop = False
+                for kind, item in items:
+                    if kind == 'record':
+                        journal_file.write(json.dumps(item) + '\n')
+                    elif kind == 'snapshot':
+                        self.sync(journal_file)
+                        self.write_snapshot(*item)
+                        # the snapshot includes everything in the journal so far, so the journal can start again
+                        journal_file.close()
+                        journal_file = open(self.journal_path, 'w')
+                    elif kind == 'clear':
+                        journal_file.close()
+                        for path in [self.journal_path, self.snapshot_path]:
+                            if os.path.exists(path):
+                                os.remove(path)
+                        journal_file = open(self.journal_path, 'w')
+                    elif kind == 'stop':
+                        stop = True
+                self.sync(journal_file)
+                if stop:
+                    return
+        finally:
+            journal_file.close()
+
+    # makes sure everything written to the file has reached the disk
+    def sync(self, journal_file):
+        journal_file.flush()
+        os.fsync(journal_file.fileno())
+
+    # writes the snapshot to a temporary file before moving it into place, so that a crash part way through
+    # writing it never leaves a broken snapshot behind
+    def write_snapshot(self, meta, arrays):
+        temporary_path = self.snapshot_path + '.tmp'
+        with open(temporary_path, 'wb') as file:
+            numpy.savez(file, meta=numpy.array(json.dumps(meta)), **arrays)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temporary_path, self.snapshot_path)
+
+
+'''
+Loads the journal in the given directory.
+Returns the snapshot's meta dictionary, its arrays and the list of records written after it,
+or None if there is no session to pick up. A record which was only half written when the program stopped is ignored.
+'''
+def load_journal(directory):
+    snapshot_path = os.path.join(directory, SessionJournal.snapshot_name)
+    journal_path = os.path.join(directory, SessionJournal.journal_name)
+    if not os.path.exists(snapshot_path):
+        return None
+
+    with numpy.load(snapshot_path) as snapshot:
+        meta = json.loads(str(snapshot['meta']))
+        arrays = {name: snapshot[name] for name in snapshot.files if name != 'meta'}
+
+    records = []
+    if os.path.exists(journal_path):
+        with open(journal_path) as file:
+            for line in file:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    break
+                if record['sequence'] > meta['sequence']:
+                    records.append(record)
+    return meta, arrays, records
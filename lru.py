@@ -0,0 +1,39 @@
+from collections import OrderedDict
+
+'''
+Least recently used cache, which the font, text and round caches keep their values in.
+Holds at most max_size values, dropping the one which was used longest ago when it's full, and counts how many times
+a value was already there when it was looked up (hits) or not (misses). None can't be kept, as it means a miss.
+'''
+class LRUCache():
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.clear()
+
+    # empties the cache and starts the counts again
+    def clear(self):
+        self.values = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    # returns the value kept for the key, or None if there isn't one
+    def get(self, key):
+        value = self.values.get(key)
+        if value is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.values.move_to_end(key)
+        return value
+
+    def put(self, key, value):
+        self.values[key] = value
+        self.values.move_to_end(key)
+        if len(self.values) > self.max_size:
+            self.values.popitem(last=False)
+
+    def __len__(self):
+        return len(self.values)
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self.values)}
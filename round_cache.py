@@ -0,0 +1,77 @@
+import hashlib
+import threading
+import numpy
+from lru import LRUCache
+
+# most solutions of each kind kept by the round cache
+round_cache_size = 4096
+
+'''
+Cache of the solutions found when making rounds, so that a scheduling state which has been seen before costs a lookup
+rather than another solve with the assignment solver.
+Each solution is kept under a fingerprint of the state it was solved for (see fingerprint), and under a kind, which says
+what was being solved (e.g. 'make_match' or 'even_sides'). The states don't depend on the team numbers or the order the
+teams are stored in, so sessions whose teams are in the same position up to the numbers on their shirts can share their
+solutions. make_match's states are in priority order, though, and the random tiebreak orders the teams tied on priority
+differently each time, so the same teams only give the same state when there are no ties or they're broken the same way.
+That makes hits rare in real sessions, so the cache is only used when Alts_code.memoize_rounds is turned on.
+
+The solutions of each kind are kept in their own LRUCache of at most max_size solutions, which also counts the hits and
+misses of that kind. The cache is shared by every session in the process, so it's locked for use from any thread.
+'''
+class RoundCache():
+    def __init__(self, max_size=round_cache_size):
+        self.max_size = max_size
+        self.lock = threading.Lock()
+        self.clear()
+
+    # empties the cache and starts the counts again
+    def clear(self):
+        with self.lock:
+            self.solutions = {}
+
+    # returns the LRUCache holding the solutions of the given kind, making it the first time the kind is used
+    def kind_cache(self, kind):
+        cache = self.solutions.get(kind)
+        if cache is None:
+            cache = self.solutions[kind] = LRUCache(self.max_size)
+        return cache
+
+    # returns the solution kept for the fingerprint, or None if there isn't one
+    def get(self, kind, key):
+        with self.lock:
+            return self.kind_cache(kind).get(key)
+
+    def put(self, kind, key, solution):
+        with self.lock:
+            self.kind_cache(kind).put(key, solution)
+
+    # returns the hits, misses and hit rate of each kind, along with the number of solutions kept
+    def stats(self):
+        with self.lock:
+            stats = {'size': sum(len(cache) for cache in self.solutions.values())}
+            for kind, cache in self.solutions.items():
+                lookups = cache.hits + cache.misses
+                stats[kind] = {'hits': cache.hits, 'misses': cache.misses, 'hit_rate': cache.hits / lookups if lookups else 0.0}
+        return stats
+
+    def print_stats(self):
+        stats = self.stats()
+        print('Round cache: ' + str(stats.pop('size')) + ' solutions kept, ' +
+              ', '.join(kind + ' hit rate ' + str(round(100 * counts['hit_rate'], 1)) + '% (' + str(counts['hits']) + ' of ' +
+                        str(counts['hits'] + counts['misses']) + ')' for kind, counts in stats.items()))
+
+round_cache = RoundCache()
+
+
+'''
+Returns a fingerprint of a scheduling state given as a list of numpy arrays (and plain numbers), which is a short digest
+of their shapes, types and contents. Two states only have the same fingerprint if all of their arrays are the same.
+'''
+def fingerprint(*parts):
+    digest = hashlib.blake2b(digest_size=16)
+    for part in parts:
+        part = numpy.ascontiguousarray(part)
+        digest.update((part.dtype.str + str(part.shape)).encode())
+        digest.update(part.tobytes())
+    return digest.digest()
@@ -0,0 +1,256 @@
+import asyncio
+import base64
+import hashlib
+import json
+import struct
+import threading
+
+'''
+Local scoreboard server, so that the matches and the clock can be shown on phones and other screens around the rink.
+It serves a small web page over HTTP, which connects back with a WebSocket. Whenever the state of the session changes,
+only the values which changed are pushed to every viewer, rather than the viewers asking for the state over and over.
+
+The server runs its own asyncio event loop on a background thread. The main loop hands it the latest state with publish,
+which only queues the state for the server's thread, so the display never waits for the network. Each message is encoded
+once and written to every viewer without waiting for them, and a viewer which falls too far behind is disconnected
+rather than holding up everyone else.
+
+The WebSocket protocol (RFC 6455) is done by hand with the standard library, as only text frames, pings and closes are needed.
+'''
+
+# the GUID every WebSocket handshake is hashed with, from RFC 6455
+websocket_guid = '258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+# most bytes queued up for a viewer before it's disconnected for being too slow
+max_viewer_buffer = 256 * 1024
+# largest HTTP request head read, and largest frame accepted from a viewer
+max_request_size = 8192
+
+
+'''
+Turns a message into a single WebSocket frame, as sent by a server (which never masks its frames)
+'''
+def encode_frame(payload, opcode=0x1):
+    length = len(payload)
+    if length < 126:
+        header = struct.pack('!BB', 0x80 | opcode, length)
+    elif length < 2**16:
+        header = struct.pack('!BBH', 0x80 | opcode, 126, length)
+    else:
+        header = struct.pack('!BBQ', 0x80 | opcode, 127, length)
+    return header + payload
+
+
+'''
+Reads one WebSocket frame from a viewer, returning its opcode and payload.
+Frames from viewers are always masked, so the payload is unmasked before it's returned.
+'''
+async def read_frame(reader):
+    first, second = await reader.readexactly(2)
+    opcode = first & 0x0F
+    length = second & 0x7F
+    if length == 126:
+        length = struct.unpack('!H', await reader.readexactly(2))[0]
+    elif length == 127:
+        length = struct.unpack('!Q', await reader.readexactly(8))[0]
+    if length > max_request_size:
+        raise ValueError('Frame too large')
+    mask = await reader.readexactly(4) if second & 0x80 else b'\x00\x00\x00\x00'
+    payload = bytearray(await reader.readexactly(length))
+    for i in range(length):
+        payload[i] ^= mask[i % 4]
+    return opcode, bytes(payload)
+
+
+'''
+host: the address the server listens on. The default only lets this computer connect; '' listens on every network interface,
+      so that phones and other screens on the same network can connect too.
+'''
+class ScoreboardServer():
+    def __init__(self, host='127.0.0.1', port=8765):
+        self.host = host
+        self.port = port
+        # the latest state of the session, which is sent in full to each viewer when it connects
+        self.state = {}
+        self.viewers = set()
+        # the task handling each open connection, so that they can all be finished off when the server stops
+        self.connections = set()
+        self.loop = None
+        self.server = None
+        self.stopping = None
+        self.error = None
+        self.started = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    # starts the server on its own thread, returning True once it's listening, or False if it couldn't start
+    # (e.g. because something else is using the port)
+    def start(self):
+        self.thread.start()
+        self.started.wait()
+        return self.error is None
+
+    # closes every connection and stops the server's thread
+    def stop(self):
+        if self.loop is not None and self.thread.is_alive():
+            self.loop.call_soon_threadsafe(self.stopping.set)
+            self.thread.join()
+
+    # hands the server the latest state of the session (a dictionary which can be turned into JSON).
+    # This can be called as often as needed from any thread, as viewers are only sent the values which have changed.
+    def publish(self, state):
+        if self.loop is not None and self.error is None:
+            self.loop.call_soon_threadsafe(self.update, dict(state))
+
+    def run(self):
+        try:
+            asyncio.run(self.serve())
+        except Exception as error:
+            self.error = error
+            self.started.set()
+
+    async def serve(self):
+        self.loop = asyncio.get_running_loop()
+        self.stopping = asyncio.Event()
+        self.server = await asyncio.start_server(self.handle_connection, self.host or None, self.port)
+        # the actual port, which is only known after binding if the port asked for was 0
+        self.port = self.server.sockets[0].getsockname()[1]
+        self.started.set()
+        async with self.server:
+            await self.stopping.wait()
+            # cancels the connections still open (each one closes itself as it finishes) and waits for them,
+            # so that none are left to be cancelled by asyncio.run once the loop has stopped
+            for task in list(self.connections):
+                task.cancel()
+            await asyncio.gather(*self.connections, return_exceptions=True)
+
+    # runs on the server's thread: works out which values have changed and sends them to every viewer
+    def update(self, state):
+        changes = {key: value for key, value in state.items() if self.state.get(key) != value}
+        if changes:
+            self.state.update(changes)
+            self.broadcast({'type': 'changes', 'values': changes})
+
+    def broadcast(self, message):
+        frame = encode_frame(json.dumps(message).encode())
+        for writer in list(self.viewers):
+            if writer.transport.get_write_buffer_size() > max_viewer_buffer:
+                self.viewers.discard(writer)
+                writer.close()
+            else:
+                writer.write(frame)
+
+    async def handle_connection(self, reader, writer):
+        task = asyncio.current_task()
+        self.connections.add(task)
+        try:
+            request = await reader.readuntil(b'\r\n\r\n')
+            if len(request) > max_request_size:
+                return
+            lines = request.decode('latin-1').split('\r\n')
+            method, path = lines[0].split(' ')[:2]
+            headers = {}
+            for line in lines[1:]:
+                if ':' in line:
+                    name, value = line.split(':', 1)
+                    headers[name.strip().lower()] = value.strip()
+
+            if path == '/ws' and headers.get('upgrade', '').lower() == 'websocket' and 'sec-websocket-key' in headers:
+                await self.handle_viewer(reader, writer, headers['sec-websocket-key'])
+            elif method != 'GET':
+                self.send_response(writer, '405 Method Not Allowed', 'text/plain', b'Method not allowed')
+            elif path == '/':
+                self.send_response(writer, '200 OK', 'text/html; charset=utf-8', page.encode())
+            elif path == '/state':
+                self.send_response(writer, '200 OK', 'application/json', json.dumps(self.state).encode())
+            else:
+                self.send_response(writer, '404 Not Found', 'text/plain', b'Not found')
+            await writer.drain()
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError, ValueError):
+            pass
+        except asyncio.CancelledError:
+            # the server is stopping, so the connection is just closed like any other
+            pass
+        finally:
+            self.connections.discard(task)
+            self.viewers.discard(writer)
+            writer.close()
+
+    def send_response(self, writer, status, content_type, body):
+        writer.write(('HTTP/1.1 ' + status + '\r\nContent-Type: ' + content_type + '\r\nContent-Length: ' + str(len(body)) +
+                      '\r\nCache-Control: no-store\r\nConnection: close\r\n\r\n').encode() + body)
+
+    # completes the WebSocket handshake, sends the viewer the whole state, then keeps the connection open until it's closed
+    async def handle_viewer(self, reader, writer, key):
+        accept = base64.b64encode(hashlib.sha1((key + websocket_guid).encode()).digest()).decode()
+        writer.write(('HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n'
+                      'Sec-WebSocket-Accept: ' + accept + '\r\n\r\n').encode())
+        writer.write(encode_frame(json.dumps({'type': 'state', 'values': self.state}).encode()))
+        self.viewers.add(writer)
+        while True:
+            opcode, payload = await read_frame(reader)
+            if opcode == 0x8:
+                writer.write(encode_frame(payload[:2], opcode=0x8))
+                return
+            elif opcode == 0x9:
+                writer.write(encode_frame(payload, opcode=0xA))
+
+
+# the page the viewers are shown, which keeps itself up to date with the changes pushed down the WebSocket
+page = '''<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<meta name="viewport" content="width=device-width, initial-scale=1">
+<title>Alts</title>
+<style>
+body { background: #000; color: #fff; font-family: Calibri, Arial, sans-serif; text-align: center; margin: 0; }
+h1 { font-size: 3em; margin: 0.3em 0 0; }
+h2 { color: #9696cd; margin: 0.8em 0 0.2em; }
+.matches { display: flex; justify-content: center; flex-wrap: wrap; gap: 0 2em; font-size: 2.5em; font-weight: bold; }
+.next { font-size: 1.6em; color: #ccc; }
+#clock { display: inline-block; background: #9696cd; color: #000; font-size: 3em; font-weight: bold; padding: 0.1em 0.5em; margin-top: 0.5em; }
+#status { color: #888; margin: 1em; }
+</style>
+</head>
+<body>
+<h1>ALTS</h1>
+<div id="clock">-:--</div>
+<h2>Now</h2>
+<div class="matches" id="sides"></div>
+<h2>Next</h2>
+<div class="matches next" id="next_sides"></div>
+<div id="status">Connecting...</div>
+<script>
+var state = {};
+function show() {
+    ['sides', 'next_sides'].forEach(function (name) {
+        var element = document.getElementById(name);
+        element.innerHTML = '';
+        (state[name] || []).forEach(function (pair) {
+            var match = document.createElement('div');
+            match.textContent = pair[0] + 'v' + pair[1];
+            element.appendChild(match);
+        });
+    });
+    if (state.time_remaining !== undefined) {
+        var seconds = state.time_remaining;
+        document.getElementById('clock').textContent = Math.floor(seconds / 60) + ':' + ('0' + seconds % 60).slice(-2);
+    }
+}
+function connect() {
+    var socket = new WebSocket((location.protocol === 'https:' ? 'wss://' : 'ws://') + location.host + '/ws');
+    socket.onopen = function () { document.getElementById('status').textContent = ''; };
+    socket.onmessage = function (event) {
+        var message = JSON.parse(event.data);
+        if (message.type === 'state') { state = message.values; } else { Object.assign(state, message.values); }
+        show();
+    };
+    socket.onclose = function () {
+        document.getElementById('status').textContent = 'Reconnecting...';
+        setTimeout(connect, 2000);
+    };
+}
+connect();
+</script>
+</body>
+</html>
+'''
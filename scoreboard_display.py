@@ -0,0 +1,158 @@
+import argparse
+import math
+import time
+import pygame
+from pygame import freetype
+from state_channel import StateReader, default_name
+
+'''
+Projector scoreboard, which runs as a program of its own next to the main window:
+
+    python scoreboard_display.py [--fullscreen] [--width 1920 --height 1080] [--name alts_state]
+
+It reads the session's state from the shared memory block the main loop publishes into (see state_channel.py), so it
+keeps drawing at full frame rate however long the main window is busy (e.g. while a question box or the match changing
+box is open), and the clock keeps counting down between updates. It only uses the numbers in the block, not anything
+from Alts_code, so it can be started before or after the session and carries on if the session is restarted.
+'''
+
+BLACK = [0, 0, 0]
+WHITE = [255, 255, 255]
+GREY = [200, 200, 200]
+highlight_colour = [150, 150, 205]
+
+# seconds between attempts to find the session's state while there isn't one
+retry_interval = 1.0
+# most matches shown side by side before they wrap onto another row
+matches_per_row = 6
+
+fonts = {}
+
+
+def get_font(size):
+    font = fonts.get(size)
+    if font is None:
+        font = freetype.SysFont('Calibri', size, bold=True)
+        fonts[size] = font
+    return font
+
+
+# draws text centred on (x, y)
+def draw_text(surface, text, x, y, size, colour):
+    font = get_font(max(int(size), 8))
+    rect = font.get_rect(text)
+    rect.center = (int(x), int(y))
+    font.render_to(surface, rect, text, colour)
+
+
+# draws a round of matches in rows between top and bottom, with the number of the pad above each match
+def draw_matches(surface, matches, top, bottom, colour):
+    width = surface.get_width()
+    if not matches:
+        return
+    columns = min(len(matches), matches_per_row)
+    rows = math.ceil(len(matches) / columns)
+    row_height = (bottom - top) / rows
+    column_width = width * 0.9 / columns
+    size = min(row_height * 0.55, column_width / 3.5)
+    for i, match in enumerate(matches):
+        row, column = divmod(i, columns)
+        in_row = min(columns, len(matches) - row * columns)
+        x = width * 0.05 + column_width * (column + 0.5) + column_width * (columns - in_row) / 2
+        y = top + row_height * row
+        draw_text(surface, str(i + 1), x, y + row_height * 0.2, size * 0.4, highlight_colour)
+        text = '-' if match is None else str(match[0]) + 'v' + str(match[1])
+        draw_text(surface, text, x, y + row_height * 0.6, size, colour)
+
+
+def draw_scoreboard(surface, reader, seconds):
+    width, height = surface.get_size()
+    surface.fill(BLACK)
+    draw_text(surface, 'ALTS', width * 0.12, height * 0.08, height * 0.09, WHITE)
+
+    # the clock, in the same colours as the main window's
+    clock_rect = pygame.Rect(0, 0, width * 0.3, height * 0.16)
+    clock_rect.center = (width // 2, int(height * 0.12))
+    pygame.draw.rect(surface, highlight_colour, clock_rect)
+    draw_text(surface, str(seconds // 60) + ':' + str(seconds % 60).zfill(2), clock_rect.centerx, clock_rect.centery, height * 0.13, BLACK)
+    draw_text(surface, str(int(reader.header['num_teams'])) + ' teams', width * 0.88, height * 0.08, height * 0.04, GREY)
+
+    draw_text(surface, 'Now', width // 2, height * 0.26, height * 0.05, highlight_colour)
+    draw_matches(surface, reader.matches(), height * 0.29, height * 0.62, WHITE)
+    draw_text(surface, 'Next', width // 2, height * 0.66, height * 0.05, highlight_colour)
+    draw_matches(surface, reader.matches(next=True), height * 0.69, height * 0.98, GREY)
+
+
+def draw_waiting(surface):
+    surface.fill(BLACK)
+    draw_text(surface, 'ALTS', surface.get_width() // 2, surface.get_height() * 0.4, surface.get_height() * 0.2, WHITE)
+    draw_text(surface, 'Waiting for a session...', surface.get_width() // 2, surface.get_height() * 0.6, surface.get_height() * 0.05, GREY)
+
+
+# returns a reader for the session's state, or None if there isn't a session publishing it yet
+def open_reader(name):
+    try:
+        return StateReader(name)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def run(name=default_name, width=1920, height=1080, fullscreen=False, fps=60):
+    pygame.init()
+    if fullscreen:
+        surface = pygame.display.set_mode((0, 0), pygame.FULLSCREEN)
+    else:
+        surface = pygame.display.set_mode((width, height), pygame.RESIZABLE)
+    pygame.display.set_caption('Alts scoreboard')
+    frame_clock = pygame.time.Clock()
+
+    reader = None
+    last_attempt = None
+    shown = None
+    while True:
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT or (event.type == pygame.KEYDOWN and event.key == pygame.K_ESCAPE):
+                if reader is not None:
+                    reader.close()
+                pygame.quit()
+                return
+            elif event.type == pygame.VIDEORESIZE:
+                shown = None
+
+        # looks for the session's state, which appears when a session starts
+        if reader is None and (last_attempt is None or time.monotonic() - last_attempt > retry_interval):
+            last_attempt = time.monotonic()
+            reader = open_reader(name)
+
+        if reader is not None:
+            reader.read()
+            if reader.closed():
+                # the session has finished, so the next one is waited for
+                reader.close()
+                reader = None
+                last_attempt = time.monotonic()
+
+        # only draws the scoreboard again when the state or the second shown on the clock has changed
+        if reader is None:
+            if shown != 'waiting':
+                draw_waiting(surface)
+                pygame.display.flip()
+                shown = 'waiting'
+        else:
+            seconds = round(reader.time_remaining())
+            if shown != (reader.sequence, seconds):
+                draw_scoreboard(surface, reader, seconds)
+                pygame.display.flip()
+                shown = (reader.sequence, seconds)
+        frame_clock.tick(fps)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Shows the matches and the clock of the running session, e.g. on a projector')
+    parser.add_argument('--name', default=default_name, help='name of the shared memory block the session publishes into')
+    parser.add_argument('--width', type=int, default=1920)
+    parser.add_argument('--height', type=int, default=1080)
+    parser.add_argument('--fullscreen', action='store_true')
+    parser.add_argument('--fps', type=int, default=60)
+    args = parser.parse_args()
+    run(args.name, args.width, args.height, args.fullscreen, args.fps)
@@ -0,0 +1,252 @@
+import argparse
+import concurrent.futures
+import json
+import multiprocessing
+import os
+import random
+import time
+import numpy
+
+import Alts_code
+from round_cache import round_cache
+
+'''
+Headless simulator for whole Alts sessions.
+Each session is described by a config dictionary:
+num_teams: number of teams at the start of the session
+num_sim_matches: number of pads being played on
+rounds: number of sets of matches played in the session
+events: list of [round, action, team_number] where action is 'remove', 'replace' or 'add'. The team number can be
+        None, in which case a random suitable team is picked (for 'add' it is ignored, as new teams get the next number)
+seed: seed for the random number generator, so that the same config always gives the same session
+side_allocation: (optional) the mode even_sides uses to give out the pads, 'optimal' or 'greedy'
+match_building: (optional) the mode make_match uses to pair up the teams, 'matching' or 'greedy'
+priority_weights: (optional) the weight of each of the teams' priority terms, e.g. {'consecutive_off': 4, 'matches_played': 1}
+                  (see Alts_code.TeamStore.priority)
+'''
+
+
+'''
+Applies a single add/remove event to the teams. Events which would leave too few teams for the number of pads
+(or which refer to teams that aren't there) are ignored, in the same way that the menus don't allow them.
+Returns True if the event changed the teams.
+'''
+def apply_event(session, action, team_number, rng):
+    if action == 'remove':
+        if team_number is None:
+            team_number = rng.choice(session.team_list).team_number
+        return session.remove_team(team_number) is not None
+    elif action == 'replace':
+        if not session.removed_teams:
+            return False
+        if team_number is None:
+            team_number = rng.choice(session.removed_teams).team_number
+        return session.replace_team(team_number) is not None
+    elif action == 'add':
+        session.add_team()
+        return True
+    raise ValueError('Unknown event action: ' + str(action))
+
+
+'''
+Runs one session with the given config and returns a summary of how fair it was and how long each round took to make.
+This does the same thing as the loop in Alts_code.main, but without waiting for the clock or drawing anything.
+Each session is an Alts_code.Session with its own random number generator seeded from the config, so the sessions are
+repeatable and don't share anything, which means they can be run at the same time on different threads.
+'''
+def run_session(config):
+    session = Alts_code.Session(config['num_teams'], config['num_sim_matches'], seed=config.get('seed'),
+                                match_building=config.get('match_building', 'matching'),
+                                side_allocation=config.get('side_allocation', 'optimal'),
+                                priority_weights=config.get('priority_weights'))
+    rng = random.Random(config.get('seed'))
+
+    events = {}
+    for round_number, action, team_number in config.get('events', []):
+        events.setdefault(round_number, []).append((action, team_number))
+
+    round_times = []
+    events_applied = 0
+    cache_before = round_cache.stats()
+    for round_number in range(config['rounds']):
+        for action, team_number in events.get(round_number, []):
+            events_applied += apply_event(session, action, team_number, rng)
+
+        # times how long it takes to make the round, which is what the user waits for when a game ends
+        start_time = time.perf_counter()
+        sides = session.make_round()
+        round_times.append(time.perf_counter() - start_time)
+        session.play_round(sides)
+
+    # the fairness statistics are kept up to date by the session's metrics as the rounds are played
+    fairness = session.fairness()
+    return {
+        'config': config,
+        'side_std': fairness['side_std'],
+        'games_spread': fairness['games_spread'],
+        'max_on': fairness['max_on'],
+        'max_off': fairness['max_off'],
+        'repeat_pairings': fairness['repeat_pairings'],
+        'events_applied': events_applied,
+        'round_times': round_times,
+        'telemetry': session.telemetry.summary(),
+        'round_cache': cache_lookups(cache_before, round_cache.stats()),
+    }
+
+
+'''
+Returns the number of hits and misses of each kind in the round cache between two of its stats.
+The cache is shared by the whole process, so when sessions are run on threads at the same time, each one's counts
+include the lookups of the others made while it was running.
+'''
+def cache_lookups(before, after):
+    lookups = {}
+    for kind, counts in after.items():
+        if kind != 'size':
+            old_counts = before.get(kind, {'hits': 0, 'misses': 0})
+            lookups[kind] = {'hits': counts['hits'] - old_counts['hits'], 'misses': counts['misses'] - old_counts['misses']}
+    return lookups
+
+
+'''
+Makes a random list of add/remove events for a session, which gets fed into the config for run_session
+'''
+def random_events(rng, rounds, num_events):
+    events = []
+    for i in range(num_events):
+        action = rng.choice(['remove', 'remove', 'replace', 'add'])
+        events.append([rng.randrange(1, rounds), action, None])
+    return sorted(events, key=lambda event: event[0])
+
+
+'''
+Makes the configs for a batch of sessions, each with its own seed and set of add/remove events.
+team_range and side_range are (min, max) pairs, inclusive.
+'''
+def make_configs(runs, team_range, side_range, rounds, num_events, seed=0, side_allocation='optimal', match_building='matching'):
+    rng = random.Random(seed)
+    configs = []
+    for i in range(runs):
+        num_sim_matches = rng.randint(side_range[0], side_range[1])
+        # there always has to be enough teams to fill every pad
+        num_teams = rng.randint(max(team_range[0], 2 * num_sim_matches), max(team_range[1], 2 * num_sim_matches))
+        configs.append({
+            'num_teams': num_teams,
+            'num_sim_matches': num_sim_matches,
+            'rounds': rounds,
+            'events': random_events(rng, rounds, num_events) if rounds > 1 else [],
+            'seed': rng.randrange(2**32),
+            'side_allocation': side_allocation,
+            'match_building': match_building,
+        })
+    return configs
+
+
+def set_memoize_rounds(memoize_rounds):
+    Alts_code.memoize_rounds = memoize_rounds
+
+
+'''
+Runs all the configs across a pool of processes (or of threads, if threads is given) and returns the results
+in the same order as the configs.
+'''
+def run_batch(configs, processes=None, threads=None):
+    if threads:
+        with concurrent.futures.ThreadPoolExecutor(threads) as executor:
+            return list(executor.map(run_session, configs))
+    if processes == 1:
+        return [run_session(config) for config in configs]
+    # the workers are given the round cache setting, as they don't share the globals when they're started from scratch (e.g. on Windows)
+    pool = multiprocessing.Pool(processes, initializer=set_memoize_rounds, initargs=(Alts_code.memoize_rounds,))
+    try:
+        results = pool.map(run_session, configs, chunksize=max(1, len(configs)//(4 * (processes or os.cpu_count() or 1))))
+    finally:
+        # the workers are closed rather than terminated, so that each one finishes cleanly
+        pool.close()
+        pool.join()
+    return results
+
+
+'''
+Aggregates a list of session results into fairness and latency summaries
+'''
+def summarise(results):
+    summary = {'sessions': len(results), 'fairness': {}, 'latency_ms': {}}
+    for key in ['side_std', 'games_spread', 'max_on', 'max_off', 'repeat_pairings']:
+        values = [result[key] for result in results]
+        summary['fairness'][key] = {'mean': float(numpy.mean(values)), 'max': float(numpy.max(values))}
+
+    # how often make_match had to fall back on relaxing its rules
+    relaxations = {}
+    for result in results:
+        for relaxation, count in result['telemetry']['relaxations'].items():
+            relaxations[relaxation] = relaxations.get(relaxation, 0) + count
+    summary['telemetry'] = {
+        'relaxed_rounds': float(numpy.mean([result['telemetry']['relaxed_rounds'] for result in results])),
+        'reshuffles': float(numpy.mean([result['telemetry']['attempts'] for result in results])),
+        'relaxations': relaxations,
+    }
+
+    # how often the round cache saved a solve
+    summary['round_cache'] = {}
+    for result in results:
+        for kind, counts in result['round_cache'].items():
+            totals = summary['round_cache'].setdefault(kind, {'hits': 0, 'misses': 0})
+            totals['hits'] += counts['hits']
+            totals['misses'] += counts['misses']
+    for totals in summary['round_cache'].values():
+        totals['hit_rate'] = totals['hits'] / (totals['hits'] + totals['misses']) if totals['hits'] + totals['misses'] else 0.0
+
+    round_times = numpy.array([round_time for result in results for round_time in result['round_times']]) * 1000
+    summary['rounds'] = len(round_times)
+    for percentile in [50, 90, 99]:
+        summary['latency_ms']['p' + str(percentile)] = float(numpy.percentile(round_times, percentile))
+    summary['latency_ms']['max'] = float(round_times.max())
+    return summary
+
+
+'''
+Prints out a summary made by summarise
+'''
+def print_summary(summary):
+    print('Sessions:', summary['sessions'], 'Rounds:', summary['rounds'])
+    for key, values in summary['fairness'].items():
+        print(key + ': mean ' + str(round(values['mean'], 3)) + ' max ' + str(round(values['max'], 3)))
+    print('Relaxed rounds per session: ' + str(round(summary['telemetry']['relaxed_rounds'], 3)) + ' reshuffles per session: ' +
+          str(round(summary['telemetry']['reshuffles'], 3)) + ' ' + str(summary['telemetry']['relaxations']))
+    if summary['round_cache']:
+        print('Round cache hit rate: ' + ' '.join(kind + ' ' + str(round(100 * totals['hit_rate'], 1)) + '%' for kind, totals in summary['round_cache'].items()))
+    print('Round latency (ms): ' + ' '.join(key + ' ' + str(round(value, 3)) for key, value in summary['latency_ms'].items()))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Runs lots of Alts sessions without the display and summarises how fair they were.')
+    parser.add_argument('--runs', type=int, default=1000, help='number of sessions to simulate')
+    parser.add_argument('--teams', type=int, nargs=2, default=[15, 25], metavar=('MIN', 'MAX'), help='range of team counts')
+    parser.add_argument('--sides', type=int, nargs=2, default=[2, 3], metavar=('MIN', 'MAX'), help='range of pad counts')
+    parser.add_argument('--rounds', type=int, default=20, help='number of rounds per session')
+    parser.add_argument('--events', type=int, default=2, help='number of add/remove events per session')
+    parser.add_argument('--seed', type=int, default=0, help='seed for generating the sessions')
+    parser.add_argument('--side-allocation', choices=['optimal', 'greedy'], default='optimal', help='how even_sides gives out the pads')
+    parser.add_argument('--match-building', choices=['matching', 'greedy'], default='matching', help='how make_match pairs up the teams')
+    parser.add_argument('--processes', type=int, default=None, help='number of worker processes (defaults to the number of CPUs)')
+    parser.add_argument('--threads', type=int, default=None, help='run the sessions on this many threads in one process instead of a pool of processes')
+    parser.add_argument('--round-cache', action='store_true', help='keep the solutions of the rounds in the round cache')
+    parser.add_argument('--json', help='file to write the summary to as JSON')
+    args = parser.parse_args()
+    Alts_code.memoize_rounds = args.round_cache
+
+    configs = make_configs(args.runs, args.teams, args.sides, args.rounds, args.events, args.seed, args.side_allocation, args.match_building)
+    start_time = time.perf_counter()
+    summary = summarise(run_batch(configs, args.processes, args.threads))
+    summary['wall_time_s'] = time.perf_counter() - start_time
+    print_summary(summary)
+    print('Wall time (s):', round(summary['wall_time_s'], 2))
+
+    if args.json:
+        with open(args.json, 'w') as file:
+            json.dump(summary, file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
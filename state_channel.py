@@ -0,0 +1,239 @@
+import os
+import time
+import numpy
+from multiprocessing import shared_memory
+
+'''
+Shared-memory channel which the session's state is published into, so that other processes (like the projector
+scoreboard in scoreboard_display.py) can show it without waiting on the main loop or knowing anything about its objects.
+
+The state is kept in one block of shared memory with a fixed layout, made up only of numbers:
+header (64 bytes, little-endian):
+    magic           uint32   'ALTS', so that a reader knows it has found the right block
+    version         uint32   layout_version, which changes whenever the layout does
+    sequence        uint64   odd while the state is being written, and goes up by 2 each time it's written
+    max_pads        uint32   number of pads the block has room for
+    num_pads        uint32   number of pads (sides) being played on
+    num_teams       uint32   number of teams in the session
+    running         uint32   1 while the match clock is running
+    time_remaining  float64  seconds left on the clock when the state was written
+    clock_time      float64  time.monotonic() when the state was written, so a reader can count the clock down itself
+    closed          uint32   1 once the session has finished with the channel
+    writer_pid      uint32   process id of the writer, so that a new writer can tell whether the block is still in use
+pairs (int32, shape (2, max_pads, 2)): the team numbers playing on each pad in the current [0] and next [1] round,
+    with no_team for a pad without a match
+
+The sequence counter works as a seqlock: the writer makes it odd, writes the state, then makes it even again, so a reader
+reads the counter, copies the block and reads the counter again, trying again if it was odd or has changed in between.
+The writer never waits for the readers, and a reader only has to copy a few hundred bytes into arrays it already has.
+The counter only works as a lock on processors which keep stores in order (x86 and most setups the program runs on),
+as Python has no memory barriers.
+'''
+
+# name of the shared memory block the main loop publishes into
+default_name = 'alts_state'
+# number of pads the block has room for, which can't be changed without making a new block
+default_max_pads = 64
+layout_version = 2
+magic = 0x53544C41
+# team number written for a pad without a match
+no_team = -1
+empty_pad = (no_team, no_team)
+
+header_dtype = numpy.dtype([
+    ('magic', '<u4'),
+    ('version', '<u4'),
+    ('sequence', '<u8'),
+    ('max_pads', '<u4'),
+    ('num_pads', '<u4'),
+    ('num_teams', '<u4'),
+    ('running', '<u4'),
+    ('time_remaining', '<f8'),
+    ('clock_time', '<f8'),
+    ('closed', '<u4'),
+    ('writer_pid', '<u4'),
+])
+header_size = 64
+
+
+# returns the number of bytes a block with room for the given number of pads needs
+def block_size(max_pads):
+    return header_size + 2 * max_pads * 2 * 4
+
+
+# returns numpy views of the header and the pairs in a block of shared memory, which read and write it directly
+def block_views(buffer, max_pads):
+    header = numpy.ndarray((), dtype=header_dtype, buffer=buffer)
+    pairs = numpy.ndarray((2, max_pads, 2), dtype='<i4', buffer=buffer, offset=header_size)
+    return header, pairs
+
+
+'''
+Writes the session's state into the shared memory block, which it creates and removes again when it's closed.
+A block with the same name left behind by a session which crashed is replaced, but raises FileExistsError if the block
+is still in use (by another session which is still running, or by something other than a StateWriter).
+'''
+class StateWriter():
+    def __init__(self, name=default_name, max_pads=default_max_pads):
+        self.name = name
+        self.max_pads = max_pads
+        try:
+            self.memory = shared_memory.SharedMemory(name, create=True, size=block_size(max_pads))
+        except FileExistsError:
+            # the block is looked at without taking ownership of it, as it mustn't be removed when this process exits if it's in use
+            old_memory = attach(name)
+            stale = block_stale(old_memory)
+            old_memory.close()
+            if not stale:
+                raise FileExistsError('Shared memory block ' + name + ' is already in use')
+            # it's opened again in the usual way to remove it, which keeps python's record of the blocks it owns in step
+            old_memory = shared_memory.SharedMemory(name)
+            old_memory.close()
+            old_memory.unlink()
+            self.memory = shared_memory.SharedMemory(name, create=True, size=block_size(max_pads))
+        self.header, self.pairs = block_views(self.memory.buf, max_pads)
+        self.pairs[:] = no_team
+        self.header['max_pads'] = max_pads
+        self.header['writer_pid'] = os.getpid()
+        self.header['version'] = layout_version
+        self.header['magic'] = magic
+
+    '''
+    Writes the state into the block.
+    sides and next_sides: the team numbers playing on each pad in the current and next rounds, as a pair for each pad
+    (or None for a pad without a match). Pads past max_pads are left out.
+    time_remaining: seconds left on the clock, and running: whether the clock is counting down
+    '''
+    def publish(self, sides, next_sides, time_remaining, running, num_teams):
+        header = self.header
+        header['sequence'] += 1
+        for row, pairs in enumerate([sides, next_sides]):
+            pairs = [empty_pad if pair is None else pair for pair in pairs[:self.max_pads]]
+            if pairs:
+                self.pairs[row, :len(pairs)] = pairs
+            self.pairs[row, len(pairs):] = no_team
+        header['num_pads'] = min(len(sides), self.max_pads)
+        header['num_teams'] = num_teams
+        header['running'] = running
+        header['time_remaining'] = time_remaining
+        header['clock_time'] = time.monotonic()
+        header['sequence'] += 1
+
+    # marks the channel as finished with and removes the block (readers which still have it open keep their copy of it)
+    def close(self):
+        if self.memory is None:
+            return
+        self.header['sequence'] += 1
+        self.header['closed'] = 1
+        self.header['sequence'] += 1
+        del self.header, self.pairs
+        self.memory.close()
+        self.memory.unlink()
+        self.memory = None
+
+
+# returns whether a block which already exists was left behind by a StateWriter which has finished with it or has stopped running,
+# so that it can be removed. Anything which can't be shown to be left behind (including blocks from other programs) is in use.
+def block_stale(memory):
+    if memory.size < header_size:
+        return False
+    header = numpy.ndarray((), dtype=header_dtype, buffer=memory.buf)
+    stale = header['magic'] == magic and header['version'] == layout_version and (header['closed'] or not process_running(int(header['writer_pid'])))
+    del header
+    return bool(stale)
+
+
+# returns whether the process with the given id is still running. On Windows a block is removed as soon as every process
+# using it has closed it, so one which still exists is always in use.
+def process_running(pid):
+    if os.name != 'posix':
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # the process exists, but belongs to another user
+        return True
+    return True
+
+
+'''
+Reads the session's state from the shared memory block, from any process.
+Each call to read copies the block into the reader's own arrays (header and pairs), which then hold a consistent state
+until read is called again. Raises FileNotFoundError if nothing has published the state yet, and ValueError if the block
+isn't one written by StateWriter.
+'''
+class StateReader():
+    def __init__(self, name=default_name):
+        self.name = name
+        self.memory = attach(name)
+        shared_header = numpy.ndarray((), dtype=header_dtype, buffer=self.memory.buf)
+        if shared_header['magic'] != magic or shared_header['version'] != layout_version:
+            del shared_header
+            self.memory.close()
+            raise ValueError('Shared memory block ' + name + ' does not hold the session state')
+        self.max_pads = int(shared_header['max_pads'])
+        del shared_header
+        self.shared_header, self.shared_pairs = block_views(self.memory.buf, self.max_pads)
+        self.header = numpy.zeros((), dtype=header_dtype)
+        self.pairs = numpy.full((2, self.max_pads, 2), no_team, dtype='<i4')
+        # sequence number of the state held in header and pairs (0 if nothing has been read yet)
+        self.sequence = 0
+
+    '''
+    Copies the latest state out of the block, returning True if it has changed since the last call or False if it hasn't
+    (in which case nothing is copied). Gives up and returns False after max_tries attempts if the writer keeps getting in
+    the way, which only happens if it's publishing far faster than it ever does.
+    '''
+    def read(self, max_tries=100):
+        for _ in range(max_tries):
+            sequence = int(self.shared_header['sequence'])
+            if sequence == self.sequence:
+                return False
+            if sequence % 2:
+                time.sleep(0)
+                continue
+            numpy.copyto(self.header, self.shared_header)
+            numpy.copyto(self.pairs, self.shared_pairs)
+            if int(self.shared_header['sequence']) == sequence:
+                self.sequence = sequence
+                return True
+        return False
+
+    # returns the pairs of team numbers playing on each pad in the current (next=False) or next round, with None for an empty pad
+    def matches(self, next=False):
+        pairs = self.pairs[1 if next else 0, :int(self.header['num_pads'])].tolist()
+        return [None if pair[0] == no_team else tuple(pair) for pair in pairs]
+
+    # returns the seconds left on the clock now, counting down from when the state was written if the clock is running
+    def time_remaining(self):
+        remaining = float(self.header['time_remaining'])
+        if self.header['running']:
+            remaining -= time.monotonic() - float(self.header['clock_time'])
+        return max(remaining, 0.0)
+
+    def closed(self):
+        return bool(self.header['closed'])
+
+    def close(self):
+        if self.memory is not None:
+            del self.shared_header, self.shared_pairs
+            self.memory.close()
+            self.memory = None
+
+
+# opens an existing block without the reader's process taking ownership of it, as otherwise python removes the block
+# when the reader exits, even though the writer is still using it.
+# Before python 3.13 this means untracking the block by hand, which affects every process sharing the same resource tracker,
+# so the reader should be run as a program of its own rather than as a multiprocessing child of the writer.
+def attach(name):
+    try:
+        return shared_memory.SharedMemory(name, track=False)
+    except TypeError:
+        # python before 3.13 always tracks the block, so it's untracked by hand
+        memory = shared_memory.SharedMemory(name)
+        if os.name == 'posix':
+            from multiprocessing import resource_tracker
+            resource_tracker.unregister(memory._name, 'shared_memory')
+        return memory
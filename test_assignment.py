@@ -0,0 +1,63 @@
+import itertools
+import numpy
+import pytest
+
+import assignment
+from assignment import solve_assignment
+
+'''
+Checks the assignment solver against trying every possible assignment, for square and rectangular cost matrices.
+Run with python -m pytest.
+'''
+
+
+# returns the cheapest total cost of any assignment, by trying them all
+def brute_force_cost(cost):
+    num_rows, num_columns = cost.shape
+    return min(sum(cost[row, column] for row, column in enumerate(columns))
+               for columns in itertools.permutations(range(num_columns), num_rows))
+
+
+# checks that the columns given are a valid assignment with the cheapest total cost
+def check_optimal(cost, columns):
+    assert len(columns) == len(cost)
+    assert len(set(columns)) == len(columns)
+    assert all(0 <= column < cost.shape[1] for column in columns)
+    assert sum(cost[row, column] for row, column in enumerate(columns)) == brute_force_cost(cost)
+
+
+'''
+Random matrices up to 6 by 8, with small whole number costs so that there are lots of ties (which is where the warm start
+and the paths through the potentials are most likely to go wrong), and with wide ranges of costs like pairing_cost gives.
+'''
+@pytest.mark.parametrize('high', [3, 50, 10**9])
+def test_random_matrices(high):
+    rng = numpy.random.default_rng(high)
+    for i in range(300):
+        num_rows = int(rng.integers(1, 7))
+        num_columns = int(rng.integers(num_rows, 9))
+        cost = rng.integers(0, high, (num_rows, num_columns)).astype(float)
+        check_optimal(cost, solve_assignment(cost))
+
+
+# the same square matrices solved by trying every assignment and by the Hungarian algorithm both give the cheapest total
+def test_small_and_hungarian_agree(monkeypatch):
+    rng = numpy.random.default_rng(1)
+    matrices = [rng.integers(0, 5, (size, size)).astype(float) for size in range(1, assignment.brute_force_size + 1) for i in range(100)]
+    for cost in matrices:
+        check_optimal(cost, assignment.solve_small_assignment(cost))
+    monkeypatch.setattr(assignment, 'brute_force_size', 0)
+    for cost in matrices:
+        check_optimal(cost, solve_assignment(cost))
+
+
+def test_special_cases():
+    # every cost the same
+    check_optimal(numpy.ones((4, 6)), solve_assignment(numpy.ones((4, 6))))
+    # the cheapest column of every row is the same one
+    cost = numpy.array([[0, 5, 9], [0, 7, 8], [0, 6, 1]], dtype=float)
+    check_optimal(cost, solve_assignment(cost))
+    # a single row picks its cheapest column
+    assert solve_assignment([[4, 2, 3]]) == [1]
+    with pytest.raises(ValueError):
+        solve_assignment(numpy.zeros((3, 2)))
@@ -0,0 +1,171 @@
+import random
+import numpy
+
+import Alts_code
+
+'''
+Checks that undoing rounds through the RoundHistory gives back exactly the team stats from before they were played,
+including the epoch, which making a round moves on whenever it lets every team play every other team again.
+Run with python -m pytest.
+'''
+
+
+# returns a copy of everything in a store that a round can change (test_journal.py uses it for the whole session)
+def store_state(store):
+    state = {field: getattr(store, field)[:store.size].copy() for field in Alts_code.TeamStore.fields + ['sides']}
+    for matrix in ['pair_counts', 'played_epoch', 'prev_played_epoch']:
+        state[matrix] = getattr(store, matrix)[:store.size, :store.size].copy()
+    state['epoch'] = store.epoch
+    return state
+
+
+# returns the names of the values which are different in two store states
+def differences(state, other_state):
+    return [name for name in state if not numpy.array_equal(state[name], other_state[name])]
+
+
+# makes a session's worth of teams with its own random tiebreaks
+def make_teams(num_teams, num_sim_matches, seed):
+    store = Alts_code.TeamStore(num_sim_matches, capacity=num_teams, rng=random.Random(seed))
+    return [Alts_code.Team(i + 1, store) for i in range(num_teams)]
+
+
+# plays a round made by the scheduler in the same way as main, returning whether the first matches are still being played in order
+def play_round(history, team_list, first_matches):
+    epoch = team_list[0].store.epoch
+    sides = Alts_code.even_sides(Alts_code.make_match(team_list, first_matches))
+    return history.play(team_list, sides, first_matches, epoch)
+
+
+'''
+Plays a round, undoes it and checks the stats are the same as before it was played, then redoes it and checks they're
+the same as after it was first played. Small leagues are used, so that lots of the rounds reset who has played who.
+'''
+def test_undo_gives_back_the_store():
+    resets = 0
+    for seed in range(100):
+        rng = random.Random(seed)
+        num_sim_matches = rng.randint(1, 3)
+        team_list = make_teams(rng.randint(2 * num_sim_matches, 2 * num_sim_matches + 4), num_sim_matches, seed)
+        store = team_list[0].store
+        history = Alts_code.RoundHistory()
+        first_matches = True
+        for i in range(rng.randint(1, 12)):
+            first_matches = play_round(history, team_list, first_matches)
+
+        before = store_state(store)
+        play_round(history, team_list, first_matches)
+        after = store_state(store)
+        resets += after['epoch'] != before['epoch']
+
+        history.undo(store)
+        assert differences(store_state(store), before) == [], 'seed ' + str(seed)
+        history.redo(store)
+        assert differences(store_state(store), after) == [], 'seed ' + str(seed)
+    # the bug this guards against only shows up in rounds which reset who has played who
+    assert resets > 0
+
+
+# undoes several rounds in a row, checking the stats go back through every round played
+def test_undo_several_rounds():
+    for seed in range(20):
+        team_list = make_teams(7, 2, seed)
+        store = team_list[0].store
+        history = Alts_code.RoundHistory()
+        first_matches = play_round(history, team_list, True)
+        states = [store_state(store)]
+        for i in range(15):
+            first_matches = play_round(history, team_list, first_matches)
+            states.append(store_state(store))
+
+        while history.can_undo():
+            history.undo(store)
+            states.pop()
+            assert differences(store_state(store), states[-1]) == [], 'seed ' + str(seed)
+
+
+'''
+Plays rounds through the SchedulePlanner in the same way as main, where the rounds are made on a copy of the stats and
+any reset of who has played who is copied over by advance, and checks undoing the last round gives back the stats.
+'''
+def test_undo_planned_round():
+    resets = 0
+    for seed in range(30):
+        team_list = make_teams(6, 2, seed)
+        store = team_list[0].store
+        history = Alts_code.RoundHistory()
+        first_matches = play_round(history, team_list, True)
+        planner = Alts_code.SchedulePlanner(depth=4)
+        planner.start()
+        try:
+            planner.replan(team_list, first_matches)
+            next_sides = planner.next_sides()
+            for i in range(10):
+                sides = next_sides
+                before = store_state(store)
+                epoch = store.epoch
+                next_sides = planner.advance(store)
+                first_matches = history.play(team_list, sides, first_matches, epoch)
+                resets += store.epoch != epoch
+
+                planner.invalidate()
+                history.undo(store)
+                assert differences(store_state(store), before) == [], 'seed ' + str(seed)
+                # playing the round again redoes it, as main does when the undone round comes back round
+                history.play(team_list, sides, first_matches, epoch)
+                planner.replan(team_list, first_matches)
+                next_sides = planner.next_sides()
+        finally:
+            planner.stop()
+    assert resets > 0
+
+
+'''
+Removes a team from the next games part way through a session, in the same way as main, then plays on and undoes as far
+back as the history allows. The rounds from before the team was removed can't be undone, as the round before the removal
+would come up next with the removed team still in it, so the undoing stops at the round being played when it was removed.
+'''
+def test_undo_stops_at_team_change():
+    for seed in range(10):
+        team_list = make_teams(9, 2, seed)
+        removed_teams = []
+        store = team_list[0].store
+        history = Alts_code.RoundHistory()
+        first_matches = play_round(history, team_list, True)
+        planner = Alts_code.SchedulePlanner(depth=4)
+        planner.start()
+        try:
+            planner.replan(team_list, first_matches)
+            next_sides = planner.next_sides()
+            for i in range(4):
+                sides = next_sides
+                epoch = store.epoch
+                next_sides = planner.advance(store)
+                first_matches = history.play(team_list, sides, first_matches, epoch)
+
+            # removes a team playing now from the next games
+            planner.invalidate()
+            removed_team = Alts_code.remove_team_number(team_list, removed_teams, sides[0].teams[0].team_number)
+            next_sides = Alts_code.repair_sides(team_list, next_sides, removed_team=removed_team)
+            history.teams_changed()
+            planner.replan(team_list, first_matches, next_sides)
+            changed = store_state(store)
+
+            sides = next_sides
+            epoch = store.epoch
+            next_sides = planner.advance(store)
+            first_matches = history.play(team_list, sides, first_matches, epoch)
+
+            undone = 0
+            while history.can_undo():
+                planner.invalidate()
+                next_sides = sides
+                first_matches = history.undo(store)
+                sides = history.round_sides(team_list + removed_teams)
+                planner.replan(team_list, first_matches, next_sides, history.redo_epoch())
+                assert all(removed_team not in match.teams for match in planner.next_sides())
+                undone += 1
+            assert undone == 1, 'seed ' + str(seed)
+            assert differences(store_state(store), changed) == [], 'seed ' + str(seed)
+        finally:
+            planner.stop()
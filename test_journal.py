@@ -0,0 +1,128 @@
+import os
+import random
+import numpy
+
+import Alts_code
+from journal import SessionJournal
+from test_history import store_state
+
+'''
+Checks that a session written to the journal is rebuilt by load_session exactly as it was: the same team stats, teams,
+matches, clock and sequence number, whether the rounds come from the snapshot or are replayed from the journal after it.
+Run with python -m pytest.
+'''
+
+
+def team_numbers(teams):
+    return [team.team_number for team in teams]
+
+
+'''
+Plays a session in the same way as main, writing to the journal as it goes: a snapshot at the start, a round record
+for each round (with the next rounds planned by a SchedulePlanner), clock records, and a snapshot when a team is removed
+and another is added part way through. Returns everything load_session should give back.
+'''
+def play_session(directory, seed, rounds, change_round):
+    store = Alts_code.TeamStore(3, capacity=11, rng=random.Random(seed))
+    team_list = [Alts_code.Team(i + 1, store) for i in range(11)]
+    removed_teams = []
+    journal = SessionJournal(directory)
+    journal.start()
+    history = Alts_code.RoundHistory()
+    planner = Alts_code.SchedulePlanner(depth=4)
+    planner.start()
+
+    try:
+        prev_sides = [''] * 3
+        sides = Alts_code.even_sides(Alts_code.make_match(team_list, True))
+        first_matches = history.record(team_list, sides, True)
+        planner.replan(team_list, first_matches)
+        next_sides = planner.next_sides()
+        time_remaining = [180]
+        Alts_code.snapshot_session(journal, team_list, removed_teams, prev_sides, sides, next_sides, first_matches, time_remaining)
+
+        for i in range(rounds):
+            if i == change_round:
+                planner.invalidate()
+                Alts_code.remove_team_number(team_list, removed_teams, 4)
+                Alts_code.add_new_team(team_list, removed_teams)
+                planner.replan(team_list, first_matches)
+                next_sides = planner.next_sides()
+                Alts_code.snapshot_session(journal, team_list, removed_teams, prev_sides, sides, next_sides, first_matches, time_remaining)
+            prev_sides = sides
+            sides = next_sides
+            epoch = store.epoch
+            next_sides = planner.advance(store)
+            first_matches = history.play(team_list, sides, first_matches, epoch)
+            journal.append('round', sides=Alts_code.match_pairs(sides), next_sides=Alts_code.match_pairs(next_sides), epoch=store.epoch)
+            journal.append('clock', time_remaining=90)
+        time_remaining = [123.5]
+        journal.append('clock', time_remaining=time_remaining[0])
+    finally:
+        planner.stop()
+        journal.close()
+    return {
+        'store': store_state(store),
+        'team_numbers': team_numbers(team_list),
+        'removed_team_numbers': team_numbers(removed_teams),
+        'prev_sides': Alts_code.match_pairs(prev_sides),
+        'sides': Alts_code.match_pairs(sides),
+        'next_sides': Alts_code.match_pairs(next_sides),
+        'first_matches': first_matches,
+        'time_remaining': time_remaining,
+        'sequence': journal.sequence,
+    }
+
+
+# returns the same things as play_session from a session loaded by load_session
+def loaded_state(loaded):
+    session, prev_sides, sides, next_sides, time_remaining, sequence = loaded
+    return {
+        'store': store_state(session.store),
+        'team_numbers': team_numbers(session.team_list),
+        'removed_team_numbers': team_numbers(session.removed_teams),
+        'prev_sides': Alts_code.match_pairs(prev_sides),
+        'sides': Alts_code.match_pairs(sides),
+        'next_sides': Alts_code.match_pairs(next_sides),
+        'first_matches': session.first_matches,
+        'time_remaining': time_remaining,
+        'sequence': sequence,
+    }
+
+
+def check_same(loaded, played):
+    for name, value in played.items():
+        if name == 'store':
+            for array_name, array in value.items():
+                assert numpy.array_equal(loaded['store'][array_name], array), array_name
+        else:
+            assert loaded[name] == value, name
+
+
+# rounds replayed from the journal after the last snapshot, which was taken when the teams were changed
+def test_round_trip_with_replay(tmp_path):
+    for seed in range(5):
+        directory = str(tmp_path / str(seed))
+        played = play_session(directory, seed, rounds=20, change_round=8)
+        check_same(loaded_state(Alts_code.load_session(directory)), played)
+
+
+# a session with nothing to replay after the snapshot, and one with every round replayed from the first snapshot
+def test_round_trip_from_snapshot(tmp_path):
+    played = play_session(str(tmp_path / 'changed'), 0, rounds=6, change_round=5)
+    check_same(loaded_state(Alts_code.load_session(str(tmp_path / 'changed'))), played)
+    played = play_session(str(tmp_path / 'unchanged'), 0, rounds=25, change_round=None)
+    check_same(loaded_state(Alts_code.load_session(str(tmp_path / 'unchanged'))), played)
+
+
+# a record left half written by a crash is ignored, and the session is rebuilt from the records before it
+def test_half_written_record(tmp_path):
+    directory = str(tmp_path)
+    played = play_session(directory, 1, rounds=10, change_round=None)
+    with open(os.path.join(directory, SessionJournal.journal_name), 'a') as file:
+        file.write('{"type": "round", "sides": [[1, ')
+    check_same(loaded_state(Alts_code.load_session(directory)), played)
+
+
+def test_no_session(tmp_path):
+    assert Alts_code.load_session(str(tmp_path)) is None
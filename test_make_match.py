@@ -0,0 +1,26 @@
+import itertools
+
+import Alts_code
+
+'''
+Checks that the matching mode of make_match doesn't repeat pairings it doesn't have to.
+Run with python -m pytest.
+'''
+
+
+'''
+When every team plays every round, the hosts have to play each other for the league to get through every pairing, so
+4 teams on 2 pads should play a whole round robin every 3 rounds without a pairing coming up twice in one.
+'''
+def test_full_rink_plays_round_robins():
+    every_pairing = {frozenset(pair) for pair in itertools.combinations(range(1, 5), 2)}
+    for seed in range(50):
+        session = Alts_code.Session(4, 2, seed=seed, match_building='matching')
+        for robin in range(3):
+            pairings = set()
+            for i in range(3):
+                for match in session.advance():
+                    pairing = frozenset(team.team_number for team in match.teams)
+                    assert pairing not in pairings, (seed, robin, i)
+                    pairings.add(pairing)
+            assert pairings == every_pairing
@@ -0,0 +1,65 @@
+import random
+
+import Alts_code
+
+'''
+Checks that repair_sides fills the place of a removed team, and picks the place for an added team, in the way make_match
+would: avoiding rematches and teams already played before going by priority.
+Run with python -m pytest.
+'''
+
+
+# makes teams with no games played, where the given teams have a lower priority the further they are down the list
+def make_teams(num_teams, num_sim_matches, lowest_priority=()):
+    store = Alts_code.TeamStore(num_sim_matches, capacity=num_teams, rng=random.Random(0))
+    team_list = [Alts_code.Team(i + 1, store) for i in range(num_teams)]
+    for games, team_number in enumerate(lowest_priority):
+        team_list[team_number - 1].consecutive_games = games + 1
+    return team_list
+
+
+# marks two teams as having played each other since the last reset
+def set_played(team, other):
+    store = team.store
+    store.played_epoch[team.slot, other.slot] = store.played_epoch[other.slot, team.slot] = store.epoch
+
+
+def team_numbers(sides):
+    return [[team.team_number for team in match.teams] for match in sides]
+
+
+'''
+A removed team is replaced by the highest priority team not playing, unless that would be a rematch or a repeat for its
+opponent.
+'''
+def test_removed_team_avoids_repeats():
+    team_list = make_teams(6, 2, lowest_priority=[5, 6])
+    sides = [Alts_code.Match(team_list[0], team_list[1]), Alts_code.Match(team_list[2], team_list[3])]
+    assert team_numbers(Alts_code.repair_sides(team_list, sides, removed_team=team_list[1])) == [[1, 5], [3, 4]]
+
+    team_list[0].last_team_played = 5
+    assert team_numbers(Alts_code.repair_sides(team_list, sides, removed_team=team_list[1])) == [[1, 6], [3, 4]]
+    set_played(team_list[0], team_list[5])
+    team_list[0].last_team_played = 0
+    assert team_numbers(Alts_code.repair_sides(team_list, sides, removed_team=team_list[1])) == [[1, 5], [3, 4]]
+
+
+'''
+An added team takes the place of the lowest priority team playing, unless that would be a rematch or a repeat with the
+team's opponent, and doesn't take the place of a team with a higher priority than it.
+'''
+def test_added_team_avoids_repeats():
+    team_list = make_teams(5, 2, lowest_priority=[1, 2, 3, 4])
+    sides = [Alts_code.Match(team_list[0], team_list[1]), Alts_code.Match(team_list[2], team_list[3])]
+    added_team = team_list[4]
+    assert team_numbers(Alts_code.repair_sides(team_list, sides, added_team=added_team)) == [[1, 2], [3, 5]]
+
+    added_team.last_team_played = 3
+    assert team_numbers(Alts_code.repair_sides(team_list, sides, added_team=added_team)) == [[1, 2], [5, 4]]
+    added_team.last_team_played = 0
+    set_played(added_team, team_list[2])
+    set_played(added_team, team_list[3])
+    assert team_numbers(Alts_code.repair_sides(team_list, sides, added_team=added_team)) == [[1, 5], [3, 4]]
+
+    added_team.consecutive_games = 5
+    assert team_numbers(Alts_code.repair_sides(team_list, sides, added_team=added_team)) == [[1, 2], [3, 4]]
@@ -0,0 +1,199 @@
+import argparse
+import json
+import math
+import random
+import time
+import numpy
+
+import Alts_code
+import simulate
+
+'''
+Searches for the weights of the priority terms make_match ranks the teams by (Alts_code.priority_terms), by simulating
+sessions with each set of weights and comparing how fair they were against how long the rounds took to make.
+
+Every set of weights (a candidate) is played through the same sessions: a few groups of realistic team and pad counts
+(scenarios), each with teams being added and removed part way through. All of the sessions of every candidate in a
+generation are run as one batch across a pool of processes (see simulate.run_batch).
+The first generation is the default weights plus random ones, and each generation after that tries variations on
+the candidates on the Pareto front so far.
+
+Each candidate gets 2 scores, where lower is better:
+unfairness: the mean of each fairness statistic (side_std, games_spread, max_on, max_off and repeat_pairings) relative
+            to the default weights, so the default weights score 1 and a candidate scoring 0.9 is 10% fairer on average
+latency: the 90th percentile of the time taken to make a round, in milliseconds
+A candidate is on the Pareto front if no other candidate is at least as good at both and better at one.
+'''
+
+# the team and pad counts the candidates are tested on, as (min, max) pairs
+scenarios = {
+    'small': {'teams': (8, 14), 'sides': (2, 2)},
+    'typical': {'teams': (15, 25), 'sides': (2, 3)},
+    'large': {'teams': (30, 60), 'sides': (4, 6)},
+}
+fairness_keys = ['side_std', 'games_spread', 'max_on', 'max_off', 'repeat_pairings']
+# range of the random weights (before being scaled so the biggest is 1), and the chance of a term being left out
+weight_range = (0.01, 100.0)
+zero_chance = 0.25
+
+
+'''
+Makes a random set of weights. Each weight is picked on a log scale, so that small and large ratios between the terms
+are just as likely, and then the weights are scaled so that the biggest is 1.
+'''
+def random_weights(rng):
+    while True:
+        weights = {}
+        for term in Alts_code.priority_terms:
+            if rng.random() >= zero_chance:
+                weights[term] = math.exp(rng.uniform(math.log(weight_range[0]), math.log(weight_range[1])))
+        if weights:
+            return normalise_weights(weights)
+
+
+# makes a variation on a set of weights, by multiplying each one by a random factor (and sometimes adding or removing a term)
+def vary_weights(rng, weights, spread=0.5):
+    varied = {}
+    for term in Alts_code.priority_terms:
+        weight = weights.get(term, 0)
+        if weight == 0:
+            if rng.random() < zero_chance / 2:
+                varied[term] = math.exp(rng.uniform(math.log(weight_range[0]), 0))
+        elif rng.random() >= zero_chance / 4:
+            varied[term] = weight * math.exp(rng.gauss(0, spread))
+    return normalise_weights(varied or dict(weights))
+
+
+# scales the weights so that the biggest is 1, rounded to 3 significant figures so that they're easy to read and copy.
+# The rounding is relative, so tiny weights are kept as they are, which the default weights need to keep ranking the terms
+# one after another (their smallest weight is about 1e-12 of the biggest)
+def normalise_weights(weights):
+    biggest = max(weights.values())
+    return {term: float('%.3g' % (weight / biggest)) for term, weight in weights.items() if weight > 0}
+
+
+# returns the configs of the sessions every candidate is played through, which are the same for every candidate
+def make_scenario_configs(runs, rounds, events, seed, match_building):
+    configs = []
+    for i, (name, scenario) in enumerate(scenarios.items()):
+        for config in simulate.make_configs(runs, scenario['teams'], scenario['sides'], rounds, events, seed + i,
+                                            match_building=match_building):
+            config['scenario'] = name
+            configs.append(config)
+    return configs
+
+
+# plays every candidate through the sessions in one batch, returning the results of each candidate
+def run_candidates(candidates, configs, processes):
+    batch = []
+    for weights in candidates:
+        for config in configs:
+            config = dict(config)
+            config['priority_weights'] = weights
+            batch.append(config)
+    results = simulate.run_batch(batch, processes)
+    return [results[i * len(configs):(i + 1) * len(configs)] for i in range(len(candidates))]
+
+
+# works out the fairness statistics and latency of a candidate's sessions, overall and for each scenario
+def score_results(weights, results):
+    score = {'weights': weights, 'fairness': {}, 'scenarios': {}}
+    for key in fairness_keys:
+        score['fairness'][key] = float(numpy.mean([result[key] for result in results]))
+    for name in scenarios:
+        scenario_results = [result for result in results if result['config']['scenario'] == name]
+        score['scenarios'][name] = {key: float(numpy.mean([result[key] for result in scenario_results])) for key in fairness_keys}
+    round_times = numpy.array([round_time for result in results for round_time in result['round_times']]) * 1000
+    score['latency_ms'] = {'p50': float(numpy.percentile(round_times, 50)), 'p90': float(numpy.percentile(round_times, 90))}
+    score['latency'] = score['latency_ms']['p90']
+    return score
+
+
+# scores each candidate's fairness relative to the baseline (the default weights); 1 is added to each statistic so that
+# a statistic which is 0 for the baseline (like repeat_pairings often is) doesn't divide by 0
+def add_unfairness(scores, baseline):
+    for score in scores:
+        score['unfairness'] = float(numpy.mean([(score['fairness'][key] + 1) / (baseline['fairness'][key] + 1) for key in fairness_keys]))
+
+
+# returns the scores which aren't beaten on both unfairness and latency by any other score, sorted by unfairness
+def pareto_front(scores):
+    front = []
+    for score in scores:
+        dominated = any(other['unfairness'] <= score['unfairness'] and other['latency'] <= score['latency'] and
+                        (other['unfairness'] < score['unfairness'] or other['latency'] < score['latency']) for other in scores)
+        if not dominated:
+            front.append(score)
+    return sorted(front, key=lambda score: score['unfairness'])
+
+
+'''
+Runs the search, returning the scores of every candidate tried and the Pareto front
+candidates: number of candidates in each generation, and generations: number of generations
+runs: number of sessions played by each candidate for each scenario
+'''
+def tune(candidates=16, generations=3, runs=20, rounds=30, events=2, seed=0, processes=None, match_building='matching'):
+    rng = random.Random(seed)
+    configs = make_scenario_configs(runs, rounds, events, seed, match_building)
+    default_weights = dict(Alts_code.default_priority_weights)
+
+    scores = []
+    generation = [default_weights] + [random_weights(rng) for i in range(candidates - 1)]
+    for generation_number in range(generations):
+        start_time = time.perf_counter()
+        for weights, results in zip(generation, run_candidates(generation, configs, processes)):
+            score = score_results(weights, results)
+            score['generation'] = generation_number
+            scores.append(score)
+        add_unfairness(scores, scores[0])
+        front = pareto_front(scores)
+        print('Generation ' + str(generation_number + 1) + ': ' + str(len(generation)) + ' candidates in ' +
+              str(round(time.perf_counter() - start_time, 1)) + 's, best unfairness ' + str(round(front[0]['unfairness'], 4)))
+
+        # the next generation is made of variations on the candidates on the front, getting closer to them each time
+        tried = [score['weights'] for score in scores]
+        generation = []
+        while len(generation) < candidates:
+            weights = vary_weights(rng, rng.choice(front)['weights'], spread=0.5 / (generation_number + 1))
+            if weights not in tried and weights not in generation:
+                generation.append(weights)
+    return scores, pareto_front(scores)
+
+
+def format_weights(weights):
+    return ', '.join(term + ' ' + ('%.3g' % weight) for term, weight in weights.items())
+
+
+def print_front(front):
+    print('Pareto front (unfairness relative to the default weights, round latency in ms):')
+    for score in front:
+        print('unfairness ' + str(round(score['unfairness'], 4)) + ' p90 ' + str(round(score['latency_ms']['p90'], 3)) +
+              ' p50 ' + str(round(score['latency_ms']['p50'], 3)) + ' | ' +
+              ' '.join(key + ' ' + str(round(value, 3)) for key, value in score['fairness'].items()) +
+              ' | ' + format_weights(score['weights']))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Searches for the weights of make_match's priority terms, reporting the Pareto front of fairness against latency.")
+    parser.add_argument('--candidates', type=int, default=16, help='number of sets of weights tried in each generation')
+    parser.add_argument('--generations', type=int, default=3, help='number of generations')
+    parser.add_argument('--runs', type=int, default=20, help='number of sessions each candidate plays for each scenario')
+    parser.add_argument('--rounds', type=int, default=30, help='number of rounds per session')
+    parser.add_argument('--events', type=int, default=2, help='number of add/remove events per session')
+    parser.add_argument('--seed', type=int, default=0, help='seed for the sessions and the search')
+    parser.add_argument('--match-building', choices=['matching', 'greedy'], default='matching', help='how make_match pairs up the teams')
+    parser.add_argument('--processes', type=int, default=None, help='number of worker processes (defaults to the number of CPUs)')
+    parser.add_argument('--json', help='file to write the scores of every candidate and the Pareto front to as JSON')
+    args = parser.parse_args()
+
+    scores, front = tune(args.candidates, args.generations, args.runs, args.rounds, args.events, args.seed, args.processes, args.match_building)
+    print_front(front)
+    print('To use a set of weights, set Alts_code.priority_weights to it, e.g.', front[0]['weights'])
+
+    if args.json:
+        with open(args.json, 'w') as file:
+            json.dump({'scenarios': scenarios, 'candidates': scores, 'pareto_front': front}, file, indent=2)
+
+
+if __name__ == '__main__':
+    main()